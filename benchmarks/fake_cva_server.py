@@ -0,0 +1,393 @@
+"""
+A local stand-in for the CVA REST API serving synthetic paginated cases, variants and report events.
+It implements the pagination protocol of CVA (ie: `limit` and `marker` parameters and the
+`X-Pagination-Limit` and `X-Pagination-Marker` headers) with configurable payload size and latency.
+
+Run it standalone with:
+
+    python benchmarks/fake_cva_server.py --port 8090 --variants 100000 --latency 0.05
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from future.standard_library import install_aliases
+install_aliases()
+import http.server
+import socketserver
+import urllib.parse
+
+
+ENDPOINT_BASE = "/cva/api/0/"
+ASSEMBLY = "GRCh38"
+CHROMOSOMES = [str(c) for c in range(1, 23)] + ["X", "Y"]
+PROGRAMS = ["rare_disease", "cancer"]
+TIERS = ["TIER1", "TIER2", "TIER3"]
+PANELS = ["Intellectual disability", "Cardiomyopathy", "Familial breast cancer", "Epilepsy", "Hearing loss"]
+BASES = ["A", "C", "G", "T"]
+
+
+def variant_id(index):
+    chromosome = CHROMOSOMES[index % len(CHROMOSOMES)]
+    position = 10000 + index * 7
+    reference = BASES[index % 4]
+    alternate = BASES[(index + 1) % 4]
+    return "{}:{}:{}:{}:{}".format(ASSEMBLY, chromosome, position, reference, alternate)
+
+
+def build_variant(index, padding=0):
+    identifier = variant_id(index)
+    assembly, chromosome, position, reference, alternate = identifier.split(":")
+    representation = {
+        'assembly': assembly,
+        'smallVariantCoordinates': {
+            'assembly': assembly, 'chromosome': chromosome, 'position': int(position),
+            'reference': reference, 'alternate': alternate
+        },
+        'annotation': {
+            'chromosome': chromosome, 'start': int(position), 'reference': reference, 'alternate': alternate,
+            'id': identifier, 'populationFrequencies': [
+                {'study': 'GNOMAD_GENOMES', 'population': 'ALL', 'refAllele': reference, 'altAllele': alternate,
+                 'refAlleleFreq': 0.99, 'altAlleleFreq': 0.01}]
+        }
+    }
+    if padding:
+        representation['annotation']['padding'] = "x" * padding
+    return {'id': identifier, 'variants': [representation]}
+
+
+def build_case(index, padding=0):
+    case = {
+        'identifier': str(1000 + index),
+        'version': 1 + index % 2,
+        'program': PROGRAMS[index % len(PROGRAMS)],
+        'assembly': ASSEMBLY,
+        'creationDate': "2019-01-{:02d}T00:00:00".format(1 + index % 28),
+        'lastModifiedDate': "2019-02-{:02d}T00:00:00".format(1 + index % 28),
+        'countTiered': index % 300,
+        'reportEventsAnalysisPanels': [{'panelName': PANELS[index % len(PANELS)], 'panelVersion': "1.0"}],
+        'probandDisorders': [{'diseaseGroup': "group {}".format(index % 7),
+                              'specificDisease': "disease {}".format(index % 31)}],
+        'allVariants': [variant_id(index * 3 + i) for i in range(3)],
+        'genes': ["GENE{}".format(index % 500)]
+    }
+    if padding:
+        case['padding'] = "x" * padding
+    return case
+
+
+def build_report_event(index, padding=0):
+    variant = build_variant(index // 2, padding=padding)
+    return {
+        'id': "re-{}".format(index),
+        'version': 1,
+        'reportModelVersion': "6.0.0",
+        'caseId': str(1000 + index % 1000),
+        'caseVersion': 1,
+        'groupId': "group",
+        'cohortId': "cohort",
+        'date': "2019-01-01",
+        'author': "tiering",
+        'type': "genomics_england_tiering",
+        'program': PROGRAMS[index % len(PROGRAMS)],
+        'validated': False,
+        'workspace': [],
+        'variantId': variant['id'],
+        'reportEvent': {'tier': TIERS[index % len(TIERS)], 'modeOfInheritance': "monoallelic",
+                        'genePanel': {'panelName': PANELS[index % len(PANELS)]}},
+        'observedVariants': [{'date': "2019-01-01", 'assembly': ASSEMBLY, 'variant': variant, 'validated': False,
+                              'additionalProperties': []}],
+        'comments': [],
+        'additionalProperties': []
+    }
+
+
+BUILDERS = {
+    'cases': build_case,
+    'variants': build_variant,
+    'report-events': build_report_event
+}
+
+
+class FakeCvaServer(object):
+    """
+    Serves synthetic entities on a background thread.
+
+    :param sizes: the number of entities per endpoint, eg: {'cases': 1000, 'variants': 10000}
+    :param page_size: the page size when the client does not send a `limit`
+    :param latency: seconds slept before answering every request
+    :param padding: extra bytes added to every entity to simulate larger payloads
+    :param http2: serves cleartext HTTP/2 with prior knowledge instead of HTTP/1.1, it requires the h2 package
+    """
+
+    def __init__(self, sizes=None, page_size=100, latency=0.0, padding=0, host="127.0.0.1", port=0, http2=False):
+        self.sizes = dict((k, 1000) for k in BUILDERS)
+        if sizes:
+            self.sizes.update(sizes)
+        self.page_size = page_size
+        self.latency = latency
+        self.padding = padding
+        self.requests = 0
+        self._lock = threading.Lock()
+        if http2:
+            self._server = _ThreadingH2Server((host, port), self)
+        else:
+            self._server = _ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def page(self, entity, params):
+        """
+        :return: the results in the page and the headers for the next page if any
+        :rtype: tuple
+        """
+        total = self.sizes[entity]
+        limit = int(params.get('limit', self.page_size))
+        start = int(params.get('marker', 0))
+        end = min(start + limit, total)
+        results = [BUILDERS[entity](i, padding=self.padding) for i in range(start, end)]
+        include = params.get('include', [])
+        if include and "__all" not in include:
+            results = [dict((k, v) for k, v in r.items() if k in include) for r in results]
+        headers = {}
+        if end < total:
+            headers = {'X-Pagination-Marker': str(end), 'X-Pagination-Limit': str(limit)}
+        return results, headers
+
+    def handle(self, method, path, payload=None):
+        """
+        Answers a request to the fake CVA
+
+        :param method: GET or POST
+        :param path: the path including the query string
+        :param payload: the decoded JSON payload of a POST
+        :return: the status, the headers and the body of the response
+        :rtype: tuple
+        """
+        self._count_request()
+        if self.latency:
+            time.sleep(self.latency)
+        if method == "GET":
+            results, headers, status = self._get(path)
+        else:
+            results, headers, status = self._post(path, payload)
+        body = json.dumps({'time': int(self.latency * 1000), 'response': [{'result': results}]}).encode("utf-8")
+        return status, headers, body
+
+    def _get(self, path):
+        parsed = urllib.parse.urlparse(path)
+        path = parsed.path[len(ENDPOINT_BASE):] if parsed.path.startswith(ENDPOINT_BASE) else None
+        params = dict((k, v if len(v) > 1 or k == 'include' else v[0])
+                      for k, v in urllib.parse.parse_qs(parsed.query).items())
+        if path in BUILDERS:
+            if params.get('count', 'False').lower() == 'true':
+                return [self.sizes[path]], {}, 200
+            results, headers = self.page(path, params)
+            return results, headers, 200
+        elif path == "cases/summary":
+            return [{'countCases': self.sizes['cases'], 'filters': params}], {}, 200
+        elif path is not None and path.startswith("variants/"):
+            index = _variant_index(urllib.parse.unquote(path[len("variants/"):]))
+            if index is not None and index < self.sizes['variants']:
+                return [build_variant(index, padding=self.padding)], {}, 200
+        return [], {}, 404
+
+    def _post(self, path, payload):
+        path = urllib.parse.urlparse(path).path[len(ENDPOINT_BASE):]
+        if path == "authentication":
+            return [{'token': "fake-token"}], {}, 200
+        elif path == "report-events/variant-summary-by-ids":
+            return [{'variantId': v, 'countCasesClassifiedByAcmg': 0} for v in payload], {}, 200
+        elif path == "lift-overs":
+            # shifts positions by a fixed offset into the other assembly
+            return [dict(c, assembly="GRCh37" if c['assembly'] == ASSEMBLY else ASSEMBLY,
+                         position=c['position'] + 1000) for c in payload['variants']], {}, 200
+        elif path == "variants/identifiers-from-small-variant-coordinates":
+            return ["{assembly}:{chromosome}:{position}:{reference}:{alternate}".format(**c)
+                    for c in payload], {}, 200
+        return [], {}, 404
+
+    def _handler(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._reply(*fake.handle("GET", self.path))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+                self._reply(*fake.handle("POST", self.path, payload))
+
+            def _reply(self, status, headers, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class _H2Handler(socketserver.BaseRequestHandler):
+    """
+    Serves a connection in cleartext HTTP/2 with prior knowledge, every stream is answered on its own thread so
+    that concurrent requests are multiplexed over the connection.
+    """
+
+    def setup(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+        self._events = h2.events
+        self._connection = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        # guards the connection state and the socket, it is notified when the flow control windows grow
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def handle(self):
+        streams = {}
+        with self._condition:
+            self._connection.initiate_connection()
+            self._flush()
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+                with self._condition:
+                    events = self._connection.receive_data(data)
+                    for event in events:
+                        if isinstance(event, self._events.RequestReceived):
+                            streams[event.stream_id] = (dict(event.headers), [])
+                        elif isinstance(event, self._events.DataReceived):
+                            streams[event.stream_id][1].append(event.data)
+                            self._connection.acknowledge_received_data(
+                                event.flow_controlled_length, event.stream_id)
+                        elif isinstance(event, self._events.StreamEnded):
+                            headers, body = streams.pop(event.stream_id)
+                            thread = threading.Thread(target=self._respond, args=(event.stream_id, headers, body))
+                            thread.daemon = True
+                            thread.start()
+                        elif isinstance(event, self._events.ConnectionTerminated):
+                            return
+                    self._flush()
+                    self._condition.notify_all()
+        finally:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+
+    def _respond(self, stream_id, headers, body):
+        payload = json.loads(b"".join(body).decode("utf-8")) if body else None
+        status, response_headers, content = self.server.fake.handle(headers[':method'], headers[':path'], payload)
+        with self._condition:
+            self._connection.send_headers(stream_id, [
+                (':status', str(status)), ('content-type', "application/json"),
+                ('content-length', str(len(content)))] + [(k.lower(), v) for k, v in response_headers.items()])
+            self._flush()
+            while content:
+                window = min(self._connection.local_flow_control_window(stream_id),
+                             self._connection.max_outbound_frame_size)
+                if window <= 0:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+                    continue
+                self._connection.send_data(stream_id, content[:window])
+                content = content[window:]
+                self._flush()
+            self._connection.end_stream(stream_id)
+            self._flush()
+
+    def _flush(self):
+        data = self._connection.data_to_send()
+        if data:
+            self.request.sendall(data)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingH2Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fake):
+        self.fake = fake
+        socketserver.TCPServer.__init__(self, address, _H2Handler)
+
+
+_VARIANT_ID = re.compile(r'^GRCh38:([0-9XY]+):([0-9]+):[ACGT]:[ACGT]$')
+
+
+def _variant_index(identifier):
+    match = _VARIANT_ID.match(identifier)
+    if not match:
+        return None
+    index = (int(match.group(2)) - 10000) // 7
+    return index if variant_id(index) == identifier else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the CVA REST API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--cases", type=int, default=1000)
+    parser.add_argument("--variants", type=int, default=1000)
+    parser.add_argument("--report-events", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of latency per request")
+    parser.add_argument("--padding", type=int, default=0, help="extra bytes per entity")
+    parser.add_argument("--http2", action="store_true", help="serves cleartext HTTP/2 with prior knowledge")
+    args = parser.parse_args()
+    server = FakeCvaServer(
+        sizes={'cases': args.cases, 'variants': args.variants, 'report-events': args.report_events},
+        page_size=args.page_size, latency=args.latency, padding=args.padding, host=args.host, port=args.port,
+        http2=args.http2)
+    print("Serving a fake CVA at {}".format(server.url))
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Reproducible performance benchmarks of pyark against a local fake CVA server.
+
+    python benchmarks/run_benchmarks.py                       # runs and prints the results
+    python benchmarks/run_benchmarks.py --save-baseline       # stores the results as the baseline
+    python benchmarks/run_benchmarks.py --compare             # fails if any result regresses over the baseline
+
+Every benchmark reports a set of measures, those ending in `_per_second` are better when higher and the rest
+(ie: seconds and bytes) are better when lower.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from fake_cva_server import FakeCvaServer, variant_id
+import pyark.dtypes as dtypes
+from pyark.cva_client import CvaClient
+from pyark.metrics import MetricsRegistry
+from pyark.page_sizing import AdaptivePageSize
+from pyark.transports import Http2Transport, RequestsTransport
+
+try:
+    import h2
+    import httpx
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+try:
+    import polars
+    POLARS = True
+except ImportError:
+    POLARS = False
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def _response_bytes(registry):
+    return sum(m['value'] for m in registry.dump().get("pyark_response_bytes_total", []))
+
+
+def _measure_pagination(cva, registry, fetch):
+    registry.reset()
+    start = timeit.default_timer()
+    count = 0
+    for _ in fetch(cva):
+        count += 1
+    elapsed = timeit.default_timer() - start
+    return {
+        'seconds': elapsed,
+        'items_per_second': count / elapsed,
+        'mb_per_second': _response_bytes(registry) / 1024.0 / 1024.0 / elapsed
+    }
+
+
+@benchmark
+def pagination_cases(cva, registry, config):
+    return _measure_pagination(cva, registry, lambda c: c.cases().get_cases(limit=config.page_size))
+
+
+@benchmark
+def pagination_cases_ids(cva, registry, config):
+    return _measure_pagination(cva, registry, lambda c: c.cases().get_cases_ids(limit=config.page_size))
+
+
+@benchmark
+def pagination_cases_ids_adaptive(cva, registry, config):
+    return _measure_pagination(
+        cva, registry, lambda c: c.cases().get_cases_ids(page_size=AdaptivePageSize(target_seconds=0.5)))
+
+
+@benchmark
+def pagination_variants(cva, registry, config):
+    return _measure_pagination(cva, registry, lambda c: c.variants().get_variants(limit=config.page_size))
+
+
+@benchmark
+def pagination_report_events(cva, registry, config):
+    return _measure_pagination(
+        cva, registry, lambda c: c.report_events().get_report_events(limit=config.page_size))
+
+
+@benchmark
+def parallel_variant_lookups(cva, registry, config):
+    identifiers = [variant_id(i) for i in range(config.lookups)]
+    start = timeit.default_timer()
+    variants = cva.variants().get_variants_by_id(identifiers)
+    elapsed = timeit.default_timer() - start
+    assert len(variants) == len(identifiers)
+    return {'seconds': elapsed, 'lookups_per_second': len(identifiers) / elapsed}
+
+
+@benchmark
+def chunked_variant_summaries(cva, registry, config):
+    # a batch query far larger than a chunk, posted in concurrent chunks
+    identifiers = [variant_id(i) for i in range(config.lookups * 100)]
+    start = timeit.default_timer()
+    summaries = cva.report_events().get_variant_summary_by_ids(identifiers)
+    elapsed = timeit.default_timer() - start
+    assert [s['variantId'] for s in summaries] == identifiers
+    return {'seconds': elapsed, 'summaries_per_second': len(identifiers) / elapsed}
+
+
+def _measure_threaded_lookups(registry, config, transport, http2):
+    identifiers = [variant_id(i) for i in range(config.lookups)]
+    with FakeCvaServer(sizes={'variants': config.entities}, latency=config.latency, http2=http2) as server:
+        variants_client = CvaClient(server.url, token="benchmark", threads=config.threads, metrics_registry=registry,
+                                    transport=transport).variants()
+        start = timeit.default_timer()
+        variants = variants_client.run_threaded_requests(variants_client.get_variant_by_id, identifiers,
+                                                         threads=config.threads)
+        elapsed = timeit.default_timer() - start
+    assert len(variants) == len(identifiers)
+    return {'seconds': elapsed, 'lookups_per_second': len(identifiers) / elapsed}
+
+
+@benchmark
+def threaded_variant_lookups_http1(cva, registry, config):
+    # a connection per thread
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=config.threads))
+    try:
+        return _measure_threaded_lookups(registry, config, RequestsTransport(session), http2=False)
+    finally:
+        session.close()
+
+
+@benchmark
+def threaded_variant_lookups_http2(cva, registry, config):
+    # all threads multiplexed over a single connection
+    if not HTTP2:
+        logging.warning("Skipping HTTP/2 benchmark, do 'pip install httpx[http2]'")
+        return {}
+    transport = Http2Transport(max_connections=1, prior_knowledge=True)
+    try:
+        return _measure_threaded_lookups(registry, config, transport, http2=True)
+    finally:
+        transport.close()
+
+
+def _measure_data_frame(fetch, concat):
+    gc.collect()
+    tracemalloc.start()
+    start = timeit.default_timer()
+    df = concat(fetch())
+    elapsed = timeit.default_timer() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': elapsed,
+        'rows_per_second': df.shape[0] / elapsed,
+        'peak_memory_bytes': peak,
+        'data_frame_bytes': int(df.memory_usage(deep=True).sum())
+    }
+
+
+@benchmark
+def data_frame_report_events(cva, registry, config):
+    import pandas as pd
+    return _measure_data_frame(
+        lambda: cva.report_events().get_report_events(as_data_frame=True, limit=config.page_size), pd.concat)
+
+
+@benchmark
+def data_frame_report_events_dtypes(cva, registry, config):
+    return _measure_data_frame(
+        lambda: cva.report_events().get_report_events(as_data_frame=True, limit=config.page_size, dtypes=True),
+        dtypes.concat)
+
+
+@benchmark
+def data_frame_report_events_collect(cva, registry, config):
+    return _measure_data_frame(
+        lambda: cva.report_events().get_report_events(as_data_frame=True, limit=config.page_size),
+        lambda pages: pages.collect())
+
+
+@benchmark
+def tiers_by_panel_pandas(cva, registry, config):
+    import pandas as pd
+    start = timeit.default_timer()
+    df = pd.concat(cva.report_events().get_report_events(as_data_frame=True, limit=config.page_size))
+    counts = df.groupby(["reportEvent.genePanel.panelName", "reportEvent.tier"]).size()
+    elapsed = timeit.default_timer() - start
+    return {'seconds': elapsed, 'rows_per_second': counts.sum() / elapsed}
+
+
+@benchmark
+def tiers_by_panel_polars(cva, registry, config):
+    if not POLARS:
+        logging.warning("Skipping Polars benchmark, do 'pip install polars'")
+        return {}
+    start = timeit.default_timer()
+    df = cva.report_events().get_report_events(as_polars=True, limit=config.page_size)
+    report_event = polars.col("reportEvent")
+    counts = df.group_by(report_event.struct.field("genePanel").struct.field("panelName"),
+                         report_event.struct.field("tier")).len()
+    elapsed = timeit.default_timer() - start
+    return {'seconds': elapsed, 'rows_per_second': counts["len"].sum() / elapsed}
+
+
+def _time_python(code):
+    start = timeit.default_timer()
+    subprocess.check_call([sys.executable, "-W", "ignore", "-c", code], cwd=ROOT)
+    return timeit.default_timer() - start
+
+
+@benchmark
+def import_time(cva, registry, config):
+    # a short lived job that only counts cases should not pay for importing pandas nor the models
+    interpreter = _time_python("pass")
+    client = _time_python(
+        "from pyark.cva_client import CvaClient; "
+        "cva = CvaClient('http://localhost', token='t'); cva.cases(); cva.variants(); cva.report_events()")
+    models = _time_python("import pandas; import protocols.protocol_7_3.cva")
+    return {
+        'client_seconds': client - interpreter,
+        'pandas_and_models_seconds': models - interpreter
+    }
+
+
+def run(config):
+    sizes = {'cases': config.entities, 'variants': config.entities, 'report-events': config.entities}
+    results = {}
+    with FakeCvaServer(sizes=sizes, page_size=config.page_size, latency=config.latency,
+                       padding=config.padding) as server:
+        registry = MetricsRegistry()
+        cva = CvaClient(server.url, token="benchmark", threads=config.threads, metrics_registry=registry)
+        for func in BENCHMARKS:
+            if config.only and func.__name__ not in config.only:
+                continue
+            # keeps the best of every measure across repetitions to reduce noise
+            runs = [func(cva, registry, config) for _ in range(config.repeat)]
+            results[func.__name__] = dict(
+                (k, max(r[k] for r in runs) if k.endswith("_per_second") else min(r[k] for r in runs))
+                for k in runs[0])
+            logging.info("{}: {}".format(func.__name__, results[func.__name__]))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: the list of measures that regressed more than the tolerance over the baseline
+    :rtype: list
+    """
+    regressions = []
+    for name, measures in results.items():
+        for measure, value in measures.items():
+            reference = baseline.get(name, {}).get(measure)
+            if not reference:
+                continue
+            if measure.endswith("_per_second"):
+                regressed = value < reference * (1 - tolerance)
+            else:
+                regressed = value > reference * (1 + tolerance)
+            if regressed:
+                regressions.append("{}.{}: {:.4g} vs baseline {:.4g}".format(name, measure, value, reference))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the pyark benchmarks against a local fake CVA server")
+    parser.add_argument("--entities", type=int, default=5000, help="entities served per endpoint")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of server latency per request")
+    parser.add_argument("--padding", type=int, default=0, help="extra bytes per entity")
+    parser.add_argument("--lookups", type=int, default=200, help="number of variants fetched by id")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    config = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if config.compare and not config.save_baseline and not os.path.exists(config.baseline):
+        # baselines depend on the machine, they are saved locally and not committed
+        parser.error("No baseline at {}, save one first with --save-baseline".format(config.baseline))
+
+    results = run(config)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if config.save_baseline:
+        with open(config.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if config.compare:
+        with open(config.baseline) as f:
+            regressions = compare(results, json.load(f), config.tolerance)
+        for r in regressions:
+            print("REGRESSION {}".format(r))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ install_aliases()
 import urllib.error
 
 
-def wrapper(func, retries):
+def wrapper(func, retries, on_retry=None):
     """
     This wrapper implements a truncated binary exponential backoff algorithm between retries.
     (https://en.wikipedia.org/wiki/Exponential_backoff#Binary_exponential_backoff)
@@ -19,6 +19,7 @@ def wrapper(func, retries):
 
     :param func:       the wrapped function
     :param retries:    the maximum number of retries. -1 are infinite retries
+    :param on_retry:   an optional callback called with the arguments of the wrapped function before every retry
     :return:           the return of the wrapped function if any
     """
 
@@ -39,6 +40,8 @@ def wrapper(func, retries):
                 if retries != -1 and retries_count >= retries:
                     raise ex
                 retries_count += 1
+                if on_retry:
+                    on_retry(*args, **kwargs)
                 # waits for an increasing random time
                 random_sleep = random.randrange(0, min((2 ** backoff_iteration) - 1, 10))
                 logging.info("Retrying connection after %s seconds" % str(random_sleep))
@@ -0,0 +1,320 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+
+from pyark.cva_client import CvaClient
+
+
+class CaseStore(object):
+    """
+    A local snapshot of cases in an embedded SQLite database.
+    The snapshot is kept up to date with incremental syncs that only fetch the cases created or modified in CVA
+    since the last sync, readers query the snapshot without touching CVA.
+
+    :param path: the SQLite database file, use ":memory:" for a snapshot that is not persisted
+    :type path: str
+    """
+
+    _SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS cases (
+            identifier TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            program TEXT,
+            assembly TEXT,
+            last_modified TEXT,
+            document TEXT NOT NULL,
+            PRIMARY KEY (identifier, version))""",
+        """CREATE TABLE IF NOT EXISTS sync_state (
+            sync_key TEXT PRIMARY KEY,
+            watermark TEXT,
+            last_sync TEXT,
+            synced_cases INTEGER)"""
+    ]
+
+    def __init__(self, path=":memory:"):
+        self._path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            for statement in self._SCHEMA:
+                self._connection.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def sync(self, cases_client, watermark_field="lastModifiedDate", batch_size=1000, **params):
+        """
+        Fetches the cases created or modified since the last sync of the same query and upserts them.
+        The first sync of a query fetches all cases. The watermark is the greatest value of `watermark_field`
+        observed in the fetched cases, so it does not depend on the local clock. It is only persisted when the
+        sync completes, a failed sync can be safely run again.
+        NOTE: cases deleted in CVA are not removed from the snapshot.
+
+        :param cases_client: the client to fetch cases from
+        :type cases_client: pyark.subclients.cases_client.CasesClient
+        :param watermark_field: the case field holding the date of last modification
+        :type watermark_field: str
+        :param batch_size: number of cases written in every transaction
+        :type batch_size: int
+        :param params: any filter accepted by `get_cases`, each different query keeps its own watermark
+        :type params: dict
+        :return: the number of cases fetched
+        :rtype: int
+        """
+        sync_key = self._sync_key(params)
+        watermark = self.get_watermark(**params)
+        query = dict(params)
+        if watermark:
+            incremental_filter = "{} ge '{}'".format(watermark_field, watermark)
+            query['filter'] = "({}) and {}".format(params['filter'], incremental_filter) \
+                if params.get('filter') else incremental_filter
+        logging.info("Syncing cases {} since {}".format(sync_key, watermark))
+        cases = cases_client.get_cases(as_data_frame=False, include_all=True, **query)
+        count, new_watermark = self.add_cases(cases, watermark_field=watermark_field, batch_size=batch_size)
+        if watermark and (new_watermark is None or new_watermark < watermark):
+            new_watermark = watermark
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sync_state (sync_key, watermark, last_sync, synced_cases) VALUES (?, ?, ?, ?)",
+                (sync_key, new_watermark, datetime.datetime.utcnow().isoformat(), count))
+        logging.info("Synced {} cases, new watermark {}".format(count, new_watermark))
+        return count
+
+    def get_watermark(self, **params):
+        """
+        :return: the watermark of the last sync of this query or None if never synced
+        :rtype: str
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT watermark FROM sync_state WHERE sync_key = ?", (self._sync_key(params),)).fetchone()
+        return row[0] if row else None
+
+    def add_cases(self, cases, watermark_field="lastModifiedDate", batch_size=1000):
+        """
+        Upserts cases, eg: straight from the output of `get_cases`
+
+        :type cases: iterable
+        :type watermark_field: str
+        :type batch_size: int
+        :return: the number of cases written and the greatest value of the watermark field
+        :rtype: tuple
+        """
+        count = 0
+        watermark = None
+        batch = []
+        for case in cases:
+            last_modified = case.get(watermark_field)
+            if last_modified is not None and (watermark is None or str(last_modified) > watermark):
+                watermark = str(last_modified)
+            batch.append(self._to_row(case, last_modified))
+            if len(batch) >= batch_size:
+                count += self._write(batch)
+                batch = []
+        if batch:
+            count += self._write(batch)
+        return count, watermark
+
+    def get_case(self, identifier, version, as_data_frame=False):
+        """
+        :type identifier: str
+        :type version: int
+        :type as_data_frame: bool
+        :rtype: dict | pd.DataFrame
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT document FROM cases WHERE identifier = ? AND version = ?",
+                (str(identifier), int(version))).fetchone()
+        if row is None:
+            return None
+        return CvaClient._render(json.loads(row[0]), as_data_frame=as_data_frame)
+
+    def get_cases(self, as_data_frame=False):
+        """
+        :type as_data_frame: bool
+        :rtype: list | pd.DataFrame
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT document FROM cases ORDER BY identifier, version").fetchall()
+        return CvaClient._render([json.loads(r[0]) for r in rows], as_data_frame=as_data_frame)
+
+    def count(self):
+        """
+        :rtype: int
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+
+    def to_index(self):
+        """
+        :return: an in memory index of all cases in the snapshot
+        :rtype: CaseIndex
+        """
+        return CaseIndex(self.get_cases())
+
+    def _write(self, rows):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO cases (identifier, version, program, assembly, last_modified, document) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    @staticmethod
+    def _to_row(case, last_modified):
+        return (str(case['identifier']), int(case['version']), case.get('program'), case.get('assembly'),
+                str(last_modified) if last_modified is not None else None, json.dumps(case))
+
+    @staticmethod
+    def _sync_key(params):
+        return json.dumps(params, sort_keys=True, default=str)
+
+
+class CaseIndex(object):
+    """
+    An in memory collection of cases with secondary indexes for offline lookups and filtering.
+    Lookups by identifier and version and filtered scans are resolved with hash lookups and set intersections,
+    no case is scanned. Build it from paginated results or from a CaseStore snapshot, eg:
+
+        index = CaseIndex(cases_client.get_cases(program=Program.rare_disease))
+        index.find(panel_name="Intellectual disability", assembly="GRCh38", as_data_frame=True)
+
+    Panel names are indexed from both `reportEventsAnalysisPanels` and `pedigreeAnalysisPanels` and disorders
+    from the specific disease, disease group and disease subgroup of `probandDisorders`.
+
+    :param cases: any iterable of cases as returned by `get_cases(as_data_frame=False)`
+    :type cases: iterable
+    """
+
+    PROGRAM = 'program'
+    ASSEMBLY = 'assembly'
+    PANEL_NAME = 'panel_name'
+    DISORDER = 'disorder'
+
+    def __init__(self, cases=None):
+        self._cases = []
+        self._positions = {}
+        self._indexes = dict((name, {}) for name in [self.PROGRAM, self.ASSEMBLY, self.PANEL_NAME, self.DISORDER])
+        if cases is not None:
+            self.extend(cases)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, key):
+        return (str(key[0]), int(key[1])) in self._positions
+
+    def extend(self, cases):
+        """
+        :type cases: iterable
+        """
+        for case in cases:
+            self.add(case)
+
+    def add(self, case):
+        """
+        Adds a case replacing any previous case with the same identifier and version
+
+        :type case: dict
+        """
+        key = (str(case['identifier']), int(case['version']))
+        position = self._positions.get(key)
+        if position is None:
+            position = len(self._cases)
+            self._cases.append(case)
+            self._positions[key] = position
+        else:
+            self._unindex(position, self._cases[position])
+            self._cases[position] = case
+        for name, values in self._index_values(case).items():
+            index = self._indexes[name]
+            for value in values:
+                index.setdefault(value, set()).add(position)
+
+    def get_case(self, identifier, version, as_data_frame=False):
+        """
+        :type identifier: str
+        :type version: int
+        :type as_data_frame: bool
+        :rtype: dict | pd.DataFrame
+        """
+        position = self._positions.get((str(identifier), int(version)))
+        if position is None:
+            return None
+        return CvaClient._render(self._cases[position], as_data_frame=as_data_frame)
+
+    def find(self, program=None, assembly=None, panel_name=None, disorder=None, as_data_frame=False):
+        """
+        Returns the cases matching all the given filters, every filter accepts a single value or a list of
+        alternative values.
+
+        :type program: str | list
+        :type assembly: str | list
+        :type panel_name: str | list
+        :type disorder: str | list
+        :type as_data_frame: bool
+        :rtype: list | pd.DataFrame
+        """
+        filters = [(self.PROGRAM, program), (self.ASSEMBLY, assembly), (self.PANEL_NAME, panel_name),
+                   (self.DISORDER, disorder)]
+        matches = None
+        # intersects from the most selective filter to keep intermediate sets small
+        for positions in sorted([self._lookup(name, values) for name, values in filters if values is not None],
+                                key=len):
+            matches = positions if matches is None else matches.intersection(positions)
+            if not matches:
+                break
+        if matches is None:
+            matches = self._positions.values()
+        return CvaClient._render([self._cases[p] for p in sorted(matches)], as_data_frame=as_data_frame)
+
+    def values(self, name):
+        """
+        :param name: one of program, assembly, panel_name or disorder
+        :type name: str
+        :return: the distinct values indexed and their number of cases
+        :rtype: dict
+        """
+        return dict((value, len(positions)) for value, positions in self._indexes[name].items() if positions)
+
+    def _lookup(self, name, values):
+        index = self._indexes[name]
+        if not isinstance(values, (list, tuple, set)):
+            return index.get(values, set())
+        positions = set()
+        for value in values:
+            positions.update(index.get(value, ()))
+        return positions
+
+    def _unindex(self, position, case):
+        for name, values in self._index_values(case).items():
+            index = self._indexes[name]
+            for value in values:
+                index.get(value, set()).discard(position)
+
+    @staticmethod
+    def _index_values(case):
+        panels = set()
+        for panel in (case.get('reportEventsAnalysisPanels') or []) + (case.get('pedigreeAnalysisPanels') or []):
+            if panel.get('panelName'):
+                panels.add(panel['panelName'])
+        disorders = set()
+        for disorder in case.get('probandDisorders') or []:
+            for field in ('specificDisease', 'diseaseGroup', 'diseaseSubGroup'):
+                if disorder.get(field):
+                    disorders.add(disorder[field])
+        return {
+            CaseIndex.PROGRAM: [case['program']] if case.get('program') else [],
+            CaseIndex.ASSEMBLY: [case['assembly']] if case.get('assembly') else [],
+            CaseIndex.PANEL_NAME: panels,
+            CaseIndex.DISORDER: disorders
+        }
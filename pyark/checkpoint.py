@@ -0,0 +1,198 @@
+import datetime
+import io
+import json
+import logging
+import os
+
+from pyark.errors import CvaClientError
+
+
+class PaginationCheckpoint(object):
+    """
+    Persists the pagination state of a long scan so that a later run continues from the last page reached.
+    Pass it to any paginated query as `checkpoint`, eg: `cases_client.get_cases(checkpoint=checkpoint)`.
+    The state (ie: the `limit` and `marker` of the next page and the number of items emitted) is saved every
+    time a page has been fully consumed, the items of a page that was partially consumed are emitted again on
+    resume. A checkpoint belongs to a single query, resuming it with a different query raises an error.
+    When an output file is bound its position is saved with the state so that `export_to_file` can drop any
+    partially written page on resume.
+
+    :param path: the file holding the state, it is replaced atomically on every save
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._query = None
+        self._output = None
+        self.state = self.load()
+
+    def load(self):
+        """
+        :return: the persisted state or None if there is none
+        :rtype: dict
+        """
+        if not os.path.exists(self.path):
+            return None
+        with io.open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def bind_output(self, output):
+        """
+        :param output: a file whose position is persisted with every save
+        """
+        self._output = output
+
+    @property
+    def done(self):
+        return bool(self.state and self.state.get('done'))
+
+    @property
+    def output_offset(self):
+        return self.state.get('output_offset') if self.state else None
+
+    def resume(self, endpoint, params, max_results=None):
+        """
+        :type endpoint: str
+        :type params: dict
+        :type max_results: int
+        :return: the saved state of this query or None when starting afresh
+        :rtype: dict
+        """
+        query = {'endpoint': endpoint, 'params': params}
+        if max_results is not None:
+            # unbounded queries keep the key of the checkpoints saved before max_results was part of it
+            query['max_results'] = max_results
+        self._query = json.dumps(query, sort_keys=True, default=str)
+        if self.state is None:
+            return None
+        if self.state['query'] != self._query:
+            raise CvaClientError("Checkpoint {} belongs to a different query: {}".format(
+                self.path, self.state['query']))
+        logging.info("Resuming {} after {} items".format(endpoint, self.state['emitted']))
+        return self.state
+
+    def save(self, page_params, emitted, done=False):
+        """
+        :param page_params: the pagination parameters of the next page
+        :type page_params: dict
+        :param emitted: the number of items emitted so far
+        :type emitted: int
+        :type done: bool
+        """
+        output_offset = None
+        if self._output is not None:
+            self._output.flush()
+            os.fsync(self._output.fileno())
+            output_offset = self._output.tell()
+        self.state = {
+            'query': self._query,
+            'params': page_params,
+            'emitted': emitted,
+            'done': done,
+            'output_offset': output_offset,
+            'updated': datetime.datetime.utcnow().isoformat()
+        }
+        temporary = "{}.tmp".format(self.path)
+        with io.open(temporary, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.state, sort_keys=True))
+            f.flush()
+            os.fsync(f.fileno())
+        _replace(temporary, self.path)
+
+    def clear(self):
+        """
+        Deletes the persisted state, the next run starts from the first page
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.state = None
+
+
+def export_to_file(path, method, checkpoint_path=None, **params):
+    """
+    Writes the results of a paginated query to a file as JSON lines, resuming a previous run if interrupted.
+    The output is truncated to the last checkpointed page before resuming so that running the export again
+    after a failure, or after it completed, produces the same file, eg:
+
+        export_to_file("cases.jsonl", cva.cases().get_cases, program=Program.rare_disease)
+
+    :param path: the output file
+    :type path: str
+    :param method: any paginated query accepting a `checkpoint` parameter, eg: `CasesClient.get_cases`
+    :type method: function
+    :param checkpoint_path: the checkpoint file, by default the output file suffixed with `.checkpoint`
+    :type checkpoint_path: str
+    :param params: the parameters of the query, as_data_frame is not supported
+    :type params: dict
+    :return: the total number of items in the file
+    :rtype: int
+    """
+    checkpoint = PaginationCheckpoint(checkpoint_path or "{}.checkpoint".format(path))
+    if checkpoint.state and checkpoint.state['emitted'] and checkpoint.output_offset is None:
+        # the output cannot be truncated to the last checkpointed page, starting over would overwrite it
+        raise CvaClientError("Checkpoint {} was not saved by an export, it has no output offset".format(
+            checkpoint.path))
+    # the query raises if the checkpoint belongs to a different query and emits nothing if it already completed,
+    # either way before the output is opened
+    output = _CheckpointedOutput(path, checkpoint.output_offset)
+    try:
+        checkpoint.bind_output(output)
+        for item in method(checkpoint=checkpoint, **params):
+            document = item.toJsonDict() if hasattr(item, "toJsonDict") else item
+            output.write(json.dumps(document).encode("utf-8"))
+            output.write(b"\n")
+    finally:
+        output.close()
+    if not output.opened:
+        logging.info("Export to {} already completed".format(path))
+    return checkpoint.state['emitted']
+
+
+class _CheckpointedOutput(object):
+    """
+    The output of an export opened on first use, truncated to the offset of the checkpoint when resuming
+    """
+
+    def __init__(self, path, offset):
+        self._path = path
+        self._offset = offset
+        self._file = None
+
+    @property
+    def opened(self):
+        return self._file is not None
+
+    def _open(self):
+        if self._file is None:
+            if self._offset is not None and os.path.exists(self._path):
+                self._file = io.open(self._path, "r+b")
+                self._file.truncate(self._offset)
+                self._file.seek(self._offset)
+            else:
+                self._file = io.open(self._path, "wb")
+        return self._file
+
+    def write(self, data):
+        return self._open().write(data)
+
+    def flush(self):
+        self._open().flush()
+
+    def fileno(self):
+        return self._open().fileno()
+
+    def tell(self):
+        return self._open().tell()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _replace(source, destination):
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+    else:
+        # python 2 only has an atomic rename on posix
+        os.rename(source, destination)
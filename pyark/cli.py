@@ -0,0 +1,317 @@
+"""
+Command line interface for bulk operations against CVA, eg:
+
+    pyark --url https://cva.example.org --token $TOKEN export cases cases.jsonl --param program=rare_disease
+    pyark export variants variants.parquet --format parquet --param genes=BRCA2
+    pyark --threads 8 --rate-limit 50 lookup variant_ids.txt variants.jsonl
+    pyark --threads 32 --http2 lookup variant_ids.txt variants.jsonl
+    pyark lift-over grch37_variants.txt grch38_variants.tsv --batch-size 1000
+    pyark ingest ./pedigrees --type pedigree
+
+The URL and credentials are also read from the environment variables PYARK_URL, PYARK_TOKEN, PYARK_USER and
+PYARK_PASSWORD. Progress and throughput are logged to the standard error.
+"""
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import timeit
+
+import pyark
+import pyark.transports as transports
+from pyark.checkpoint import export_to_file
+from pyark.columnar import chunks, write_parquet
+from pyark.cva_client import CvaClient
+from pyark.errors import CvaError
+from pyark.page_sizing import AdaptivePageSize
+from pyark.lazy_import import cva_models
+from pyark.rest_client import RestClient
+from pyark.sharded_export import ENTITIES
+from pyark.token_cache import TokenCache
+
+
+NDJSON = "ndjson"
+PARQUET = "parquet"
+
+# the inject models and the data intake methods posting them
+INJECTS = {
+    'pedigree': ('PedigreeInjectRD', 'post_pedigree'),
+    'participant': ('CancerParticipantInject', 'post_participant'),
+    'interpreted-genome': ('InterpretedGenomeInject', 'post_interpreted_genome'),
+    'clinical-report': ('ClinicalReportInject', 'post_clinical_report'),
+    'exit-questionnaire': ('ExitQuestionnaireInjectRD', 'post_exit_questionaire'),
+    'exit-questionnaire-cancer': ('ExitQuestionnaireInjectCancer', 'post_exit_questionaire_cancer'),
+    'interpretation-log': ('VariantInterpretationLog', 'post_variant_interpretation_log')
+}
+
+
+class Progress(object):
+    """
+    Counts processed items and logs the throughput every `interval` seconds, it is thread safe.
+    """
+
+    def __init__(self, label, interval=10.0):
+        self.label = label
+        self.interval = interval
+        self.count = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._start = timeit.default_timer()
+        self._last_report = self._start
+
+    def add(self, count=1, failed=0):
+        with self._lock:
+            self.count += count
+            self.failed += failed
+            now = timeit.default_timer()
+            if self.interval and now - self._last_report >= self.interval:
+                self._last_report = now
+                self._log(now)
+
+    def track(self, items):
+        """
+        :return: the items counting them as they are consumed
+        :rtype: generator
+        """
+        for item in items:
+            self.add()
+            yield item
+
+    def done(self):
+        self._log(timeit.default_timer(), final=True)
+
+    def _log(self, now, final=False):
+        elapsed = max(now - self._start, 1e-9)
+        logging.info("{}{}: {} items{} in {:.1f}s ({:.1f} items/s)".format(
+            self.label, " completed" if final else "", self.count,
+            ", {} failed".format(self.failed) if self.failed else "", elapsed, self.count / elapsed))
+
+
+def build_client(args):
+    """
+    :rtype: CvaClient
+    """
+    if args.http2:
+        transport = transports.Http2Transport()
+    else:
+        transport = transports.RequestsTransport(RestClient._session)
+    if args.rate_limit:
+        transport = transports.RateLimitedTransport(transport, args.rate_limit)
+    timeout = (args.connect_timeout, args.read_timeout)
+    token_cache = TokenCache(args.token_cache or None) if args.token_cache is not None else None
+    return CvaClient(args.url, token=args.token, user=args.user, password=args.password, retries=args.retries,
+                     threads=args.threads, transport=transport, timeout=timeout, token_cache=token_cache)
+
+
+def parse_params(params):
+    """
+    Parses query parameters as in key=value, repeated keys become lists
+
+    :type params: list
+    :rtype: dict
+    """
+    parsed = {}
+    for param in params or []:
+        if "=" not in param:
+            raise ValueError("Invalid parameter '{}', expected key=value".format(param))
+        key, value = param.split("=", 1)
+        value = {'true': True, 'false': False}.get(value.lower(), value)
+        if key in parsed:
+            parsed[key] = (parsed[key] if isinstance(parsed[key], list) else [parsed[key]]) + [value]
+        else:
+            parsed[key] = value
+    return parsed
+
+
+def raw_query(cva, entity):
+    """
+    :return: a paginated query of the entity yielding dictionaries, building no models
+    :rtype: function
+    """
+    subclient = getattr(cva, ENTITIES[entity][0])()
+
+    def query(**params):
+        params.setdefault('include', [subclient._INCLUDE_ALL])
+        return subclient._paginate(endpoint=subclient._BASE_ENDPOINT, **params)
+    return query
+
+
+def export(cva, args):
+    query = raw_query(cva, args.entity)
+    params = parse_params(args.param)
+    if args.max_results:
+        params['max_results'] = args.max_results
+    if args.page_size:
+        params['page_size'] = args.page_size
+    if args.target_page_seconds:
+        params['page_size'] = AdaptivePageSize(target_seconds=args.target_page_seconds,
+                                               initial_size=args.page_size or 100)
+    progress = Progress("Export of {}".format(args.entity), interval=args.progress_interval)
+    output_format = args.format or (PARQUET if args.output.endswith(".parquet") else NDJSON)
+    if output_format == NDJSON:
+        # checkpointed, running the same command again resumes an interrupted export
+        export_to_file(args.output, lambda **p: progress.track(query(**p)), **params)
+    else:
+        write_parquet(args.output, progress.track(query(**params)), batch_size=args.batch_size)
+    progress.done()
+    return 0
+
+
+def lookup(cva, args):
+    variants = cva.variants()
+    progress = Progress("Lookup of variants", interval=args.progress_interval)
+    with io.open(args.output, "wb") as output:
+        for identifiers in chunks(_read_lines(args.input), args.batch_size):
+            results = CvaClient.run_threaded_requests(
+                lambda i: variants.get_variant_by_id(i), identifiers, threads=args.threads, fail_fast=False)
+            found = [r for r in results if r is not None]
+            for variant in found:
+                output.write(json.dumps(variant.toJsonDict()).encode("utf-8"))
+                output.write(b"\n")
+            progress.add(len(found), failed=len(identifiers) - len(found))
+    progress.done()
+    return 1 if progress.failed else 0
+
+
+def lift_over(cva, args):
+    lift_overs = cva.lift_overs()
+    progress = Progress("Lift over", interval=args.progress_interval)
+
+    def lift(batch):
+        lifted = lift_overs.lift_over_by_variants_coordinates([_parse_coordinates(i) for i in batch])
+        return ["{}:{}:{}:{}:{}".format(c.assembly, c.chromosome, c.position, c.reference, c.alternate)
+                for c in lifted]
+
+    with io.open(args.output, "w", encoding="utf-8") as output:
+        # batches are lifted concurrently in windows of as many batches as threads
+        batches = chunks(_read_lines(args.input), args.batch_size)
+        for window in chunks(batches, args.threads):
+            results = CvaClient.run_threaded_requests(lift, window, threads=args.threads, fail_fast=False)
+            for batch, lifted in zip(window, results):
+                if lifted is None:
+                    progress.add(count=0, failed=len(batch))
+                    continue
+                for identifier, lifted_identifier in zip(batch, lifted):
+                    output.write(u"{}\t{}\n".format(identifier, lifted_identifier))
+                progress.add(len(batch))
+    progress.done()
+    return 1 if progress.failed else 0
+
+
+def ingest(cva, args):
+    model_name, method_name = INJECTS[args.type]
+    post = getattr(cva.data_intake(), method_name)
+    files = sorted(glob.glob(os.path.join(args.directory, "*.json")))
+    progress = Progress("Ingestion of {}".format(args.type), interval=args.progress_interval)
+
+    def post_file(path):
+        with io.open(path, "r", encoding="utf-8") as f:
+            inject = getattr(cva_models, model_name).fromJsonDict(json.load(f))
+        transaction = post(inject)
+        progress.add()
+        return transaction
+
+    results = CvaClient.run_threaded_requests(post_file, files, threads=args.threads, fail_fast=False)
+    for path, transaction in zip(files, results):
+        if transaction is None:
+            progress.add(count=0, failed=1)
+            logging.error("Failed to ingest {}".format(path))
+        else:
+            logging.debug("Ingested {} in transaction {}".format(path, transaction.id))
+    progress.done()
+    return 1 if progress.failed else 0
+
+
+def _read_lines(path):
+    with io.open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def _parse_coordinates(line):
+    # either {assembly}:{chromosome}:{position}:{reference}:{alternate} or the same fields separated by spaces
+    fields = line.split(":") if ":" in line else line.split()
+    if len(fields) != 5:
+        raise ValueError("Invalid variant '{}'".format(line))
+    assembly, chromosome, position, reference, alternate = fields
+    return cva_models.VariantCoordinates(assembly=assembly, chromosome=chromosome, position=int(position),
+                                         reference=reference, alternate=alternate)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pyark", description="Bulk operations on the Clinical Variant Ark")
+    parser.add_argument("--version", action="version", version=pyark.VERSION)
+    parser.add_argument("--url", default=os.environ.get("PYARK_URL"), help="the CVA URL [PYARK_URL]")
+    parser.add_argument("--token", default=os.environ.get("PYARK_TOKEN"), help="[PYARK_TOKEN]")
+    parser.add_argument("--user", default=os.environ.get("PYARK_USER"), help="[PYARK_USER]")
+    parser.add_argument("--password", default=os.environ.get("PYARK_PASSWORD"), help="[PYARK_PASSWORD]")
+    parser.add_argument("--token-cache", nargs="?", const="", default=os.environ.get("PYARK_TOKEN_CACHE"),
+                        metavar="PATH", help="shares the token of the user with other processes through a file, "
+                                             "by default ~/.pyark/tokens.json [PYARK_TOKEN_CACHE]")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent requests")
+    parser.add_argument("--rate-limit", type=float, help="maximum requests per second")
+    parser.add_argument("--http2", action="store_true", help="multiplexes the requests over HTTP/2 connections")
+    parser.add_argument("--retries", type=int, default=10)
+    parser.add_argument("--connect-timeout", type=float, default=30)
+    parser.add_argument("--read-timeout", type=float, default=600)
+    parser.add_argument("--progress-interval", type=float, default=10, help="seconds between progress reports")
+    parser.add_argument("--log-level", default="INFO")
+    commands = parser.add_subparsers(dest="command")
+
+    export_parser = commands.add_parser("export", help="streams cases, report events or variants into a file")
+    export_parser.add_argument("entity", choices=sorted(ENTITIES))
+    export_parser.add_argument("output")
+    export_parser.add_argument("--format", choices=[NDJSON, PARQUET],
+                               help="by default Parquet for .parquet files and NDJSON otherwise")
+    export_parser.add_argument("--param", action="append", help="a query parameter as key=value, can be repeated")
+    export_parser.add_argument("--max-results", type=int)
+    export_parser.add_argument("--page-size", type=int, help="results per request, by default the server decides")
+    export_parser.add_argument("--target-page-seconds", type=float,
+                               help="adapts the page size to receive every page in about this time")
+    export_parser.add_argument("--batch-size", type=int, default=10000, help="rows per Parquet row group")
+    export_parser.set_defaults(func=export)
+
+    lookup_parser = commands.add_parser("lookup", help="fetches variants from a file of variant identifiers")
+    lookup_parser.add_argument("input", help="a variant identifier per line")
+    lookup_parser.add_argument("output", help="the variants as NDJSON")
+    lookup_parser.add_argument("--batch-size", type=int, default=1000)
+    lookup_parser.set_defaults(func=lookup)
+
+    lift_over_parser = commands.add_parser("lift-over", help="lifts over a file of variant coordinates")
+    lift_over_parser.add_argument("input", help="a variant identifier or coordinates per line")
+    lift_over_parser.add_argument("output", help="the input and lifted over variant identifiers as TSV")
+    lift_over_parser.add_argument("--batch-size", type=int, default=1000, help="variants per request")
+    lift_over_parser.set_defaults(func=lift_over)
+
+    ingest_parser = commands.add_parser("ingest", help="posts a directory of JSON injects")
+    ingest_parser.add_argument("directory")
+    ingest_parser.add_argument("--type", required=True, choices=sorted(INJECTS))
+    ingest_parser.set_defaults(func=ingest)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()), stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 2
+    if not args.url:
+        parser.error("the CVA URL is required, use --url or PYARK_URL")
+    try:
+        return args.func(build_client(args), args)
+    except (CvaError, ValueError) as ex:
+        logging.error(str(ex))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
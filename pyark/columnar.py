@@ -0,0 +1,136 @@
+import itertools
+import json
+import logging
+import os
+
+from pyark.lazy_import import pyarrow, parquet, polars
+
+
+def write_parquet(path, documents, batch_size=10000):
+    """
+    Streams documents into a Parquet file in row groups of `batch_size` rows. There is a column per top level
+    field, nested values are stored as JSON strings. The schema is set by the first batch, fields not in it
+    are dropped.
+
+    :type path: str
+    :type documents: iterable
+    :type batch_size: int
+    :return: the number of rows written
+    :rtype: int
+    """
+    writer = None
+    schema = None
+    count = 0
+    dropped = set()
+    try:
+        for batch in chunks(documents, batch_size):
+            if schema is None:
+                schema = _parquet_schema(batch)
+                writer = parquet.ParquetWriter(path, schema)
+            names = set(schema.names)
+            for document in batch:
+                dropped.update(k for k in document if k not in names)
+            columns = dict((field.name, [_parquet_value(d.get(field.name), field.type == pyarrow.string())
+                                         for d in batch]) for field in schema)
+            writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if dropped:
+        logging.warning("Fields not in the first batch were not written: {}".format(sorted(dropped)))
+    return count
+
+
+def _parquet_schema(documents):
+    fields = []
+    names = []
+    for document in documents:
+        names.extend(k for k in document if k not in names)
+    for name in names:
+        try:
+            inferred = pyarrow.array([_parquet_value(d.get(name)) for d in documents]).type
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            inferred = pyarrow.null()
+        # columns with only nulls in the first batch or with mixed types are stored as strings
+        fields.append(pyarrow.field(name, pyarrow.string() if inferred == pyarrow.null() else inferred))
+    return pyarrow.schema(fields)
+
+
+def _parquet_value(value, as_string=False):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if as_string and value is not None and not isinstance(value, type(u"")):
+        return json.dumps(value)
+    return value
+
+
+class PolarsOutput(object):
+    """
+    Collects the results of a paginated query into a Polars DataFrame or LazyFrame, eg:
+
+        report_events_client.get_report_events(as_polars=True)
+        report_events_client.get_report_events(as_polars=PolarsOutput(spill_directory="/scratch/report_events"))
+
+    Results are streamed into a frame per batch of `batch_size` rows with nested fields as structs and lists,
+    batches are concatenated at the end unifying their schemas. With a `spill_directory` every batch is written
+    to a Parquet file instead of kept in memory and a LazyFrame scanning the files is returned, so that results
+    larger than memory are aggregated out of core. The files are left in the directory.
+
+    :param lazy: returns a LazyFrame instead of a DataFrame
+    :type lazy: bool
+    :param spill_directory: the directory where batches are written, it always returns a LazyFrame
+    :type spill_directory: str
+    :type batch_size: int
+    """
+
+    def __init__(self, lazy=False, spill_directory=None, batch_size=10000):
+        self.lazy = lazy
+        self.spill_directory = spill_directory
+        self.batch_size = batch_size
+
+    def collect(self, documents):
+        """
+        :type documents: iterable
+        :rtype: polars.DataFrame | polars.LazyFrame
+        """
+        if self.spill_directory and not os.path.exists(self.spill_directory):
+            os.makedirs(self.spill_directory)
+        frames = []
+        for i, batch in enumerate(chunks(documents, self.batch_size)):
+            frame = self._build_frame(batch)
+            if self.spill_directory:
+                path = os.path.join(self.spill_directory, "part-{:05d}.parquet".format(i))
+                frame.write_parquet(path)
+                frame = polars.scan_parquet(path)
+            frames.append(frame)
+        if frames:
+            # fields missing or null in some batches are filled and typed with the other batches
+            result = polars.concat(frames, how="diagonal_relaxed")
+        else:
+            result = polars.DataFrame()
+        if self.lazy or self.spill_directory:
+            return result.lazy()
+        return result
+
+    @staticmethod
+    def _build_frame(documents):
+        try:
+            # Arrow converts nested documents an order of magnitude faster than polars.from_dicts
+            return polars.from_arrow(pyarrow.Table.from_struct_array(pyarrow.array(documents)))
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            # eg: a field with values of different types
+            return polars.from_dicts(documents, infer_schema_length=None)
+
+
+def chunks(items, size):
+    """
+    :return: the items in lists of up to `size` items, consuming them lazily
+    :rtype: generator
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
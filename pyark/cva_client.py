@@ -1,13 +1,25 @@
 import re
 import logging
+import requests
 from pyark.rest_client import RestClient
+import pyark.metrics as metrics
+import pyark.profiling as profiling
+from pyark.columnar import PolarsOutput, chunks
+from pyark.dtypes import schema_for
+from pyark.page_sizing import AdaptivePageSize, PAGE_SIZE_BUCKETS
+from pyark.token_cache import TokenCache
+import pyark.timeouts as timeouts
+import itertools
+import json
+from collections import OrderedDict
 import multiprocessing
-
-try:
-    import pandas as pd
-    from pandas.io.json import json_normalize
-except ImportError:
-    logging.warn("Pandas is not installed which will mean as_data_frame=True will not work. If you want to install this do 'pip install clinical-variant-ark[pandas]'")
+import threading
+from multiprocessing.pool import ThreadPool
+from future.standard_library import install_aliases
+install_aliases()
+import queue
+# pandas is imported on first use as it is optional and slow to import
+from pyark.lazy_import import pandas as pd, numpy as np, json_normalize
 
 class CvaClient(RestClient):
 
@@ -19,19 +31,26 @@ class CvaClient(RestClient):
     _MARKER_PARAM = 'marker'
     _LIMIT_HEADER = 'X-Pagination-Limit'
     _MARKER_HEADER = 'X-Pagination-Marker'
+    # a first page of up to this size is requested when the page size is not known
+    _SMALL_PAGE_SIZE = 100
 
     # authentication endpoint
     _AUTHENTICATION_ENDPOINT = "authentication"
 
     _INCLUDE_ALL = "__all"
 
+    # the items posted per request by the batch queries
+    _POST_CHUNK_SIZE = 1000
+
     def __init__(self, url_base, token=None, user=None, password=None,
-                 disable_validation=True, disable_annotation=False, retries=10, threads=4):
+                 disable_validation=True, disable_annotation=False, retries=10, threads=4, metrics_registry=None,
+                 transport=None, timeout=timeouts.DEFAULT_TIMEOUT, token_cache=None):
 
         if not (token or (user and password is not None)):
             logging.error("Credentials are required. Either token or user/password.")
             raise ValueError("Missing credentials")
-        RestClient.__init__(self, url_base, self._ENDPOINT_BASE, retries=retries)
+        RestClient.__init__(self, url_base, self._ENDPOINT_BASE, retries=retries, metrics_registry=metrics_registry,
+                            transport=transport, timeout=timeout)
         self._disable_validation = disable_validation
         self._disable_annotation = disable_annotation
         self._push_data_params = {'disable_validation': self._disable_validation,
@@ -39,7 +58,10 @@ class CvaClient(RestClient):
         self._token = "Bearer {}".format(token.replace("Bearer ", "")) if token else None
         self._user = user
         self._password = password
+        self._retries = retries
         self._threads = threads
+        # True shares the tokens in the default cache file
+        self._token_cache = TokenCache() if token_cache is True else token_cache or None
         if self._token or (self._user is not None and self._password is not None):
             self._set_authenticated_header()
         # initialise subclients
@@ -53,6 +75,12 @@ class CvaClient(RestClient):
         self._evidences_client = None
 
     def _get_token(self):
+        if self._token_cache is not None:
+            # the current token, if any, is being renewed as it was rejected
+            return self._token_cache.get_token(self._url_base, self._user, self._login, rejected=self._token)
+        return self._login()
+
+    def _login(self):
         logging.info("attemping to get a tqoken for user {}".format(self._user))
         results, _ = self._post(
             self._AUTHENTICATION_ENDPOINT,
@@ -68,30 +96,223 @@ class CvaClient(RestClient):
 
     def _post(self, endpoint, payload, session=True, **params):
         response, headers = super(CvaClient, self)._post(endpoint, payload, session, **params)
+        self._record_server_time("POST", endpoint, response)
         return CvaClient._parse_result(response), CvaClient._build_next_page_params(headers)
 
     def _get(self, endpoint, session=True, **params):
         response, headers = super(CvaClient, self)._get(endpoint, session, **params)
+        self._record_server_time("GET", endpoint, response)
         return CvaClient._parse_result(response), CvaClient._build_next_page_params(headers)
 
     def _delete(self, endpoint, **params):
         response, headers = super(CvaClient, self)._delete(endpoint, **params)
+        self._record_server_time("DELETE", endpoint, response)
         return CvaClient._parse_result(response), CvaClient._build_next_page_params(headers)
 
+    def _record_server_time(self, method, endpoint, response):
+        # the server reports its processing time in milliseconds
+        server_time = response.get('time', None) if isinstance(response, dict) else None
+        if server_time is not None:
+            self._metrics.observe("pyark_server_time_seconds", float(server_time) / 1000,
+                                  help="Server reported processing time of requests in seconds",
+                                  method=method, endpoint=metrics.endpoint_label(endpoint))
+
+    def _subclient_params(self):
+        """
+        :return: the parameters to initialise a subclient sharing the configuration of this client
+        :rtype: dict
+        """
+        return dict(url_base=self._url_base, token=self._token, user=self._user, password=self._password,
+                    retries=self._retries, threads=self._threads, metrics_registry=self._metrics,
+                    transport=self._transport, timeout=self._timeout, token_cache=self._token_cache)
+
     @staticmethod
     def run_parallel_requests(method, parameters, threads):
         """
+        Runs the method over every parameter in a pool of forked processes, every process opens connections of its
+        own to the default session of the clients.
+
         :type method: function
         :type parameters: list
         :type threads: int
         :rtype: object
         """
-        pool = multiprocessing.Pool(processes=threads)
+        pool = multiprocessing.Pool(processes=threads, initializer=_discard_inherited_connections)
         results = list(pool.map(method, parameters))
         pool.close()
         pool.join()
         return results
 
+    @staticmethod
+    def run_threaded_requests(method, parameters, threads, fail_fast=True):
+        """
+        Runs the method over every parameter in a bounded pool of threads, unlike `run_parallel_requests` the
+        method does not need to be pickled.
+
+        :type method: function
+        :type parameters: list
+        :type threads: int
+        :param fail_fast: raises the first error, otherwise errors are logged and failed requests return None
+        :type fail_fast: bool
+        :return: the results in the same order as the parameters
+        :rtype: list
+        """
+        if not parameters:
+            return []
+
+        def call(p):
+            try:
+                return method(p), None
+            except Exception as ex:
+                return None, ex
+
+        pool = ThreadPool(processes=max(1, min(threads, len(parameters))))
+        try:
+            outcomes = pool.map(call, parameters, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        results = []
+        for p, (result, error) in zip(parameters, outcomes):
+            if error is not None:
+                if fail_fast:
+                    raise error
+                logging.error("Request with parameters {} failed: {}".format(p, error))
+            results.append(result)
+        return results
+
+    def _post_in_chunks(self, endpoint, items, chunk_size=None, threads=None, **params):
+        """
+        Posts a list of items in chunks of up to `chunk_size` items sent concurrently, so that large inputs do not
+        exceed the payload limits nor time out. Every chunk is retried on its own.
+
+        :type endpoint: str | list
+        :type items: list
+        :param chunk_size: the items per request, by default 1000
+        :type chunk_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
+        :type params: dict
+        :return: the results of all chunks in the order of the items
+        :rtype: list
+        """
+        batches = list(chunks(items, chunk_size or self._POST_CHUNK_SIZE))
+        if len(batches) <= 1:
+            results, _ = self._post(endpoint, batches[0] if batches else [], **params)
+            return results
+
+        def post(batch):
+            results, _ = self._post(endpoint, batch, **params)
+            return results
+
+        results = self.run_threaded_requests(post, batches, threads or self._threads)
+        return list(itertools.chain.from_iterable(results))
+
+    @staticmethod
+    def run_deduplicated_requests(method, parameters, threads, fail_fast=True):
+        """
+        Runs the method once per distinct parameter set in a bounded pool of threads.
+
+        :type method: function
+        :param parameters: a list of dictionaries of parameters
+        :type parameters: list
+        :type threads: int
+        :type fail_fast: bool
+        :return: the results in the same order as the parameters, duplicated parameters share the same result
+        :rtype: list
+        """
+        keys = [json.dumps(p, sort_keys=True, default=str) for p in parameters]
+        unique = {}
+        for key, p in zip(keys, parameters):
+            unique.setdefault(key, p)
+        unique_keys = list(unique.keys())
+        results = CvaClient.run_threaded_requests(
+            method, [unique[k] for k in unique_keys], threads, fail_fast=fail_fast)
+        results_by_key = dict(zip(unique_keys, results))
+        return [results_by_key[k] for k in keys]
+
+    @staticmethod
+    def prefetch(items, buffer_size):
+        """
+        Consumes an iterable in a background thread keeping up to `buffer_size` items ahead of the caller, eg:
+        the next pages of a paginated query are fetched while the current one is processed. Errors are raised
+        to the caller when reached.
+
+        :type items: iterable
+        :param buffer_size: the maximum number of items held ahead, bounds the memory used
+        :type buffer_size: int
+        :rtype: generator
+        """
+        end = object()
+        buffer = queue.Queue(maxsize=max(1, buffer_size))
+        stop = threading.Event()
+
+        def put(element):
+            # gives up when the caller stops consuming
+            while not stop.is_set():
+                try:
+                    buffer.put(element, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for item in items:
+                    if not put((item, None)):
+                        return
+                put((end, None))
+            except Exception as ex:
+                put((end, ex))
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+        try:
+            while True:
+                item, error = buffer.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def _count_facets(self, facets, as_array=False, threads=None, fail_fast=False, **params):
+        """
+        Runs `count` concurrently for every combination of the values of the facets.
+
+        :param facets: the filters and their values, eg: {'program': [...], 'assembly': [...]}, use an ordered
+        dictionary or a list of pairs to fix the order of the dimensions
+        :type facets: dict | list
+        :type as_array: bool
+        :param threads: the maximum number of concurrent counts, by default the threads of the client
+        :type threads: int
+        :param fail_fast: raises on the first failed count, otherwise failed counts are logged and left empty
+        :type fail_fast: bool
+        :param params: filters shared by all counts
+        :return: a data frame with one column per facet and a column `count` or, when `as_array` is True, a dense
+        array with one dimension per facet and the list of facet values of every dimension
+        :rtype: pd.DataFrame | tuple
+        """
+        dimensions = list(facets.items()) if isinstance(facets, dict) else list(facets)
+        names = [name for name, _ in dimensions]
+        axes = [list(values) for _, values in dimensions]
+        combinations = list(itertools.product(*axes))
+        queries = [dict(params, **dict(zip(names, combination))) for combination in combinations]
+        counts = self.run_deduplicated_requests(
+            lambda p: self.count(**p), queries, threads=threads or self._threads, fail_fast=fail_fast)
+        if as_array:
+            array = np.array([np.nan if c is None else c for c in counts], dtype=float).reshape(
+                [len(values) for values in axes])
+            if not np.isnan(array).any():
+                array = array.astype(np.int64)
+            return array, axes
+        return pd.DataFrame([list(combination) + [count] for combination, count in zip(combinations, counts)],
+                            columns=names + ['count'])
+
     def report_events(self):
         """
 
@@ -102,8 +323,7 @@ class CvaClient(RestClient):
         import pyark.subclients.report_events_client
         if self._report_events_client is None:
             # initialise subclients
-            self._report_events_client = pyark.subclients.report_events_client.ReportEventsClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._report_events_client = pyark.subclients.report_events_client.ReportEventsClient(**self._subclient_params())
         return self._report_events_client
 
     def entities(self):
@@ -116,8 +336,7 @@ class CvaClient(RestClient):
         import pyark.subclients.entities_client
         if self._entities_client is None:
             # initialise subclients
-            self._entities_client = pyark.subclients.entities_client.EntitiesClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._entities_client = pyark.subclients.entities_client.EntitiesClient(**self._subclient_params())
         return self._entities_client
 
     def cases(self):
@@ -130,8 +349,7 @@ class CvaClient(RestClient):
         import pyark.subclients.cases_client
         if self._cases_client is None:
             # initialise subclients
-            self._cases_client = pyark.subclients.cases_client.CasesClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._cases_client = pyark.subclients.cases_client.CasesClient(**self._subclient_params())
         return self._cases_client
 
     def variants(self):
@@ -144,8 +362,7 @@ class CvaClient(RestClient):
         import pyark.subclients.variants_client
         if self._variants_client is None:
             # initialise subclients
-            self._variants_client = pyark.subclients.variants_client.VariantsClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._variants_client = pyark.subclients.variants_client.VariantsClient(**self._subclient_params())
         return self._variants_client
 
     def transactions(self):
@@ -158,16 +375,14 @@ class CvaClient(RestClient):
         import pyark.subclients.transactions_client
         if self._transactions_client is None:
             # initialise subclients
-            self._transactions_client = pyark.subclients.transactions_client.TransactionsClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._transactions_client = pyark.subclients.transactions_client.TransactionsClient(**self._subclient_params())
         return self._transactions_client
 
     def evidences(self):
         import pyark.subclients.evidences_client
         if self._evidences_client is None:
             # initialise subclients
-            self._evidences_client = pyark.subclients.evidences_client.EvidencesClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._evidences_client = pyark.subclients.evidences_client.EvidencesClient(**self._subclient_params())
         return self._evidences_client
 
     def lift_overs(self):
@@ -180,8 +395,7 @@ class CvaClient(RestClient):
         import pyark.subclients.lift_over_client
         if self._lift_overs_client is None:
             # initialise subclients
-            self._lift_overs_client = pyark.subclients.lift_over_client.LiftOverClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._lift_overs_client = pyark.subclients.lift_over_client.LiftOverClient(**self._subclient_params())
         return self._lift_overs_client
 
     def data_intake(self):
@@ -194,12 +408,13 @@ class CvaClient(RestClient):
         import pyark.subclients.data_intake_client
         if self._data_intake_client is None:
             # initialise subclients
-            self._data_intake_client = pyark.subclients.data_intake_client.DataIntakeClient(
-                url_base=self._url_base, token=self._token, user=self._user, password=self._password)
+            self._data_intake_client = pyark.subclients.data_intake_client.DataIntakeClient(**self._subclient_params())
         return self._data_intake_client
 
     @staticmethod
     def _build_next_page_params(headers):
+        # header names are case insensitive and HTTP/2 sends them in lower case
+        headers = requests.structures.CaseInsensitiveDict(headers)
         next_page_params = {}
         limit = headers.get(CvaClient._LIMIT_HEADER, None)
         marker = headers.get(CvaClient._MARKER_HEADER, None)
@@ -210,18 +425,19 @@ class CvaClient(RestClient):
 
     @staticmethod
     def _parse_result(response):
-        logging.info("Response time : {} ms".format(response.get('time', None)))
-        error = response.get('error', None)
-        if error:
-            logging.error(error)
-            raise ValueError(error)
-        warning = response.get('warning', None)
-        if warning:
-            logging.warning(warning)
-        if 'response' in response and len(response['response']) > 0 and 'result' in response['response'][0]:
-            return response['response'][0]['result']
-        else:
-            return []
+        with profiling.phase(profiling.PARSE_RESULT):
+            logging.info("Response time : {} ms".format(response.get('time', None)))
+            error = response.get('error', None)
+            if error:
+                logging.error(error)
+                raise ValueError(error)
+            warning = response.get('warning', None)
+            if warning:
+                logging.warning(warning)
+            if 'response' in response and len(response['response']) > 0 and 'result' in response['response'][0]:
+                return response['response'][0]['result']
+            else:
+                return []
 
     def _render_single_result(self, results, as_data_frame=False, indexes={}):
         if results is None or len(results) == 0:
@@ -241,7 +457,8 @@ class CvaClient(RestClient):
     def _render(results, as_data_frame=False, indexes={}):
         if as_data_frame:
             if results:
-                df = json_normalize(results)
+                with profiling.phase(profiling.JSON_NORMALIZE):
+                    df = json_normalize(results)
                 if indexes:
                     df.index = pd.MultiIndex.from_arrays(
                         [[values] if type(values) != list else indexes.values() for values in indexes.values()],
@@ -252,16 +469,56 @@ class CvaClient(RestClient):
         else:
             return results
 
-    def _paginate(self, endpoint, as_data_frame=False, max_results=None, transformer=None, **params):
+    def _paginate(self, endpoint, as_data_frame=False, max_results=None, transformer=None, dtypes=None, **params):
+        """
+        :return: the results one by one or, with as_data_frame, a data frame per page
+        :rtype: generator | DataFramePages
+        """
+        pages = self._paginate_pages(endpoint, max_results=max_results, transformer=transformer, **params)
+        if as_data_frame:
+            return DataFramePages(endpoint, pages, schema_for(endpoint, dtypes))
+        return self._paginate_items(endpoint, pages)
+
+    @staticmethod
+    def _paginate_items(endpoint, pages):
+        for _, results in pages:
+            profiling.end_page(endpoint, len(results))
+            for r in results:
+                yield r
+
+    def _paginate_pages(self, endpoint, max_results=None, transformer=None, checkpoint=None, timeout=None,
+                        deadline=None, page_size=None, **params):
+        # yields the position of the first result of every page and the results in the page, the next page is
+        # only requested once the previous one has been consumed
         more_results = True
+        # the deadline covers the whole scan, it starts with the first page
+        deadline = timeouts.Deadline.of(deadline)
+        adaptive_page_size = page_size if isinstance(page_size, AdaptivePageSize) else None
         count_returned = 0
+        if checkpoint is not None:
+            state = checkpoint.resume(endpoint, params, max_results=max_results)
+            if state is not None:
+                if state['done']:
+                    return
+                params.update(state['params'])
+                count_returned = state['emitted']
         while more_results:
             if max_results and count_returned >= max_results:
-                return
-            results, next_page_params = self._get(endpoint, **params)
+                break
+            if checkpoint is not None:
+                # every item of the previous page has been consumed at this point
+                checkpoint.save(self._page_params(params), count_returned)
+            self._set_page_limit(params, adaptive_page_size.size if adaptive_page_size else page_size, max_results,
+                                 count_returned)
+            results, next_page_params = self._get(endpoint, timeout=timeout, deadline=deadline, **params)
             results = list(results)
+            if adaptive_page_size is not None:
+                self._adapt_page_size(adaptive_page_size, endpoint, len(results))
             if transformer:
-                results = list(map(transformer, results))
+                with profiling.phase(profiling.MODEL_CONSTRUCTION):
+                    results = list(map(transformer, results))
+            self._metrics.inc("pyark_pagination_pages_total", help="Number of pages fetched by paginated queries",
+                              endpoint=metrics.endpoint_label(endpoint))
             if next_page_params:
                 params[CvaClient._LIMIT_PARAM] = next_page_params[CvaClient._LIMIT_PARAM]
                 params[CvaClient._MARKER_PARAM] = next_page_params[CvaClient._MARKER_PARAM]
@@ -270,15 +527,137 @@ class CvaClient(RestClient):
             if max_results and len(results) > max_results - count_returned:
                 # removes those elements in the page that overflow the maximum parameter
                 results = results[0:max_results-count_returned]
-            # NOTE: when returning a data frame we want all results in a batch in the
-            # same data frame, otherwise we want to iterate through them one by one
-            if as_data_frame:
-                df = self._render(results, as_data_frame=as_data_frame)
-                df['_index'] = list(range(count_returned, count_returned + len(results)))
-                df.set_index('_index', drop=True, inplace=True)
-                count_returned += len(results)
-                yield df
-            else:
-                for r in results:
-                    count_returned += 1
-                    yield r
+            yield count_returned, results
+            count_returned += len(results)
+        if checkpoint is not None:
+            checkpoint.save(self._page_params(params), count_returned, done=True)
+
+    def _collect_polars(self, as_polars, **params):
+        """
+        :param as_polars: True or the PolarsOutput collecting the results
+        :type as_polars: bool | PolarsOutput
+        :param params: the parameters of the paginated query
+        :rtype: polars.DataFrame | polars.LazyFrame
+        """
+        output = as_polars if isinstance(as_polars, PolarsOutput) else PolarsOutput()
+        return output.collect(self._paginate(**params))
+
+    def _adapt_page_size(self, adaptive_page_size, endpoint, results):
+        size = adaptive_page_size.update(
+            results, getattr(self._last_exchange, "seconds", 0), getattr(self._last_exchange, "bytes", 0))
+        self._metrics.observe("pyark_page_size", size, buckets=PAGE_SIZE_BUCKETS,
+                              help="Page sizes chosen by adaptive pagination",
+                              endpoint=metrics.endpoint_label(endpoint))
+
+    @staticmethod
+    def _set_page_limit(params, page_size, max_results, count_returned):
+        # requests no more results than still needed, the server page size is only known after the first page
+        limit = page_size or params.get(CvaClient._LIMIT_PARAM)
+        if max_results:
+            remaining = max_results - count_returned
+            if limit:
+                limit = min(int(limit), remaining)
+            elif remaining <= CvaClient._SMALL_PAGE_SIZE:
+                limit = remaining
+        if limit:
+            params[CvaClient._LIMIT_PARAM] = limit
+
+    @staticmethod
+    def _page_params(params):
+        return dict((k, params[k]) for k in (CvaClient._LIMIT_PARAM, CvaClient._MARKER_PARAM) if k in params)
+
+
+class DataFramePages(object):
+    """
+    The results of a paginated query as a data frame per page indexed by the position of the results, eg:
+
+        for df in cases_client.get_cases(as_data_frame=True):
+            ...
+
+    or as a single data frame with `collect`, which appends the values of every field to a column across pages
+    and builds the data frame once at the end, avoiding a data frame per page and the copies of pd.concat:
+
+        df = cases_client.get_cases(as_data_frame=True).collect()
+    """
+
+    def __init__(self, endpoint, pages, schema=None):
+        self._endpoint = endpoint
+        self._pages = pages
+        self._schema = schema
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start, results = next(self._pages)
+        df = CvaClient._render(results, as_data_frame=True)
+        if self._schema is not None:
+            with profiling.phase(profiling.DTYPES):
+                self._schema.apply(df)
+        with profiling.phase(profiling.REINDEX):
+            df.index = pd.RangeIndex(start, start + len(results), name='_index')
+        profiling.end_page(self._endpoint, len(results))
+        return df
+
+    # python 2
+    next = __next__
+
+    def collect(self):
+        """
+        :return: all the results not iterated yet in a single data frame, flattened as by json_normalize
+        :rtype: pd.DataFrame
+        """
+        columns = OrderedDict()
+        # the values of categorical columns are shared across results as they are appended
+        categories = {}
+        first = None
+        count = 0
+        for start, results in self._pages:
+            first = start if first is None else first
+            with profiling.phase(profiling.JSON_NORMALIZE):
+                for document in results:
+                    for name, value in _flatten(document):
+                        column = columns.get(name)
+                        if column is None:
+                            # the field was missing in all previous results
+                            column = columns[name] = [None] * count
+                            if self._schema is not None and self._schema.is_category(name):
+                                categories[name] = {}
+                        if name in categories and isinstance(value, (str, type(u""))):
+                            value = categories[name].setdefault(value, value)
+                        column.append(value)
+                    count += 1
+                    for column in columns.values():
+                        if len(column) < count:
+                            column.append(None)
+            profiling.end_page(self._endpoint, len(results))
+        first = first or 0
+        index = pd.RangeIndex(first, first + count, name='_index')
+        # every column is converted, and given its dtype, as its values are released and the columns are not
+        # consolidated into blocks, so no more than a column is ever held twice
+        series = OrderedDict()
+        while columns:
+            name, values = columns.popitem(last=False)
+            series[name] = pd.Series(values, index=index, copy=False)
+            del values
+            if self._schema is not None:
+                with profiling.phase(profiling.DTYPES):
+                    series[name] = self._schema.convert(name, series[name])
+        return pd.DataFrame(series, index=index, copy=False)
+
+
+def _discard_inherited_connections():
+    # a forked worker shares the connections kept alive by its parent, its responses would interleave with theirs
+    for prefix in list(RestClient._session.adapters):
+        RestClient._session.mount(prefix, requests.adapters.HTTPAdapter())
+
+
+def _flatten(document, prefix=""):
+    # the fields of nested dictionaries are flattened into dotted names as in json_normalize
+    for key, value in document.items():
+        name = "{}{}".format(prefix, key)
+        if isinstance(value, dict):
+            for flattened in _flatten(value, name + "."):
+                yield flattened
+        else:
+            yield name, value
@@ -0,0 +1,159 @@
+import fnmatch
+import logging
+
+from pyark.lazy_import import pandas as pd
+
+
+class DtypeSchema(object):
+    """
+    Converts the columns of a data frame of CVA results into memory efficient dtypes: repeated text into
+    categoricals, integers into the smallest integer type holding them and dates into datetimes. Pass it as the
+    `dtypes` of any paginated query returning data frames, or `dtypes=True` for the default schema of the entity:
+
+        report_events_client.get_report_events(as_data_frame=True, dtypes=True)
+        cases_client.get_cases(as_data_frame=True, dtypes=DtypeSchema(categories=["program", "*.panelName"]))
+
+    Columns are matched with shell-style wildcards against the dotted names flattened by json_normalize, eg:
+    `*.panelName` matches `reportEvent.genePanel.panelName`. Columns that hold lists or fail to convert are
+    left as they are. Categories differ between pages, concatenate them with `pyark.dtypes.concat` so that
+    categoricals are not turned back into objects.
+
+    :param categories: the columns converted to categoricals
+    :type categories: list
+    :param dates: the columns parsed as datetimes
+    :type dates: list
+    :param downcast_integers: converts integer columns into the smallest integer type holding their values
+    :type downcast_integers: bool
+    :param infer_categories: also converts any other text column into a categorical when its ratio of distinct
+    values is at most this, None does not infer categoricals
+    :type infer_categories: float
+    """
+
+    def __init__(self, categories=(), dates=(), downcast_integers=True, infer_categories=None):
+        self.categories = list(categories)
+        self.dates = list(dates)
+        self.downcast_integers = downcast_integers
+        self.infer_categories = infer_categories
+
+    def apply(self, df):
+        """
+        Converts the columns of the data frame in place
+
+        :type df: pd.DataFrame
+        :rtype: pd.DataFrame
+        """
+        for column in df.columns:
+            series = df[column]
+            converted = self.convert(column, series)
+            if converted is not series:
+                df[column] = converted
+        return df
+
+    def convert(self, column, series):
+        """
+        :param column: the name of the column
+        :type column: str
+        :type series: pd.Series
+        :return: the converted series or the same series if it keeps its dtype
+        :rtype: pd.Series
+        """
+        try:
+            if self._matches(column, self.dates):
+                return pd.to_datetime(series)
+            elif self._matches(column, self.categories) or self._is_repeated(series):
+                return series.astype("category")
+            elif self.downcast_integers and pd.api.types.is_integer_dtype(series):
+                return pd.to_numeric(series, downcast="integer")
+        except (TypeError, ValueError) as ex:
+            # eg: lists are not hashable and cannot be categories
+            logging.debug("Column {} keeps its dtype: {}".format(column, ex))
+        return series
+
+    def is_category(self, column):
+        """
+        :return: whether the column is converted into a categorical regardless of its values
+        :rtype: bool
+        """
+        return not self._matches(column, self.dates) and self._matches(column, self.categories)
+
+    def _is_repeated(self, series):
+        if self.infer_categories is None or series.dtype != object or len(series) == 0:
+            return False
+        return series.nunique() <= self.infer_categories * len(series)
+
+    @staticmethod
+    def _matches(column, patterns):
+        return any(fnmatch.fnmatchcase(str(column), p) for p in patterns)
+
+
+# text repeated across all entities, eg: the assembly of every variant coordinates
+_COMMON_CATEGORIES = ["*assembly", "*chromosome", "*reference", "*alternate", "*program"]
+
+CASES = DtypeSchema(
+    categories=_COMMON_CATEGORIES + ["*.panelName", "*.panelVersion", "*.diseaseGroup", "*.specificDisease"],
+    dates=["creationDate", "lastModifiedDate"],
+    infer_categories=0.5)
+
+REPORT_EVENTS = DtypeSchema(
+    categories=_COMMON_CATEGORIES + [
+        "type", "author", "authorVersion", "reportModelVersion", "caseId", "groupId", "cohortId", "variantId",
+        "reportEvent.tier", "reportEvent.domain", "reportEvent.modeOfInheritance", "reportEvent.penetrance",
+        "reportEvent.segregationPattern", "reportEvent.roleInCancer", "reportEvent.genePanel.*"],
+    dates=["date"],
+    infer_categories=0.5)
+
+VARIANTS = DtypeSchema(categories=_COMMON_CATEGORIES + ["*.type"], infer_categories=0.5)
+
+# by the first segment of the endpoint
+DEFAULT_SCHEMAS = {
+    'cases': CASES,
+    'report-events': REPORT_EVENTS,
+    'variants': VARIANTS
+}
+
+
+def schema_for(endpoint, dtypes):
+    """
+    :param endpoint: the endpoint of the query
+    :type endpoint: str
+    :param dtypes: a schema, True for the default schema of the endpoint or None for no schema
+    :type dtypes: DtypeSchema | bool
+    :rtype: DtypeSchema
+    """
+    if isinstance(dtypes, DtypeSchema) or not dtypes:
+        return dtypes or None
+    return DEFAULT_SCHEMAS.get(endpoint.split("/")[0], DtypeSchema(infer_categories=0.5))
+
+
+def concat(frames):
+    """
+    Concatenates data frames as pandas.concat but keeping categoricals as such when their categories differ
+    between frames, ie: their categories are unified first.
+
+    :type frames: list
+    :rtype: pd.DataFrame
+    """
+    frames = list(frames)
+    categories = {}
+    for df in frames:
+        for column in df.columns:
+            if _is_categorical(df[column]):
+                categories.setdefault(column, [])
+    for column, values in categories.items():
+        seen = set()
+        for df in frames:
+            if column in df.columns:
+                series = df[column]
+                for value in series.cat.categories if _is_categorical(series) else series.dropna().unique():
+                    if value not in seen:
+                        seen.add(value)
+                        values.append(value)
+    dtypes = dict((c, pd.api.types.CategoricalDtype(v)) for c, v in categories.items())
+    # a single copy of every frame with categoricals to unify
+    frames = [df.astype(dict((c, d) for c, d in dtypes.items() if c in df.columns and df[c].dtype != d))
+              if any(c in df.columns for c in dtypes) else df for df in frames]
+    return pd.concat(frames)
+
+
+def _is_categorical(series):
+    return isinstance(series.dtype, pd.api.types.CategoricalDtype)
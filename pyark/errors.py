@@ -8,3 +8,7 @@ class CvaClientError(CvaError):
 
 class CvaServerError(CvaError):
     pass
+
+
+class CvaTimeoutError(CvaClientError):
+    pass
@@ -0,0 +1,275 @@
+import bisect
+import re
+
+
+class _Intervals(object):
+    """
+    The intervals of one chromosome as an implicit augmented interval tree: intervals sorted by start in flat
+    lists where the node at index i of level k covers the indices [i - 2^k + 1, i + 2^k - 1] and holds the
+    greatest end in its subtree. Overlap queries are O(log n + k) where k is the number of hits.
+    Coordinates are half open, ie: [start, end).
+    """
+
+    # subtrees at or below this level are scanned linearly
+    _SCAN_LEVEL = 3
+
+    def __init__(self):
+        self._pending = []
+        self.starts = []
+        self.ends = []
+        self.items = []
+        self._max_ends = []
+        self._prefix_max = []
+        self._max_level = -1
+
+    def __len__(self):
+        return len(self.starts) + len(self._pending)
+
+    def add(self, start, end, item):
+        self._pending.append((start, end, item))
+
+    def build(self):
+        if not self._pending:
+            return
+        intervals = sorted(list(zip(self.starts, self.ends, self.items)) + self._pending, key=lambda i: i[:2])
+        self._pending = []
+        self.starts = [i[0] for i in intervals]
+        self.ends = [i[1] for i in intervals]
+        self.items = [i[2] for i in intervals]
+        self._build_tree()
+        # the position of the greatest end so far, resolves nearest queries to the left
+        self._prefix_max = []
+        best = 0
+        for i, end in enumerate(self.ends):
+            if end > self.ends[best]:
+                best = i
+            self._prefix_max.append(best)
+
+    def _build_tree(self):
+        n = len(self.starts)
+        ends = self.ends
+        max_ends = list(ends)
+        last_i = 0
+        last = 0
+        for i in range(0, n, 2):
+            last_i, last = i, ends[i]
+        k = 1
+        while (1 << k) <= n:
+            x = 1 << (k - 1)
+            for i in range((x << 1) - 1, n, x << 2):
+                right = max_ends[i + x] if i + x < n else last
+                max_ends[i] = max(ends[i], max_ends[i - x], right)
+            last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+            if last_i < n and max_ends[last_i] > last:
+                last = max_ends[last_i]
+            k += 1
+        self._max_ends = max_ends
+        self._max_level = k - 1
+
+    def overlaps(self, start, end):
+        """
+        :return: the indices of the intervals overlapping [start, end) in order of start
+        :rtype: list
+        """
+        self.build()
+        n = len(self.starts)
+        starts, ends, max_ends = self.starts, self.ends, self._max_ends
+        hits = []
+        if n == 0:
+            return hits
+        stack = [(self._max_level, (1 << self._max_level) - 1, False)]
+        while stack:
+            k, x, left_done = stack.pop()
+            if k <= self._SCAN_LEVEL:
+                i0 = x >> k << k
+                for i in range(i0, min(i0 + (1 << (k + 1)) - 1, n)):
+                    if starts[i] >= end:
+                        break
+                    if start < ends[i]:
+                        hits.append(i)
+            elif not left_done:
+                y = x - (1 << (k - 1))
+                stack.append((k, x, True))
+                if y >= n or max_ends[y] > start:
+                    stack.append((k - 1, y, False))
+            elif x < n and starts[x] < end:
+                if start < ends[x]:
+                    hits.append(x)
+                stack.append((k - 1, x + (1 << (k - 1)), False))
+        return sorted(hits)
+
+    def nearest(self, position):
+        """
+        :return: the index of the interval closest to the position and its distance
+        :rtype: tuple
+        """
+        hits = self.overlaps(position, position + 1)
+        if hits:
+            return hits[0], 0
+        candidates = []
+        right = bisect.bisect_right(self.starts, position)
+        if right > 0:
+            left = self._prefix_max[right - 1]
+            candidates.append((position - self.ends[left] + 1, left))
+        if right < len(self.starts):
+            candidates.append((self.starts[right] - position, right))
+        if not candidates:
+            return None, None
+        distance, index = min(candidates)
+        return index, distance
+
+
+class GenomicIntervalIndex(object):
+    """
+    An index of variants and report events by their genomic coordinates to resolve region queries locally,
+    eg: the variants overlapping a gene or the regions of a panel.
+    Intervals are keyed by assembly and chromosome, positions are 1-based and intervals closed as in CVA.
+    A small variant spans the bases of its reference allele and a structural variant from its start to its end.
+    Every representation of a variant is indexed so the same variant can be queried in GRCh37 and GRCh38.
+    Overlap queries take O(log n + k) time and nearest queries O(log n), eg:
+
+        index = GenomicIntervalIndex(variants_client.get_variants(genes="BRCA2", include_all=True))
+        index.overlaps("GRCh38", "13", 32315086, 32400268)
+        index.find("GRCh38:13:32315086-32400268")
+
+    :param items: variants or report events as dictionaries or models, eg: the output of `get_variants` or
+    `get_report_events`
+    :type items: iterable
+    """
+
+    _REGION = re.compile(r'^(?P<assembly>[^:]+):(?P<chromosome>[^:]+):(?P<start>[0-9]+)(-(?P<end>[0-9]+))?$')
+
+    def __init__(self, items=None):
+        self._chromosomes = {}
+        if items is not None:
+            self.extend(items)
+
+    def __len__(self):
+        return sum(len(intervals) for intervals in self._chromosomes.values())
+
+    def extend(self, items):
+        """
+        :type items: iterable
+        """
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """
+        Indexes a variant or a report event by the coordinates of all its variant representations
+
+        :param item: a variant or a report event as a dictionary or a model
+        :return: the number of intervals added
+        :rtype: int
+        """
+        document = item if isinstance(item, dict) else item.toJsonDict()
+        added = 0
+        for assembly, chromosome, start, end in self._get_intervals(document):
+            self.add_interval(assembly, chromosome, start, end, item)
+            added += 1
+        return added
+
+    def add_interval(self, assembly, chromosome, start, end, item):
+        """
+        :type assembly: str
+        :type chromosome: str
+        :param start: 1-based first position
+        :type start: int
+        :param end: 1-based last position, inclusive
+        :type end: int
+        :param item: any object returned by the queries
+        """
+        key = (str(assembly), str(chromosome))
+        intervals = self._chromosomes.get(key)
+        if intervals is None:
+            intervals = self._chromosomes[key] = _Intervals()
+        intervals.add(int(start), max(int(start), int(end)) + 1, item)
+
+    def overlaps(self, assembly, chromosome, start, end=None):
+        """
+        :type assembly: str
+        :type chromosome: str
+        :type start: int
+        :param end: the last position of the region, inclusive, a single position when not provided
+        :type end: int
+        :return: the items overlapping the region in order of start
+        :rtype: list
+        """
+        intervals = self._chromosomes.get((str(assembly), str(chromosome)))
+        if intervals is None:
+            return []
+        end = start if end is None else end
+        return self._unique(intervals.items[i] for i in intervals.overlaps(int(start), int(end) + 1))
+
+    def find(self, region):
+        """
+        :param region: a region as in {assembly}:{chromosome}:{start}-{end} or {assembly}:{chromosome}:{position}
+        :type region: str
+        :rtype: list
+        """
+        match = self._REGION.match(region)
+        if not match:
+            raise ValueError("Invalid region '{}'".format(region))
+        return self.overlaps(match.group('assembly'), match.group('chromosome'), int(match.group('start')),
+                             int(match.group('end')) if match.group('end') else None)
+
+    def nearest(self, assembly, chromosome, position):
+        """
+        :type assembly: str
+        :type chromosome: str
+        :type position: int
+        :return: the item closest to the position and its distance in bases, 0 when overlapping,
+        (None, None) if nothing is indexed in the chromosome
+        :rtype: tuple
+        """
+        intervals = self._chromosomes.get((str(assembly), str(chromosome)))
+        if intervals is None:
+            return None, None
+        index, distance = intervals.nearest(int(position))
+        if index is None:
+            return None, None
+        return intervals.items[index], distance
+
+    def build(self):
+        """
+        Sorts and indexes the intervals added since the last query, queries do it on demand
+        """
+        for intervals in self._chromosomes.values():
+            intervals.build()
+
+    @staticmethod
+    def _unique(items):
+        seen = set()
+        unique = []
+        for item in items:
+            if id(item) not in seen:
+                seen.add(id(item))
+                unique.append(item)
+        return unique
+
+    @staticmethod
+    def _get_intervals(document):
+        variants = []
+        if document.get('variants') is not None:
+            variants.append(document)
+        if document.get('variant'):
+            variants.append(document['variant'])
+        for observed_variant in document.get('observedVariants') or []:
+            if observed_variant.get('variant'):
+                variants.append(observed_variant['variant'])
+        seen = set()
+        for variant in variants:
+            for representation in variant.get('variants') or []:
+                small = representation.get('smallVariantCoordinates')
+                structural = representation.get('structuralVariantCoordinates')
+                if small:
+                    interval = (small['assembly'], small['chromosome'], small['position'],
+                                small['position'] + max(len(small.get('reference') or ""), 1) - 1)
+                elif structural:
+                    interval = (structural['assembly'], structural['chromosome'], structural['start'],
+                                structural['end'])
+                else:
+                    continue
+                if interval not in seen:
+                    seen.add(interval)
+                    yield interval
@@ -0,0 +1,69 @@
+import importlib
+
+
+class LazyModule(object):
+    """
+    A proxy to a module that is only imported on first attribute access.
+    pandas and the GEL report models take seconds to import, deferring them keeps short lived jobs that never
+    build a data frame or a model fast to start.
+
+    :param name: the full name of the module
+    :param error_message: the message of the ImportError raised when the module is not installed
+    """
+
+    def __init__(self, name, error_message=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_error_message'] = error_message
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            try:
+                module = importlib.import_module(self.__dict__['_name'])
+            except ImportError as ex:
+                if self.__dict__['_error_message']:
+                    raise ImportError("{} ({})".format(self.__dict__['_error_message'], ex))
+                raise
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self.__dict__['_name'])
+
+
+PANDAS_ERROR = "Pandas is not installed which will mean as_data_frame=True will not work. " \
+               "If you want to install this do 'pip install clinical-variant-ark[pandas]'"
+
+pandas = LazyModule("pandas", PANDAS_ERROR)
+numpy = LazyModule("numpy", PANDAS_ERROR)
+PARQUET_ERROR = "pyarrow is not installed which is required to write Parquet files. " \
+                "If you want to install this do 'pip install clinical-variant-ark[parquet]'"
+pyarrow = LazyModule("pyarrow", PARQUET_ERROR)
+parquet = LazyModule("pyarrow.parquet", PARQUET_ERROR)
+POLARS_ERROR = "polars is not installed which is required by as_polars=True. " \
+               "If you want to install this do 'pip install clinical-variant-ark[polars]'"
+polars = LazyModule("polars", POLARS_ERROR)
+HTTP2_ERROR = "httpx is not installed which is required by the HTTP/2 transport. " \
+              "If you want to install this do 'pip install clinical-variant-ark[http2]'"
+httpx = LazyModule("httpx", HTTP2_ERROR)
+# GEL report models for CVA
+cva_models = LazyModule("protocols.protocol_7_3.cva")
+wrappers = LazyModule("pyark.models.wrappers")
+
+
+def json_normalize(*args, **kwargs):
+    """
+    pandas json_normalize imported on first use
+    """
+    normalize = getattr(pandas, "json_normalize", None)
+    if normalize is None:
+        # pandas < 1.0 only exposes it under pandas.io.json
+        normalize = importlib.import_module("pandas.io.json").json_normalize
+    return normalize(*args, **kwargs)
@@ -0,0 +1,216 @@
+import re
+import bisect
+import threading
+from future.standard_library import install_aliases
+install_aliases()
+
+
+# buckets in seconds for client side and server side latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NAMED_SEGMENT = re.compile(r'^[a-z][a-z\-]*$')
+
+
+def endpoint_label(endpoint):
+    """
+    Builds a low cardinality label for an endpoint by replacing any segment that is not a plain resource name
+    (eg: identifiers, versions, variant ids) by a placeholder.
+    eg: ["cases", "SAP-1234", 1, "similar-cases"] -> "cases/{id}/{id}/similar-cases"
+
+    :type endpoint: str | list
+    :rtype: str
+    """
+    if isinstance(endpoint, (list, tuple)):
+        segments = [str(s) for s in endpoint]
+    else:
+        segments = str(endpoint).split("/")
+    return "/".join([s if _NAMED_SEGMENT.match(s) else "{id}" for s in segments if s != ""])
+
+
+class _Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry(object):
+    """
+    A thread safe registry of counters and histograms labelled by method and endpoint.
+    It can be dumped into a dictionary or exposed in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def inc(self, name, value=1, help=None, **labels):
+        """
+        :type name: str
+        :type value: int | float
+        :type help: str
+        :type labels: dict
+        """
+        key = (name, self._labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if help:
+                self._help[name] = help
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help=None, **labels):
+        """
+        :type name: str
+        :type value: int | float
+        :type buckets: tuple
+        :type help: str
+        :type labels: dict
+        """
+        key = (name, self._labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = _Histogram(buckets)
+                self._histograms[key] = histogram
+            histogram.observe(value)
+            if help:
+                self._help[name] = help
+
+    def get(self, name, **labels):
+        """
+        Returns the value of a counter or the number of observations of a histogram
+
+        :type name: str
+        :type labels: dict
+        :rtype: int | float
+        """
+        key = (name, self._labels_key(labels))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key].count
+            return self._counters.get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def dump(self):
+        """
+        :return: all metrics as a dictionary of metric name to a list of labelled values
+        :rtype: dict
+        """
+        dumped = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                dumped.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                dumped.setdefault(name, []).append({
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': dict(zip([str(b) for b in histogram.buckets] + ['+Inf'],
+                                        self._cumulative(histogram.counts)))
+                })
+        return dumped
+
+    def to_prometheus(self):
+        """
+        :return: all metrics in the Prometheus text exposition format
+        :rtype: str
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(set(n for n, _ in self._counters)):
+                self._add_header(lines, name, "counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append("{}{} {}".format(name, self._format_labels(labels), value))
+            for name in sorted(set(n for n, _ in self._histograms)):
+                self._add_header(lines, name, "histogram")
+                for (n, labels), histogram in sorted(self._histograms.items()):
+                    if n != name:
+                        continue
+                    cumulative = self._cumulative(histogram.counts)
+                    for bucket, count in zip(list(histogram.buckets) + ["+Inf"], cumulative):
+                        lines.append("{}_bucket{} {}".format(
+                            name, self._format_labels(labels + (('le', str(bucket)),)), count))
+                    lines.append("{}_sum{} {}".format(name, self._format_labels(labels), histogram.sum))
+                    lines.append("{}_count{} {}".format(name, self._format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Writes the metrics in Prometheus text format, eg: to be collected by the node exporter textfile collector
+
+        :type path: str
+        """
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+
+    def start_http_server(self, port, host=""):
+        """
+        Serves the metrics in Prometheus text format on a background thread so they can be scraped
+
+        :type port: int
+        :type host: str
+        :rtype: http.server.HTTPServer
+        """
+        import http.server
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def _add_header(self, lines, name, metric_type):
+        if name in self._help:
+            lines.append("# HELP {} {}".format(name, self._help[name]))
+        lines.append("# TYPE {} {}".format(name, metric_type))
+
+    @staticmethod
+    def _labels_key(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in labels) + "}"
+
+    @staticmethod
+    def _cumulative(counts):
+        cumulative = []
+        total = 0
+        for c in counts:
+            total += c
+            cumulative.append(total)
+        return cumulative
+
+
+# default registry shared by all clients unless one is explicitly provided
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,77 @@
+PAGE_SIZE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class AdaptivePageSize(object):
+    """
+    Adapts the page size of a paginated query between pages to reach a target response time and/or a target
+    response size, pass it as the `page_size` of any paginated query, eg:
+
+        cases_client.get_cases_ids(page_size=AdaptivePageSize(target_seconds=1.0))
+        report_events_client.get_report_events(page_size=AdaptivePageSize(target_bytes=5 * 1024 * 1024))
+
+    Small latency bound pages grow and large pages at risk of timing out shrink. The next size is proportional
+    to the ratio between the target and the last observation, it changes at most by `max_factor` in a page and
+    it is kept within the bounds. When both targets are set the smaller size wins. The same instance can be
+    reused across queries to start from the size learnt.
+
+    :param target_seconds: the target time to receive a page
+    :type target_seconds: float
+    :param target_bytes: the target size of a page in bytes
+    :type target_bytes: int
+    :param min_size: the minimum page size
+    :type min_size: int
+    :param max_size: the maximum page size
+    :type max_size: int
+    :param initial_size: the size of the first page
+    :type initial_size: int
+    :param max_factor: the maximum growth or shrink factor between pages
+    :type max_factor: float
+    """
+
+    def __init__(self, target_seconds=None, target_bytes=None, min_size=10, max_size=5000, initial_size=100,
+                 max_factor=2.0):
+        if target_seconds is None and target_bytes is None:
+            raise ValueError("Adaptive page size needs a target response time or size")
+        if not 0 < min_size <= max_size:
+            raise ValueError("Invalid page size bounds [{}, {}]".format(min_size, max_size))
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_factor = max_factor
+        self.size = self._bound(initial_size)
+
+    def update(self, results, seconds, response_bytes):
+        """
+        Chooses the size of the next page from the last page
+
+        :param results: the number of results in the last page
+        :type results: int
+        :param seconds: the time to receive the last page
+        :type seconds: float
+        :param response_bytes: the size of the last page in bytes
+        :type response_bytes: int
+        :return: the size of the next page
+        :rtype: int
+        """
+        if results <= 0:
+            return self.size
+        proposals = []
+        if self.target_seconds is not None and seconds > 0:
+            proposals.append(results * self.target_seconds / seconds)
+        if self.target_bytes is not None and response_bytes > 0:
+            proposals.append(results * float(self.target_bytes) / response_bytes)
+        if proposals:
+            proposal = min(proposals)
+            proposal = max(self.size / self.max_factor, min(self.size * self.max_factor, proposal))
+            self.size = self._bound(int(round(proposal)))
+        return self.size
+
+    def _bound(self, size):
+        return max(self.min_size, min(self.max_size, size))
+
+    def __int__(self):
+        return self.size
+
+    def __repr__(self):
+        return "AdaptivePageSize(size={})".format(self.size)
@@ -0,0 +1,192 @@
+import logging
+import threading
+import timeit
+from contextlib import contextmanager
+
+
+HTTP_WAIT = "http_wait"
+JSON_DECODE = "json_decode"
+PARSE_RESULT = "parse_result"
+MODEL_CONSTRUCTION = "model_construction"
+JSON_NORMALIZE = "json_normalize"
+REINDEX = "reindex"
+DTYPES = "dtypes"
+
+PHASES = [HTTP_WAIT, JSON_DECODE, PARSE_RESULT, MODEL_CONSTRUCTION, JSON_NORMALIZE, REINDEX, DTYPES]
+
+_MB = 1024.0 * 1024.0
+
+# the profiler collecting timings, None when profiling is disabled
+_active = None
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self._profiler._add_time(self._name, timeit.default_timer() - self._start)
+        return False
+
+
+class Profiler(object):
+    """
+    Collects the time spent in every phase of fetching and rendering a page of results.
+    Timings are accumulated per thread into the current page until the page is closed by the paginator.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # every page with timings, including those not closed by a paginator (eg: single requests)
+        self._pages = []
+        self.start = timeit.default_timer()
+        self.end = None
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add_bytes(self, count):
+        self._current_page()['bytes'] += count
+
+    @property
+    def pages(self):
+        """
+        :return: the timings per phase, number of items and bytes of every page fetched by a paginator
+        :rtype: list
+        """
+        with self._lock:
+            return [page for page in self._pages if page['endpoint'] is not None]
+
+    def end_page(self, endpoint, items):
+        """
+        :type endpoint: str
+        :type items: int
+        """
+        page = self._current_page()
+        page['endpoint'] = endpoint
+        page['items'] = items
+        self._local.page = None
+        logging.debug("Page of {} items and {} bytes from {}: {}".format(
+            items, page['bytes'], endpoint,
+            ", ".join("{}={:.4f}s".format(name, seconds) for name, seconds in sorted(page['phases'].items()))))
+
+    def _add_time(self, name, elapsed):
+        phases = self._current_page()['phases']
+        phases[name] = phases.get(name, 0.0) + elapsed
+
+    def _current_page(self):
+        page = getattr(self._local, 'page', None)
+        if page is None:
+            page = {'endpoint': None, 'items': 0, 'bytes': 0, 'phases': {}}
+            self._local.page = page
+            with self._lock:
+                self._pages.append(page)
+        return page
+
+    def summary(self):
+        """
+        :return: the aggregated time per phase, the number of pages, items and bytes and the throughput
+        :rtype: dict
+        """
+        with self._lock:
+            pages = list(self._pages)
+        elapsed = (self.end or timeit.default_timer()) - self.start
+        phases = dict((p, 0.0) for p in PHASES)
+        for page in pages:
+            for name, seconds in page['phases'].items():
+                phases[name] = phases.get(name, 0.0) + seconds
+        items = sum(page['items'] for page in pages)
+        total_bytes = sum(page['bytes'] for page in pages)
+        return {
+            'pages': len([page for page in pages if page['endpoint'] is not None]),
+            'items': items,
+            'bytes': total_bytes,
+            'elapsed': elapsed,
+            'phases': phases,
+            'other': max(elapsed - sum(phases.values()), 0.0),
+            'items_per_second': items / elapsed if elapsed > 0 else 0.0,
+            'mb_per_second': total_bytes / _MB / elapsed if elapsed > 0 else 0.0
+        }
+
+    def report(self):
+        """
+        :return: a human readable breakdown of the time per phase
+        :rtype: str
+        """
+        summary = self.summary()
+        elapsed = summary['elapsed']
+        lines = ["Profiled {} pages, {} items, {:.2f} MB in {:.3f} s ({:.1f} items/s, {:.2f} MB/s)".format(
+            summary['pages'], summary['items'], summary['bytes'] / _MB, elapsed,
+            summary['items_per_second'], summary['mb_per_second'])]
+        for name, seconds in [(p, summary['phases'][p]) for p in PHASES] + [("other", summary['other'])]:
+            lines.append("  {:<20}{:>10.3f} s {:>6.1f} %".format(
+                name, seconds, 100.0 * seconds / elapsed if elapsed > 0 else 0.0))
+        return "\n".join(lines)
+
+
+def phase(name):
+    """
+    Times a block of code into the given phase of the active profiler, if any.
+
+    :type name: str
+    """
+    profiler = _active
+    return profiler.phase(name) if profiler is not None else _NULL_PHASE
+
+
+def add_bytes(count):
+    profiler = _active
+    if profiler is not None:
+        profiler.add_bytes(count)
+
+
+def end_page(endpoint, items):
+    profiler = _active
+    if profiler is not None:
+        profiler.end_page(endpoint, items)
+
+
+@contextmanager
+def profile(log=True):
+    """
+    Enables profiling of all clients while in the context, eg:
+
+        with profiling.profile() as profiler:
+            df = pd.concat(report_events_client.get_report_events(as_data_frame=True, max_results=1000))
+        print(profiler.report())
+
+    :param log: logs the per page throughput and the final report
+    :type log: bool
+    :rtype: Profiler
+    """
+    global _active
+    previous = _active
+    profiler = Profiler()
+    _active = profiler
+    try:
+        yield profiler
+    finally:
+        profiler.end = timeit.default_timer()
+        _active = previous
+        if log:
+            logging.info(profiler.report())
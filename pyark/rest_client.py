@@ -1,9 +1,15 @@
 import logging
+import threading
 import requests
 import datetime
+import timeit
 import abc
 from furl import furl
 import pyark.backoff_retrier as backoff_retrier
+import pyark.metrics as metrics
+import pyark.profiling as profiling
+import pyark.timeouts as timeouts
+import pyark.transports as transports
 from pyark.errors import CvaServerError, CvaClientError
 
 
@@ -11,18 +17,25 @@ class RestClient(object):
 
     _session = requests.Session()
 
-    def __init__(self, url_base, endpoint_base=None, retries=5):
+    def __init__(self, url_base, endpoint_base=None, retries=5, metrics_registry=None, transport=None,
+                 timeout=timeouts.DEFAULT_TIMEOUT):
         self._url_base = url_base
+        # seconds or a pair of connect and read timeouts in seconds, None waits forever
+        self._timeout = timeout
         self._endpoint_base = endpoint_base
         self._headers = {
             'Accept': 'application/json'
         }
         self._token = None
         self._renewed_token = False
+        self._metrics = metrics_registry if metrics_registry is not None else metrics.REGISTRY
+        self._transport = transport if transport is not None else transports.RequestsTransport(self._session)
+        # the latency and size of the last response received by every thread
+        self._last_exchange = threading.local()
         # decorates the REST verbs with retries
-        self._get = backoff_retrier.wrapper(self._get, retries)
-        self._post = backoff_retrier.wrapper(self._post, retries)
-        self._delete = backoff_retrier.wrapper(self._delete, retries)
+        self._get = backoff_retrier.wrapper(self._get, retries, on_retry=self._retry_recorder("GET"))
+        self._post = backoff_retrier.wrapper(self._post, retries, on_retry=self._retry_recorder("POST"))
+        self._delete = backoff_retrier.wrapper(self._delete, retries, on_retry=self._retry_recorder("DELETE"))
 
     def _build_url(self, endpoint):
         f = furl(self._url_base)
@@ -41,65 +54,116 @@ class RestClient(object):
     def _set_authenticated_header(self, renew_token=False):
         if not self._token or renew_token:
             self._token = self._get_token()
+            if renew_token:
+                self._metrics.inc("pyark_token_renewals_total", help="Number of renewed authentication tokens")
         self._headers["Authorization"] = "{token}".format(token=self._token)
 
     @abc.abstractmethod
     def _get_token(self):
         raise ValueError("Not implemented")
 
-    def _post(self, endpoint, payload, session=True, verify=True, **params):
+    def _post(self, endpoint, payload, session=True, verify=True, timeout=None, deadline=None, **params):
         if endpoint is None or payload is None:
             raise ValueError("Must define payload and endpoint before post")
         url = self._build_url(endpoint)
-        if session:
-            response = self._session.post(url, json=payload, params=params, headers=self._headers)
-        else:
-            response = requests.post(url, json=payload, params=params, headers=self._headers)
+        response = self._send("POST", endpoint, url, session, timeout=timeout, deadline=deadline, json=payload,
+                              params=params)
         request = "{method} {url}".format(
             method="POST", url="{}?{}".format(url, "&".join(RestClient._build_parameters(params))))
         logging.info(request)
         if verify:
             self._verify_response(response, request)
-        return response.json(), dict(response.headers)
+        return self._decode(response), dict(response.headers)
 
-    def _get(self, endpoint, session=True, **params):
+    def _get(self, endpoint, session=True, timeout=None, deadline=None, **params):
         if endpoint is None:
             raise ValueError("Must define endpoint before get")
         url = self._build_url(endpoint)
-        if session:
-            response = self._session.get(url, params=params, headers=self._headers)
-        else:
-            response = requests.get(url, params=params, headers=self._headers)
+        response = self._send("GET", endpoint, url, session, timeout=timeout, deadline=deadline, params=params)
         request = "{method} {url}".format(
             method="GET", url="{}?{}".format(url, "&".join(RestClient._build_parameters(params))))
         logging.info(request)
         self._verify_response(response, request)
-        return response.json(), dict(response.headers)
+        return self._decode(response), dict(response.headers)
 
-    def _patch(self, endpoint, session=True, **params):
+    def _patch(self, endpoint, session=True, timeout=None, deadline=None, **params):
         if endpoint is None:
             raise ValueError("Must define endpoint before patch")
         url = self._build_url(endpoint)
-        if session:
-            response = self._session.patch(url, params=params, headers=self._headers)
-        else:
-            response = requests.patch(url, params=params, headers=self._headers)
+        response = self._send("PATCH", endpoint, url, session, timeout=timeout, deadline=deadline, params=params)
         request = "{method} {url}".format(
             method="PATCH", url="{}?{}".format(url, "&".join(RestClient._build_parameters(params))))
         logging.info(request)
         self._verify_response(response, request)
-        return response.json(), dict(response.headers)
+        return self._decode(response), dict(response.headers)
 
-    def _delete(self, endpoint, **params):
+    def _delete(self, endpoint, timeout=None, deadline=None, **params):
         if endpoint is None:
             raise ValueError("Must define endpoint before get")
         url = self._build_url(endpoint)
-        response = self._session.delete(url, params=params, headers=self._headers)
+        response = self._send("DELETE", endpoint, url, True, timeout=timeout, deadline=deadline, params=params)
         request = "{method} {url}".format(
             method="DELETE", url="{}?{}".format(url, "&".join(RestClient._build_parameters(params))))
         logging.info(request)
         self._verify_response(response, request)
-        return response.json(), dict(response.headers)
+        return self._decode(response), dict(response.headers)
+
+    def _send(self, method, endpoint, url, session=True, timeout=None, deadline=None, **kwargs):
+        timeout = timeout if timeout is not None else self._timeout
+        deadline = timeouts.Deadline.of(deadline)
+        if deadline is not None:
+            # raised outside of the retried exceptions, an expired operation is not retried
+            deadline.check("{} {}".format(method, url))
+            timeout = deadline.cap(timeout)
+        with profiling.phase(profiling.HTTP_WAIT):
+            start = timeit.default_timer()
+            try:
+                response = self._transport.send(
+                    method, url, session=session, headers=self._headers, timeout=timeout, **kwargs)
+            except requests.exceptions.Timeout:
+                # a request cut short by the deadline fails the operation instead of being retried
+                if deadline is not None:
+                    deadline.check("{} {}".format(method, url))
+                raise
+            elapsed = timeit.default_timer() - start
+        self._record_response(method, endpoint, response, elapsed)
+        return response
+
+    @staticmethod
+    def _decode(response):
+        with profiling.phase(profiling.JSON_DECODE):
+            return response.json()
+
+    def _record_response(self, method, endpoint, response, elapsed):
+        label = metrics.endpoint_label(endpoint)
+        self._metrics.observe("pyark_request_latency_seconds", elapsed,
+                              help="Client side latency of requests in seconds", method=method, endpoint=label)
+        self._metrics.inc("pyark_responses_total", help="Number of responses by status code",
+                          method=method, endpoint=label, status=response.status_code)
+        request = getattr(response, "request", None)
+        body = getattr(request, "body", None)
+        self._metrics.inc("pyark_request_bytes_total", len(body) if body else 0,
+                          help="Bytes sent in request bodies", method=method, endpoint=label)
+        content = getattr(response, "content", None)
+        response_bytes = len(content) if content else 0
+        self._last_exchange.seconds = elapsed
+        self._last_exchange.bytes = response_bytes
+        self._metrics.inc("pyark_response_bytes_total", response_bytes,
+                          help="Bytes received in response bodies", method=method, endpoint=label)
+        profiling.add_bytes(response_bytes)
+
+    def _retry_recorder(self, method):
+        def record_retry(endpoint=None, *args, **kwargs):
+            self._metrics.inc("pyark_retries_total", help="Number of retried requests",
+                              method=method, endpoint=metrics.endpoint_label(endpoint))
+        return record_retry
+
+    def metrics(self):
+        """
+        :return: the registry where this client records its metrics
+        :rtype: pyark.metrics.MetricsRegistry
+        """
+        return self._metrics
 
     @staticmethod
     def _build_parameters(params):
@@ -0,0 +1,369 @@
+import errno
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
+
+from pyark.checkpoint import export_to_file
+from pyark.errors import CvaClientError
+
+
+# the paginated queries that can be exported by entity
+ENTITIES = {
+    'cases': ('cases', 'get_cases'),
+    'report_events': ('report_events', 'get_report_events'),
+    'variants': ('variants', 'get_variants')
+}
+
+
+class ShardedExport(object):
+    """
+    Splits an export of cases, report events or variants into shards that any number of nodes export in
+    parallel, coordinated through a shared directory with no other service. The directory holds:
+
+    * `plan.json`: the work plan, ie: the query and the filters of every shard
+    * `{shard}.jsonl` and `{shard}.jsonl.checkpoint`: the output of a shard as JSON lines and its checkpoint
+    * `{shard}.claim`: the node exporting a shard and a token of its claim, created atomically so a shard is only
+      claimed once
+    * `{shard}.done`: the number of items exported once a shard completes
+
+    eg: one node writes the plan, every node runs the export and any node merges the outputs at the end
+
+        export = ShardedExport("/shared/export")
+        export.plan("cases", [('program', ['rare_disease', 'cancer']), ('assembly', ['GRCh37', 'GRCh38'])])
+        export.run(cva, threads=4)
+        export.merge("/shared/cases.jsonl")
+
+    A shard whose node died is claimed again after `claim_timeout` seconds and it resumes from its checkpoint, the
+    claims of live nodes are refreshed in the background so they never expire. A shard whose export failed is
+    released so that any node can export it again, and a node running again claims back its own claims left behind.
+
+    :param directory: the shared directory
+    :type directory: str
+    :param node: the name of this node, by default the host name and process id
+    :type node: str
+    :param claim_timeout: seconds after which the claim of an unfinished shard expires, None never expires
+    :type claim_timeout: float
+    """
+
+    PLAN_FILE = "plan.json"
+
+    # a takeover only renames a claim away and creates a new one, a takeover lock older than this was left behind
+    # by a node that died taking over
+    _TAKEOVER_TIMEOUT = 60
+
+    def __init__(self, directory, node=None, claim_timeout=None):
+        self.directory = directory
+        self.node = node or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.claim_timeout = claim_timeout
+        # the tokens of the claims held by the threads of this node
+        self._claims = {}
+        self._lock = threading.Lock()
+
+    def plan(self, entity, shards, **params):
+        """
+        Writes the work plan with one shard per combination of the values of the shard filters. The filters must
+        split the query into disjoint subsets covering all results, eg: every program or every chromosome.
+
+        :param entity: one of cases, report_events or variants
+        :type entity: str
+        :param shards: the filters and their values as a list of pairs or a dictionary
+        :type shards: list | dict
+        :param params: the query shared by all shards
+        :type params: dict
+        :return: the plan
+        :rtype: dict
+        """
+        if entity not in ENTITIES:
+            raise ValueError("Cannot export '{}', supported entities are {}".format(entity, sorted(ENTITIES)))
+        shards = list(shards.items()) if isinstance(shards, dict) else list(shards)
+        fields = [f for f, _ in shards]
+        overlap = set(fields).intersection(params)
+        if overlap:
+            raise ValueError("Filters {} cannot be used both to shard and in the query".format(sorted(overlap)))
+        plan = {
+            'entity': entity,
+            'params': params,
+            'shards': [{'id': "shard-{:05d}".format(i), 'params': dict(zip(fields, values))}
+                       for i, values in enumerate(itertools.product(*[list(v) for _, v in shards]))]
+        }
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if os.path.exists(self._path(self.PLAN_FILE)):
+            raise CvaClientError("There is already a plan in {}".format(self.directory))
+        temporary = self._path("{}.tmp".format(self.PLAN_FILE))
+        with io.open(temporary, "w", encoding="utf-8") as f:
+            f.write(json.dumps(plan, indent=2, sort_keys=True, default=str))
+        os.rename(temporary, self._path(self.PLAN_FILE))
+        logging.info("Planned {} shards in {}".format(len(plan['shards']), self.directory))
+        return plan
+
+    def load_plan(self):
+        """
+        :rtype: dict
+        """
+        with io.open(self._path(self.PLAN_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def run(self, cva, threads=1):
+        """
+        Claims and exports shards until none is left, several threads export shards concurrently.
+        Every node of the export calls this method.
+
+        :type cva: pyark.cva_client.CvaClient
+        :type threads: int
+        :return: the identifiers of the shards exported by this node
+        :rtype: list
+        """
+        plan = self.load_plan()
+        subclient, method = ENTITIES[plan['entity']]
+        query = getattr(getattr(cva, subclient)(), method)
+
+        def worker(_):
+            exported = []
+            for shard in plan['shards']:
+                token = self._claim(shard['id'])
+                if token is None:
+                    continue
+                heartbeat = _Heartbeat(self, shard['id'], token)
+                try:
+                    count = export_to_file(
+                        self._path("{}.jsonl".format(shard['id'])),
+                        lambda **p: heartbeat.guard(query(**p)),
+                        **dict(plan['params'], **shard['params']))
+                    heartbeat.stop()
+                    heartbeat.check()
+                    done = self._path("{}.done".format(shard['id']))
+                    with io.open("{}.tmp".format(done), "w", encoding="utf-8") as f:
+                        f.write(u"{}".format(count))
+                    os.rename("{}.tmp".format(done), done)
+                except Exception:
+                    heartbeat.stop()
+                    self._release(shard['id'], token)
+                    raise
+                with self._lock:
+                    self._claims.pop(shard['id'], None)
+                logging.info("Node {} exported {} items in {}".format(self.node, count, shard['id']))
+                exported.append(shard['id'])
+            return exported
+
+        pool = ThreadPool(processes=max(1, threads))
+        try:
+            exported = pool.map(worker, range(max(1, threads)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return sorted(itertools.chain.from_iterable(exported))
+
+    def status(self):
+        """
+        :return: the shards by state, ie: pending, claimed and done
+        :rtype: dict
+        """
+        status = {'pending': [], 'claimed': [], 'done': []}
+        for shard in self.load_plan()['shards']:
+            if os.path.exists(self._path("{}.done".format(shard['id']))):
+                status['done'].append(shard['id'])
+            elif os.path.exists(self._path("{}.claim".format(shard['id']))):
+                status['claimed'].append(shard['id'])
+            else:
+                status['pending'].append(shard['id'])
+        return status
+
+    def merge(self, output):
+        """
+        Concatenates the outputs of all shards in the order of the plan
+
+        :param output: the merged JSON lines file
+        :type output: str
+        :return: the number of items merged
+        :rtype: int
+        """
+        status = self.status()
+        if status['pending'] or status['claimed']:
+            raise CvaClientError("Cannot merge, {} shards are not done".format(
+                len(status['pending']) + len(status['claimed'])))
+        count = 0
+        with io.open(output, "wb") as merged:
+            for shard in self.load_plan()['shards']:
+                with io.open(self._path("{}.jsonl".format(shard['id'])), "rb") as f:
+                    shutil.copyfileobj(f, merged)
+                with io.open(self._path("{}.done".format(shard['id'])), "r", encoding="utf-8") as f:
+                    count += int(f.read())
+        return count
+
+    def _claim(self, shard_id):
+        """
+        :return: the token of the claim or None when the shard is done or claimed by another node
+        :rtype: str
+        """
+        if os.path.exists(self._path("{}.done".format(shard_id))):
+            return None
+        claim = self._path("{}.claim".format(shard_id))
+        # the threads of this node claim one at a time so they never take the claims of each other as left behind
+        with self._lock:
+            if os.path.exists(claim) and not self._take_over(shard_id, claim):
+                return None
+            token = "{} {}".format(self.node, uuid.uuid4().hex)
+            if not _create_exclusively(claim, token):
+                return None
+            self._claims[shard_id] = token
+            return token
+
+    def _take_over(self, shard_id, claim):
+        # takeovers are serialised by a lock file and the claim is checked again once moved away, so a live claim
+        # refreshed in between is put back instead of being taken over
+        takeover = "{}.takeover".format(claim)
+        if not self._is_stale(shard_id, claim):
+            return False
+        if _age(takeover) > self._TAKEOVER_TIMEOUT:
+            _remove(takeover)
+        if not _create_exclusively(takeover, self.node):
+            return False
+        try:
+            token = _read(claim)
+            if token is None:
+                return True
+            if not self._is_stale(shard_id, claim):
+                return False
+            moved = "{}.stale-{}".format(claim, uuid.uuid4().hex)
+            try:
+                os.rename(claim, moved)
+            except OSError:
+                # removed in between
+                return True
+            if _read(moved) != token or not self._is_stale(shard_id, moved):
+                logging.warning("Claim of {} was refreshed while taken over, putting it back".format(shard_id))
+                # fails if a new claim was created in between, then its owner finds out on its next refresh
+                _link(moved, claim)
+                return False
+            logging.warning("Claim of {} by {} was left behind, claiming it again".format(
+                shard_id, token.rsplit(" ", 1)[0]))
+            return True
+        finally:
+            _remove(takeover)
+
+    def _is_stale(self, shard_id, claim):
+        """
+        :return: whether the claim expired or it is a claim of this node that none of its threads holds, eg: the
+        export of the shard failed
+        :rtype: bool
+        """
+        if self.claim_timeout is not None and _age(claim) > self.claim_timeout:
+            return True
+        token = _read(claim)
+        return token is not None and token.rsplit(" ", 1)[0] == self.node and shard_id not in self._claims
+
+    def _refresh(self, shard_id, token):
+        """
+        :return: whether the claim is still held, ie: it has not been taken over
+        :rtype: bool
+        """
+        claim = self._path("{}.claim".format(shard_id))
+        if _read(claim) != token:
+            return False
+        os.utime(claim, None)
+        return True
+
+    def _release(self, shard_id, token):
+        claim = self._path("{}.claim".format(shard_id))
+        with self._lock:
+            self._claims.pop(shard_id, None)
+            if _read(claim) == token:
+                _remove(claim)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+
+class _Heartbeat(object):
+    """
+    Refreshes a claim from a background thread while its shard is exported, so that a slow page does not let the
+    claim expire. An export whose claim was taken over fails on its next item.
+    """
+
+    def __init__(self, export, shard_id, token):
+        self.shard_id = shard_id
+        self.lost = False
+        self._export = export
+        self._token = token
+        self._stopped = threading.Event()
+        self._thread = None
+        if export.claim_timeout is not None:
+            self._thread = threading.Thread(target=self._beat)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _beat(self):
+        interval = max(self._export.claim_timeout / 4.0, 0.1)
+        while not self._stopped.wait(interval):
+            try:
+                if not self._export._refresh(self.shard_id, self._token):
+                    self.lost = True
+                    return
+            except OSError as ex:
+                logging.warning("Cannot refresh the claim of {}: {}".format(self.shard_id, ex))
+
+    def guard(self, items):
+        for item in items:
+            self.check()
+            yield item
+
+    def check(self):
+        if self.lost:
+            raise CvaClientError("The claim of {} was taken over by another node".format(self.shard_id))
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _create_exclusively(path, content):
+    try:
+        descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError as ex:
+        if ex.errno == errno.EEXIST:
+            return False
+        raise
+    with os.fdopen(descriptor, "w") as f:
+        f.write(content)
+    return True
+
+
+def _read(path):
+    try:
+        with io.open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _link(source, destination):
+    try:
+        os.link(source, destination)
+        os.remove(source)
+    except (AttributeError, OSError):
+        # no hard links on this platform or the destination exists
+        pass
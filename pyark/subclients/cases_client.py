@@ -1,11 +1,11 @@
 import pyark.cva_client as cva_client
-from protocols.protocol_7_3.cva import ReportEventType, Transaction
+import pyark.timeouts as timeouts
+from pyark.lazy_import import cva_models
 import logging
-import pandas as pd
 
 
-REPORT_EVENT_TYPES = [ReportEventType.genomics_england_tiering, ReportEventType.candidate, ReportEventType.reported,
-                      ReportEventType.questionnaire]
+# NOTE: the values of ReportEventType, the models are not imported until a model is built
+REPORT_EVENT_TYPES = ["genomics_england_tiering", "candidate", "reported", "questionnaire"]
 
 
 class CasesClient(cva_client.CvaClient):
@@ -23,26 +23,47 @@ class CasesClient(cva_client.CvaClient):
         params['count'] = True
         return self.get_cases(**params)
 
-    def get_cases_ids(self, as_data_frame=False, max_results=None, **params):
+    def count_facets(self, facets, as_array=False, threads=None, fail_fast=False, **params):
+        """
+        Counts cases for every combination of the facet values as in `CvaClient._count_facets`, eg:
+        count_facets([('panelNames', panels), ('program', programs)])
+
+        :type facets: dict | list
+        :type as_array: bool
+        :type threads: int
+        :type fail_fast: bool
+        :type params: dict
+        :rtype: pd.DataFrame | tuple
+        """
+        return self._count_facets(facets, as_array=as_array, threads=threads, fail_fast=fail_fast, **params)
+
+    def get_cases_ids(self, as_data_frame=False, max_results=None, page_size=None, **params):
         """
         :type as_data_frame: bool
         :type max_results: int
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
         :type params: dict
         :rtype: generator
         """
         params['include'] = ["identifier", "version"]
         return self._paginate(
-            endpoint=self._BASE_ENDPOINT, as_data_frame=as_data_frame, max_results=max_results,
+            endpoint=self._BASE_ENDPOINT, as_data_frame=as_data_frame, max_results=max_results, page_size=page_size,
             transformer=lambda x: "{}-{}".format(x["identifier"], x["version"]), **params)
 
-    def get_cases(self, as_data_frame=False, max_results=None, include_all=True, **params):
+    def get_cases(self, as_data_frame=False, max_results=None, include_all=True, page_size=None, as_polars=False,
+                  **params):
         """
         :type as_data_frame: bool
         :type max_results: int
         :param include_all: use False for the default minimal representation of case, it will be faster
         :type include_all: bool
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
+        :param as_polars: returns a Polars DataFrame, or a LazyFrame as set by a PolarsOutput, instead of a generator
+        :type as_polars: bool | PolarsOutput
         :type params: dict
-        :rtype: generator
+        :rtype: generator | polars.DataFrame | polars.LazyFrame
         """
         if params.get('count', False):
             results, next_page_params = self._get(self._BASE_ENDPOINT, **params)
@@ -50,23 +71,55 @@ class CasesClient(cva_client.CvaClient):
         else:
             if include_all:
                 params['include'] = [self._INCLUDE_ALL]
+            if as_polars:
+                return self._collect_polars(as_polars, endpoint=self._BASE_ENDPOINT, max_results=max_results,
+                                            page_size=page_size, **params)
             return self._paginate(
-                endpoint=self._BASE_ENDPOINT, as_data_frame=as_data_frame, max_results=max_results, **params)
+                endpoint=self._BASE_ENDPOINT, as_data_frame=as_data_frame, max_results=max_results,
+                page_size=page_size, **params)
 
-    def get_summary(self, as_data_frame=False, params_list=[], **params):
+    def sync_cases(self, store, watermark_field="lastModifiedDate", **params):
+        """
+        Incrementally syncs the cases created or modified since the last sync into a local store
+
+        :type store: pyark.case_store.CaseStore
+        :type watermark_field: str
+        :type params: dict
+        :return: the number of cases fetched
+        :rtype: int
+        """
+        return store.sync(self, watermark_field=watermark_field, **params)
+
+    def get_summary(self, as_data_frame=False, params_list=[], threads=None, fail_fast=False, timeout=None,
+                    deadline=None, **params):
         """
         :type as_data_frame: bool
+        :param params_list: a list of queries run concurrently, identical queries are only run once and results
+        are returned in the same order
         :type params_list: list
+        :param threads: the maximum number of concurrent queries, by default the threads of the client
+        :type threads: int
+        :param fail_fast: raises on the first failed query, otherwise failed queries are logged and skipped
+        :type fail_fast: bool
+        :param timeout: the timeout of every request, by default the timeout of the client
+        :type timeout: float | tuple
+        :param deadline: the maximum seconds to run all queries, queries not run by then fail
+        :type deadline: float
         :rtype: dict | pd.DataFrame
         """
+        deadline = timeouts.Deadline.of(deadline)
         if params_list:
             self._params_sanity_checks(params_list)
-            for p in params_list:
-                p.update(params)
-            results_list = [self.get_summary(as_data_frame=as_data_frame, **p) for p in params_list]
+            queries = [dict(p, **params) for p in params_list]
+            results_list = self.run_deduplicated_requests(
+                lambda p: self.get_summary(as_data_frame=as_data_frame, timeout=timeout, deadline=deadline, **p),
+                queries, threads=threads or self._threads, fail_fast=fail_fast)
+            if as_data_frame:
+                results_list = [r for r in results_list if r is not None]
             return self._render_multiple_results(results_list, as_data_frame=as_data_frame)
         else:
-            results, _ = self._get("{endpoint}/summary".format(endpoint=self._BASE_ENDPOINT), **params)
+            results, _ = self._get("{endpoint}/summary".format(endpoint=self._BASE_ENDPOINT), timeout=timeout,
+                                   deadline=deadline, **params)
             if not results:
                 logging.warning("No summary found")
                 return None
@@ -79,7 +132,7 @@ class CasesClient(cva_client.CvaClient):
         )
         results, _ = self._delete(path)
         result = self._render_single_result(results)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     @staticmethod
     def _params_sanity_checks(params_list):
@@ -192,15 +245,19 @@ class CasesClient(cva_client.CvaClient):
             return None
         return results
 
-    def get_shared_variants_counts(self, variant_ids, **params):
+    def get_shared_variants_counts(self, variant_ids, chunk_size=None, threads=None, **params):
         """
         :type variant_ids: list
+        :param chunk_size: the variants per request, large inputs are posted in concurrent chunks
+        :type chunk_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
         :type params: dict
         :rtype: list
         """
         variant_coordinates = [v.toJsonDict() for v in self.variants().variant_ids_to_coordinates(variant_ids)]
-        results, _ = self._post([self._BASE_ENDPOINT, "shared-variants-counts"], variant_coordinates, **params)
-        return results
+        return self._post_in_chunks([self._BASE_ENDPOINT, "shared-variants-counts"], variant_coordinates,
+                                    chunk_size=chunk_size, threads=threads, **params)
 
     def get_phenosim_matrix(self, as_data_frame=False, **params):
         """
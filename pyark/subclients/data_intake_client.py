@@ -1,13 +1,5 @@
 from pyark import cva_client
-from protocols.protocol_7_3.cva import (
-    PedigreeInjectRD,
-    CancerParticipantInject,
-    InterpretedGenomeInject,
-    ClinicalReportInject,
-    ExitQuestionnaireInjectRD,
-    ExitQuestionnaireInjectCancer,
-    Transaction
-)
+from pyark.lazy_import import cva_models
 
 
 class DataIntakeClient(cva_client.CvaClient):
@@ -31,7 +23,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._PEDIGREE_POST, pedigree.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_participant(self, participant, params={}):
         """
@@ -41,7 +33,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._PARTICIPANT_POST, participant.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_interpreted_genome(self, tiered_variant, params={}):
         """
@@ -51,7 +43,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._INTERPRETED_GENOME_POST, tiered_variant.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_clinical_report(self, candidate_variant, params={}):
         """
@@ -61,7 +53,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._CLINICAL_REPORT_POST, candidate_variant.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_exit_questionaire(self, exit_questionaire, params={}):
         """
@@ -71,7 +63,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._EXIT_QUESTIONAIRES_RD_POST, exit_questionaire.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_exit_questionaire_cancer(self, exit_questionaire, params={}):
         """
@@ -81,7 +73,7 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._EXIT_QUESTIONAIRES_CANCER_POST, exit_questionaire.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def post_variant_interpretation_log(self, variant_interpretation_log, params={}):
         """
@@ -91,4 +83,4 @@ class DataIntakeClient(cva_client.CvaClient):
         """
         results, _ = self._post(self._VARIANT_INTERPRETATION_LOG, variant_interpretation_log.toJsonDict(), params)
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
@@ -1,5 +1,5 @@
 import pyark.cva_client as cva_client
-import pandas as pd
+from pyark.lazy_import import pandas as pd
 
 
 class EntitiesClient(cva_client.CvaClient):
@@ -127,20 +127,26 @@ class EntitiesClient(cva_client.CvaClient):
         results, _ = self._get("hpos/{id}".format(id=identifier))
         return self._render(results, as_data_frame=as_data_frame)
 
-    def get_hpos(self, as_data_frame=False, max_results=None, **params):
+    def get_hpos(self, as_data_frame=False, max_results=None, page_size=None, **params):
         """
         :param as_data_frame: return results in a flattened Pandas data frame or in a list of dictionaries
         :type as_data_frame: bool
         :type max_results: int
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
         :return:
         """
-        return self._paginate(endpoint="hpos/search", as_data_frame=as_data_frame, max_results=max_results, **params)
+        return self._paginate(endpoint="hpos/search", as_data_frame=as_data_frame, max_results=max_results,
+                              page_size=page_size, **params)
 
-    def get_organisations(self, as_data_frame=False, max_results=None, **params):
+    def get_organisations(self, as_data_frame=False, max_results=None, page_size=None, **params):
         """
         :param as_data_frame: return results in a flattened Pandas data frame or in a list of dictionaries
         :type as_data_frame: bool
         :type max_results: int
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
         :return:
         """
-        return self._paginate(endpoint="organisations", as_data_frame=as_data_frame, max_results=max_results, **params)
+        return self._paginate(endpoint="organisations", as_data_frame=as_data_frame, max_results=max_results,
+                              page_size=page_size, **params)
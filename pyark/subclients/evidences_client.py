@@ -1,5 +1,10 @@
+import io
+import json
+import logging
+
 from pyark import cva_client
-from protocols.protocol_7_3.cva import EvidenceEntryAndVariants
+from pyark.columnar import chunks, write_parquet
+from pyark.lazy_import import cva_models
 
 
 class EvidencesClient(cva_client.CvaClient):
@@ -9,11 +14,62 @@ class EvidencesClient(cva_client.CvaClient):
     def __init__(self, **params):
         cva_client.CvaClient.__init__(self, **params)
 
-    def get_evidences(self, source, max=None, **params):
+    def get_evidences(self, source, max_results=None, as_data_frame=False, include_models=True, prefetch=0,
+                      page_size=None, **params):
+        """
+        Streams the evidences of a source in bounded memory
+
+        :type source: str
+        :type max_results: int
+        :type as_data_frame: bool
+        :param include_models: use False to get dictionaries instead of EvidenceEntryAndVariants, it is faster
+        :type include_models: bool
+        :param prefetch: the number of evidences fetched ahead in the background, 0 does not prefetch
+        :type prefetch: int
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
+        :type params: dict
+        :rtype: generator
+        """
+        # NOTE: kept for backwards compatibility, `max` was never honoured, it is never sent as a query parameter
+        legacy_max = params.pop('max', None)
+        max_results = max_results or legacy_max
         url = "{endpoint}/sources/{source}".format(endpoint=self._BASE_ENDPOINT, source=source)
-        results = self._paginate(endpoint=url, max=max, **params)
-        for r in results:
-            yield EvidenceEntryAndVariants.fromJsonDict(r)
+        if include_models and not as_data_frame:
+            def transformer(x): return cva_models.EvidenceEntryAndVariants.fromJsonDict(x)
+        else:
+            transformer = None
+        results = self._paginate(endpoint=url, as_data_frame=as_data_frame, max_results=max_results,
+                                 page_size=page_size, transformer=transformer, **params)
+        return self.prefetch(results, prefetch) if prefetch else results
+
+    def export_evidences(self, source, path, max_results=None, batch_size=10000, prefetch=10000, **params):
+        """
+        Writes the evidences of a source to a Parquet file when the path ends in `.parquet` and to JSON lines
+        otherwise, no model is built.
+
+        :type source: str
+        :type path: str
+        :type max_results: int
+        :param batch_size: the rows per Parquet row group
+        :type batch_size: int
+        :param prefetch: the number of evidences fetched ahead while writing
+        :type prefetch: int
+        :type params: dict
+        :return: the number of evidences written
+        :rtype: int
+        """
+        evidences = self.get_evidences(source, max_results=max_results, include_models=False, prefetch=prefetch,
+                                       **params)
+        if path.endswith(".parquet"):
+            return write_parquet(path, evidences, batch_size=batch_size)
+        count = 0
+        with io.open(path, "wb") as output:
+            for evidence in evidences:
+                output.write(json.dumps(evidence).encode("utf-8"))
+                output.write(b"\n")
+                count += 1
+        return count
 
     def post_evidences(self, evidence, **params):
         """
@@ -21,4 +77,44 @@ class EvidencesClient(cva_client.CvaClient):
         :type params: dict
         :rtype: dict
         """
-        return self._post(self._BASE_ENDPOINT, evidence.toJsonDict(), params)
+        return self._post(self._BASE_ENDPOINT, evidence.toJsonDict(), **params)
+
+    def load_evidences(self, paths, batch_size=1000, threads=None, validate=False, fail_fast=False, **params):
+        """
+        Posts the evidences in JSON lines files, one EvidenceEntryAndVariants per line. Files are read in batches
+        so memory is bounded by the batch size and the evidences in a batch are posted concurrently.
+
+        :param paths: the JSON lines files
+        :type paths: list
+        :type batch_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
+        :param validate: validates every evidence against the model before posting it, invalid evidences fail
+        :type validate: bool
+        :param fail_fast: raises on the first failure, otherwise failures are logged and counted
+        :type fail_fast: bool
+        :type params: dict
+        :return: the number of evidences posted and failed
+        :rtype: dict
+        """
+        def post(evidence):
+            if validate and not cva_models.EvidenceEntryAndVariants.validate(evidence):
+                raise ValueError("Invalid evidence: {}".format(json.dumps(evidence)[:200]))
+            return self._post(self._BASE_ENDPOINT, evidence, **params)
+
+        counts = {'posted': 0, 'failed': 0}
+        for batch in chunks(self._read_json_lines(paths), batch_size):
+            results = self.run_threaded_requests(post, batch, threads or self._threads, fail_fast=fail_fast)
+            failed = sum(1 for r in results if r is None)
+            counts['posted'] += len(batch) - failed
+            counts['failed'] += failed
+            logging.info("Posted {posted} evidences, {failed} failed".format(**counts))
+        return counts
+
+    @staticmethod
+    def _read_json_lines(paths):
+        for path in [paths] if isinstance(paths, (str, type(u""))) else paths:
+            with io.open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
@@ -1,5 +1,5 @@
 import pyark.cva_client as cva_client
-from protocols.protocol_7_3.cva import VariantsCoordinates, VariantCoordinates
+from pyark.lazy_import import cva_models
 
 
 class LiftOverClient(cva_client.CvaClient):
@@ -19,13 +19,13 @@ class LiftOverClient(cva_client.CvaClient):
         :rtype: list
         """
         variant_coordinates_list = self.variants_client.variant_ids_to_coordinates(variant_identifiers)
-        variants_coordinates = VariantsCoordinates()
+        variants_coordinates = cva_models.VariantsCoordinates()
         variants_coordinates.variants = variant_coordinates_list
 
         results, _ = self._post(self._BASE_ENDPOINT, payload=variants_coordinates.toJsonDict(), **params)
         assert len(results) == len(variant_identifiers), "Some variants failed to lift over"
 
-        return [VariantCoordinates.fromJsonDict(x) for x in results]
+        return [cva_models.VariantCoordinates.fromJsonDict(x) for x in results]
 
     def lift_over_by_variants_coordinates(self, variant_coordinates_list, **params):
         """
@@ -34,10 +34,10 @@ class LiftOverClient(cva_client.CvaClient):
         :return list of VariantCoordinates
         :rtype: list
         """
-        variants_coordinates = VariantsCoordinates()
+        variants_coordinates = cva_models.VariantsCoordinates()
         variants_coordinates.variants = variant_coordinates_list
 
         results, _ = self._post(self._BASE_ENDPOINT, payload=variants_coordinates.toJsonDict(), **params)
         assert len(results) == len(variant_coordinates_list), "Some variants failed to lift over"
 
-        return [VariantCoordinates.fromJsonDict(x) for x in results]
+        return [cva_models.VariantCoordinates.fromJsonDict(x) for x in results]
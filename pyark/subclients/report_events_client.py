@@ -1,8 +1,7 @@
-from enum import Enum
-from protocols.protocol_7_3.cva import ReportEventEntry, Assembly, VariantCoordinates
+from collections import OrderedDict
 
 import pyark.cva_client as cva_client
-from pyark.models.wrappers import ReportEventEntryWrapper
+from pyark.lazy_import import wrappers
 
 
 class ReportEventsClient(cva_client.CvaClient):
@@ -16,13 +15,32 @@ class ReportEventsClient(cva_client.CvaClient):
         params['count'] = True
         return self.get_report_events(**params)
 
-    def get_report_events(self, max_results=None, include_all=True, as_data_frame=False, **params):
+    def count_facets(self, facets, as_array=False, threads=None, fail_fast=False, **params):
+        """
+        Counts report events for every combination of the facet values as in `CvaClient._count_facets`, eg:
+        count_facets([('panelNames', panels), ('tier', tiers)], type='genomics_england_tiering')
+
+        :type facets: dict | list
+        :type as_array: bool
+        :type threads: int
+        :type fail_fast: bool
+        :type params: dict
+        :rtype: pd.DataFrame | tuple
+        """
+        return self._count_facets(facets, as_array=as_array, threads=threads, fail_fast=fail_fast, **params)
+
+    def get_report_events(self, max_results=None, include_all=True, as_data_frame=False, page_size=None,
+                          as_polars=False, **params):
         """
         :type as_data_frame: bool
         :type max_results: bool
         :type include_all: bool
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
+        :param as_polars: returns a Polars DataFrame, or a LazyFrame as set by a PolarsOutput, instead of a generator
+        :type as_polars: bool | PolarsOutput
         :type params: dict
-        :rtype: generator
+        :rtype: generator | polars.DataFrame | polars.LazyFrame
         """
         if params.get('count', False):
             results, next_page_params = self._get(self._BASE_ENDPOINT, **params)
@@ -30,26 +48,121 @@ class ReportEventsClient(cva_client.CvaClient):
         else:
             if include_all:
                 params['include'] = [self._INCLUDE_ALL]
+            if as_polars:
+                return self._collect_polars(as_polars, endpoint=self._BASE_ENDPOINT, max_results=max_results,
+                                            page_size=page_size, **params)
             if not as_data_frame:
-                def transformer(x): return ReportEventEntryWrapper.fromJsonDict(x)
+                def transformer(x): return wrappers.ReportEventEntryWrapper.fromJsonDict(x)
             else:
                 transformer = None
             return self._paginate(
                 endpoint=self._BASE_ENDPOINT, max_results=max_results, as_data_frame=as_data_frame,
-                transformer=transformer, **params)
+                page_size=page_size, transformer=transformer, **params)
+
+    def get_report_events_with_variants(self, max_results=None, include_all=True, window_size=500, cache_size=10000,
+                                        use_summaries=False, threads=None, **params):
+        """
+        Streams report events joined with their variants, see `join_variants`.
+
+        :type max_results: int
+        :type include_all: bool
+        :type window_size: int
+        :type cache_size: int
+        :type use_summaries: bool
+        :type threads: int
+        :type params: dict
+        :return: pairs of report event and variant
+        :rtype: generator
+        """
+        report_events = self.get_report_events(max_results=max_results, include_all=include_all, **params)
+        return self.join_variants(report_events, window_size=window_size, cache_size=cache_size,
+                                  use_summaries=use_summaries, threads=threads)
+
+    def join_variants(self, report_events, window_size=500, cache_size=10000, use_summaries=False, threads=None):
+        """
+        Joins a stream of report events with their variants without a request per report event.
+        The distinct variant identifiers in a window of report events are fetched in one go, either concurrently
+        from the variants endpoint or in a single request to the variant summaries by ids endpoint.
+        Fetched variants are kept in a least recently used cache shared across windows, so memory is bounded by
+        `window_size` report events plus `cache_size` variants.
+
+        :param report_events: report events as returned by `get_report_events` (ie: models or dictionaries)
+        :type report_events: iterable
+        :param window_size: the number of report events buffered before fetching their variants
+        :type window_size: int
+        :param cache_size: the maximum number of variants kept in memory across windows
+        :type cache_size: int
+        :param use_summaries: joins variant summaries instead of full variants
+        :type use_summaries: bool
+        :param threads: the number of concurrent variant requests, by default the threads of the client
+        :type threads: int
+        :return: pairs of report event and variant (ie: VariantWrapper or a summary dictionary), the variant is
+        None when not found
+        :rtype: generator
+        """
+        cache = OrderedDict()
+        window = []
+        for report_event in report_events:
+            window.append(report_event)
+            if len(window) >= window_size:
+                for joined in self._join_window(window, cache, cache_size, use_summaries, threads):
+                    yield joined
+                window = []
+        if window:
+            for joined in self._join_window(window, cache, cache_size, use_summaries, threads):
+                yield joined
+
+    def _join_window(self, window, cache, cache_size, use_summaries, threads):
+        variant_ids = [self._get_variant_id(r) for r in window]
+        missing = [v for v in OrderedDict.fromkeys(variant_ids) if v is not None and v not in cache]
+        if missing:
+            if use_summaries:
+                summaries = dict((s['variantId'], s) for s in self.get_variant_summary_by_ids(missing))
+                fetched = [summaries.get(v) for v in missing]
+            else:
+                variants_client = self.variants()
+                fetched = self.run_threaded_requests(
+                    lambda v: variants_client.get_variant_by_id(v), missing, threads=threads or self._threads)
+            for variant_id, variant in zip(missing, fetched):
+                cache[variant_id] = variant
+        joined = []
+        for report_event, variant_id in zip(window, variant_ids):
+            variant = None
+            if variant_id is not None:
+                variant = cache.pop(variant_id)
+                # moves it to the most recently used end
+                cache[variant_id] = variant
+            joined.append((report_event, variant))
+        while len(cache) > cache_size:
+            cache.popitem(last=False)
+        return joined
+
+    @staticmethod
+    def _get_variant_id(report_event):
+        if isinstance(report_event, dict):
+            return report_event.get('variantId')
+        return getattr(report_event, 'variantId', None)
 
-    def get_variant_summary_by_ids(self, variant_ids, **params):
+    def get_variant_summary_by_ids(self, variant_ids, chunk_size=None, threads=None, **params):
         """
         :type variant_ids: list
+        :param chunk_size: the variants per request, large inputs are posted in concurrent chunks
+        :type chunk_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
         :rtype: list
         """
-        results, _ = self._post([self._BASE_ENDPOINT, "variant-summary-by-ids"], variant_ids, **params)
-        return results
+        return self._post_in_chunks([self._BASE_ENDPOINT, "variant-summary-by-ids"], variant_ids,
+                                    chunk_size=chunk_size, threads=threads, **params)
 
-    def get_variant_summary_by_coordinates(self, variant_coordinates, **params):
+    def get_variant_summary_by_coordinates(self, variant_coordinates, chunk_size=None, threads=None, **params):
         """
         :type variant_coordinates: list
+        :param chunk_size: the variants per request, large inputs are posted in concurrent chunks
+        :type chunk_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
         :rtype: list
         """
-        results, _ = self._post([self._BASE_ENDPOINT, "variant-summary-by-coordinates"], variant_coordinates, **params)
-        return results
+        return self._post_in_chunks([self._BASE_ENDPOINT, "variant-summary-by-coordinates"], variant_coordinates,
+                                    chunk_size=chunk_size, threads=threads, **params)
@@ -1,7 +1,7 @@
 from pyark.errors import CvaClientError
 
 from pyark import cva_client
-from protocols.protocol_7_3.cva import Transaction
+from pyark.lazy_import import cva_models
 
 
 class TransactionsClient(cva_client.CvaClient):
@@ -19,7 +19,7 @@ class TransactionsClient(cva_client.CvaClient):
         results, _ = self._get("{endpoint}/{identifier}".format(
             endpoint=self._BASE_ENDPOINT, identifier=transaction_id))
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def retry_transaction(self, transaction_id):
         """
@@ -29,7 +29,7 @@ class TransactionsClient(cva_client.CvaClient):
         results, _ = self._patch("{endpoint}/{identifier}".format(
             endpoint=self._BASE_ENDPOINT, identifier=transaction_id))
         result = self._render_single_result(results, as_data_frame=False)
-        return Transaction.fromJsonDict(result) if result else None
+        return cva_models.Transaction.fromJsonDict(result) if result else None
 
     def delete_transaction(self, **params):
         id = params.get('id', None)
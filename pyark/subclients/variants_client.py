@@ -2,17 +2,9 @@ import re
 import logging
 import time
 import pyark.cva_client as cva_client
-from pyark.models.wrappers import VariantWrapper
+import pyark.timeouts as timeouts
 from pyark.errors import CvaServerError
-from protocols.protocol_7_3.cva import VariantCoordinates
-
-
-_singleton_instance = None
-
-
-# NOTE: this method needs to be out of any class as it needs to be pickled (ie: serialised) by multiprocessing library
-def _get_variant_by_id(identifier):
-    return _singleton_instance.get_variant_by_id(identifier)
+from pyark.lazy_import import cva_models, wrappers
 
 
 class VariantsClient(cva_client.CvaClient):
@@ -29,6 +21,20 @@ class VariantsClient(cva_client.CvaClient):
         """
         return self.get_variants(count=True, **params)
 
+    def count_facets(self, facets, as_array=False, threads=None, fail_fast=False, **params):
+        """
+        Counts variants for every combination of the facet values as in `CvaClient._count_facets`, eg:
+        count_facets([('assembly', assemblies), ('geneSymbols', genes)])
+
+        :type facets: dict | list
+        :type as_array: bool
+        :type threads: int
+        :type fail_fast: bool
+        :type params: dict
+        :rtype: pd.DataFrame | tuple
+        """
+        return self._count_facets(facets, as_array=as_array, threads=threads, fail_fast=fail_fast, **params)
+
     def get_variant_by_id(self, identifier, include_all=True, retries=3, **params):
         """
         :type identifier: str
@@ -56,24 +62,37 @@ class VariantsClient(cva_client.CvaClient):
             logging.warning("No variant found with id {}".format(identifier))
             return None
         assert len(results) == 1, "Unexpected number of variants returned when searching by identifier"
-        variant = VariantWrapper.fromJsonDict(results[0])
+        variant = wrappers.VariantWrapper.fromJsonDict(results[0])
         return variant
 
-    def get_variants_by_id(self, identifiers):
+    def get_variants_by_id(self, identifiers, timeout=None, deadline=None):
         """
         :type identifiers: list
+        :param timeout: the timeout of every request, by default the timeout of the client
+        :type timeout: float | tuple
+        :param deadline: the maximum seconds to fetch all variants
+        :type deadline: float
         :rtype: list
         """
-        self._set_singleton()
-        return VariantsClient.run_parallel_requests(_get_variant_by_id, identifiers, threads=self._threads)
-
-    def get_variants(self, as_data_frame=False, max_results=None, include_all=True, **params):
+        deadline = timeouts.Deadline.of(deadline)
+        # threads share the connections of the client, forked processes would inherit its open connections and
+        # their responses would interleave
+        return self.run_threaded_requests(
+            lambda i: self.get_variant_by_id(i, timeout=timeout, deadline=deadline), identifiers,
+            threads=self._threads)
+
+    def get_variants(self, as_data_frame=False, max_results=None, include_all=True, page_size=None, as_polars=False,
+                     **params):
         """
         :type as_data_frame: bool
         :type max_results: int
         :type include_all: bool
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
+        :param as_polars: returns a Polars DataFrame, or a LazyFrame as set by a PolarsOutput, instead of a generator
+        :type as_polars: bool | PolarsOutput
         :type params: dict
-        :rtype: generator
+        :rtype: generator | polars.DataFrame | polars.LazyFrame
         """
         if params.get('count', False):
             results, next_page_params = self._get(self._BASE_ENDPOINT, **params)
@@ -81,13 +100,39 @@ class VariantsClient(cva_client.CvaClient):
         else:
             if include_all:
                 params['include'] = [self._INCLUDE_ALL]
+            if as_polars:
+                return self._collect_polars(as_polars, endpoint=self._BASE_ENDPOINT, max_results=max_results,
+                                            page_size=page_size, **params)
             if not as_data_frame:
-                def transformer(x): return VariantWrapper.fromJsonDict(x)
+                def transformer(x): return wrappers.VariantWrapper.fromJsonDict(x)
             else:
                 transformer = None
             return self._paginate(
                 endpoint=self._BASE_ENDPOINT, as_data_frame=as_data_frame, max_results=max_results,
-                transformer=transformer, **params)
+                page_size=page_size, transformer=transformer, **params)
+
+    def get_variant_table(self, max_results=None, include_all=True, annotation_fields=None, page_size=None,
+                          **params):
+        """
+        Fetches variants into a compact columnar table, no model is built for every variant.
+
+        :type max_results: int
+        :type include_all: bool
+        :param annotation_fields: the annotation columns, see VariantTable
+        :type annotation_fields: dict
+        :param page_size: the number of results per request or an AdaptivePageSize, by default the server decides
+        :type page_size: int | AdaptivePageSize
+        :type params: dict
+        :rtype: VariantTable
+        """
+        # NOTE: imported here as it is only needed for this method
+        from pyark.variant_table import VariantTable
+        if include_all:
+            params['include'] = [self._INCLUDE_ALL]
+        table = VariantTable(annotation_fields=annotation_fields)
+        table.extend(self._paginate(
+            endpoint=self._BASE_ENDPOINT, max_results=max_results, page_size=page_size, **params))
+        return table
 
     def variant_ids_to_coordinates(self, variant_ids, fail_on_structural=False):
         """
@@ -106,7 +151,7 @@ class VariantsClient(cva_client.CvaClient):
         """
         match = re.match(r'(GRCh37|GRCh38):(.+):([ 0-9]+):(-| |[A|C|G|T]*):(-| |[A|C|G|T]*)', variant_id)
         if match and (len(match.group(4)) > 0 or len(match.group(5)) > 0):
-            variant_coordinates = VariantCoordinates.fromJsonDict({
+            variant_coordinates = cva_models.VariantCoordinates.fromJsonDict({
                 'assembly': match.group(1),
                 'chromosome': match.group(2),
                 'position': match.group(3).strip(),
@@ -126,14 +171,14 @@ class VariantsClient(cva_client.CvaClient):
                     return None
         return variant_coordinates
 
-    def variant_coordinates_to_ids(self, variant_coordinates):
+    def variant_coordinates_to_ids(self, variant_coordinates, chunk_size=None, threads=None):
         """
         :type variant_coordinates: list
+        :param chunk_size: the variants per request, large inputs are posted in concurrent chunks
+        :type chunk_size: int
+        :param threads: the maximum number of concurrent requests, by default the threads of the client
+        :type threads: int
         :rtype: list
         """
-        results, _ = self._post([self._BASE_ENDPOINT, "identifiers-from-small-variant-coordinates"], variant_coordinates)
-        return results
-
-    def _set_singleton(self):
-        global _singleton_instance
-        _singleton_instance = self
+        return self._post_in_chunks([self._BASE_ENDPOINT, "identifiers-from-small-variant-coordinates"],
+                                    variant_coordinates, chunk_size=chunk_size, threads=threads)
@@ -1,10 +1,23 @@
+import base64
+import json
 import logging
 import os
 import random
+import shutil
+import tempfile
+import time
 import uuid
-from unittest import TestCase
+from unittest import TestCase, skipIf
 
 import pandas as pd
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import polars
+except ImportError:
+    polars = None
 from mock import patch
 from protocols.protocol_7_3.cva import Assembly, PedigreeInjectRD, CancerParticipantInject, \
     EvidenceEntryAndVariants, EvidenceEntry, Property, EvidenceSource, Actions, Therapy, DrugResponse, GenomicFeature, \
@@ -13,10 +26,26 @@ from protocols.protocol_7_3.cva import Assembly, PedigreeInjectRD, CancerPartici
 from protocols.protocol_7_3.reports import Program
 from protocols.util import dependency_manager
 from protocols.util.factories.avro_factory import GenericFactoryAvro
+import requests
 from requests import ConnectionError
 
+from pyark import cli
+from pyark.case_store import CaseStore, CaseIndex
+from pyark.checkpoint import PaginationCheckpoint, export_to_file
+from pyark.columnar import PolarsOutput
+from pyark import dtypes
 from pyark.cva_client import CvaClient
-from pyark.errors import CvaClientError, CvaServerError
+from pyark.dtypes import DtypeSchema
+from pyark.errors import CvaClientError, CvaServerError, CvaTimeoutError
+from pyark.interval_index import GenomicIntervalIndex
+from pyark.metrics import MetricsRegistry, endpoint_label
+from pyark.page_sizing import AdaptivePageSize
+from pyark import profiling
+from pyark import sharded_export
+from pyark.sharded_export import ShardedExport
+from pyark.token_cache import TokenCache
+from pyark.transports import Http2Transport, RecordReplayTransport
+from pyark.variant_table import VariantTable
 from pyark.models.wrappers import ReportEventEntryWrapper, VariantWrapper
 
 
@@ -485,13 +514,799 @@ class TestOthers(TestPyArk):
         return response
 
 
+class TestMetrics(TestCase):
+
+    def test_endpoint_label(self):
+        self.assertEqual("cases/{id}/{id}/similar-cases", endpoint_label(["cases", "SAP-123", 1, "similar-cases"]))
+        self.assertEqual("variants/{id}", endpoint_label("variants/GRCh38:1:12345:A:G"))
+        self.assertEqual("cases/summary", endpoint_label("cases/summary"))
+
+    @patch('requests.sessions.Session.get')
+    def test_records_paginated_requests(self, get):
+        get.side_effect = [
+            MockResponse(200, {'time': 20, 'response': [{'result': [{'a': 1}, {'a': 2}]}]},
+                         headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '2'}),
+            MockResponse(200, {'time': 10, 'response': [{'result': [{'a': 3}]}]})
+        ]
+        registry = MetricsRegistry()
+        cases = CvaClient("https://nowhere.invalid", token="xyz", metrics_registry=registry).cases()
+        self.assertEqual(3, len(list(cases.get_cases())))
+        self.assertEqual(2, registry.get("pyark_pagination_pages_total", endpoint="cases"))
+        self.assertEqual(2, registry.get("pyark_request_latency_seconds", method="GET", endpoint="cases"))
+        self.assertEqual(2, registry.get("pyark_server_time_seconds", method="GET", endpoint="cases"))
+        self.assertEqual(2, registry.get("pyark_responses_total", method="GET", endpoint="cases", status=200))
+        self.assertIn('pyark_pagination_pages_total{endpoint="cases"} 2', registry.to_prometheus())
+
+
+class TestProfiling(TestCase):
+
+    @patch('requests.sessions.Session.get')
+    def test_profiles_paginated_data_frames(self, get):
+        get.side_effect = [
+            MockResponse(200, {'response': [{'result': [{'a': 1}, {'a': 2}]}]},
+                         headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '2'}),
+            MockResponse(200, {'response': [{'result': [{'a': 3}]}]})
+        ]
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        with profiling.profile(log=False) as profiler:
+            self.assertEqual(3, pd.concat(cases.get_cases(as_data_frame=True)).shape[0])
+        summary = profiler.summary()
+        self.assertEqual(2, summary['pages'])
+        self.assertEqual(3, summary['items'])
+        self.assertEqual([2, 1], [p['items'] for p in profiler.pages])
+        for phase in [profiling.HTTP_WAIT, profiling.JSON_DECODE, profiling.PARSE_RESULT,
+                      profiling.JSON_NORMALIZE, profiling.REINDEX]:
+            self.assertGreater(summary['phases'][phase], 0)
+        self.assertIn(profiling.JSON_NORMALIZE, profiler.report())
+
+
+class TestRecordReplayTransport(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.archive = os.path.join(self.folder, "archive.jsonl.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @patch('requests.sessions.Session.get')
+    def test_replays_without_network(self, get):
+        get.side_effect = [
+            MockResponse(200, {'response': [{'result': [{'a': 1}]}]},
+                         headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '1'}),
+            MockResponse(200, {'response': [{'result': [{'a': 2}]}]})
+        ]
+        transport = RecordReplayTransport(self.archive, mode=RecordReplayTransport.RECORD)
+        recorded = list(CvaClient("https://nowhere.invalid", token="xyz", transport=transport).cases().get_cases())
+        self.assertEqual(2, get.call_count)
+
+        get.side_effect = ConnectionError("no network")
+        transport = RecordReplayTransport(self.archive, mode=RecordReplayTransport.REPLAY)
+        self.assertEqual(2, len(transport))
+        replayed = list(CvaClient("https://nowhere.invalid", token="xyz", transport=transport).cases().get_cases())
+        self.assertEqual(recorded, replayed)
+        self.assertEqual(2, get.call_count)
+        self.assertRaises(CvaClientError, lambda: list(CvaClient(
+            "https://nowhere.invalid", token="xyz", transport=transport).cases().get_cases(program="cancer")))
+
+    @patch('requests.sessions.Session.get')
+    @patch('requests.sessions.Session.post')
+    def test_errors_are_not_archived(self, post, get):
+        post.return_value = MockResponse(200, {'response': [{'result': [{'token': "renewed"}]}]})
+        get.side_effect = [MockResponse(401, {}), MockResponse(200, {'response': [{'result': [{'a': 1}]}]})]
+        transport = RecordReplayTransport(self.archive, mode=RecordReplayTransport.AUTO)
+        cva = CvaClient("https://nowhere.invalid", user='u', password='p', transport=transport)
+        self.assertEqual([{'a': 1}], list(cva.cases().get_cases()))
+        self.assertEqual(2, get.call_count)
+        transport.compact()
+        # the login and the response with the renewed token were archived, the 401 was not
+        transport = RecordReplayTransport(self.archive, mode=RecordReplayTransport.REPLAY)
+        self.assertEqual(2, len(transport))
+        cva = CvaClient("https://nowhere.invalid", token="expired", transport=transport)
+        self.assertEqual([{'a': 1}], list(cva.cases().get_cases()))
+
+
+@skipIf(httpx is None, "httpx is not installed")
+class TestHttp2Transport(TestCase):
+
+    @patch('httpx.Client.send')
+    def test_paginates_over_http2(self, send):
+        sent = []
+
+        def page(request, **kwargs):
+            sent.append(request)
+            # HTTP/2 header names are lower case
+            headers = {'x-pagination-marker': 'm', 'x-pagination-limit': '1'} if len(sent) == 1 else {}
+            return httpx.Response(200, json={'response': [{'result': [{'a': len(sent)}]}]}, headers=headers,
+                                  request=request)
+        send.side_effect = page
+        cva = CvaClient("https://nowhere.invalid", token="xyz", transport=Http2Transport())
+        cases = list(cva.cases().get_cases(program="cancer", genes=["a", "b"], validated=True))
+        self.assertEqual([{'a': 1}, {'a': 2}], cases)
+        self.assertEqual("m", sent[1].url.params['marker'])
+        self.assertEqual(["a", "b"], sent[0].url.params.get_list("genes"))
+        self.assertEqual("True", sent[0].url.params['validated'])
+        self.assertEqual("Bearer xyz", sent[0].headers['Authorization'])
+
+    @patch('httpx.Client.send')
+    def test_errors_as_requests(self, send):
+        send.side_effect = httpx.ReadTimeout("too slow")
+        cva = CvaClient("https://nowhere.invalid", token="xyz", retries=0, timeout=(1, 20),
+                        transport=Http2Transport())
+        self.assertRaises(requests.exceptions.Timeout, cva.cases().count)
+        timeout = send.call_args[0][0].extensions['timeout']
+        self.assertEqual((1, 20), (timeout['connect'], timeout['read']))
+        send.side_effect = httpx.ConnectError("refused")
+        self.assertRaises(ConnectionError, cva.cases().count)
+
+    @patch('httpx.Client.send')
+    def test_variants_by_id_in_threads(self, send):
+        def variant(request, **kwargs):
+            identifier = request.url.path.split("/")[-1]
+            return httpx.Response(200, json={'response': [{'result': [{'id': identifier, 'variants': []}]}]},
+                                  request=request)
+        send.side_effect = variant
+        cva = CvaClient("https://nowhere.invalid", token="xyz", threads=4, transport=Http2Transport())
+        identifiers = ["GRCh38:1:{}:A:C".format(i) for i in range(10)]
+        variants = cva.variants().get_variants_by_id(identifiers)
+        self.assertEqual(identifiers, [v.id for v in variants])
+
+
+class TestCaseStore(TestCase):
+
+    @patch('requests.sessions.Session.get')
+    def test_incremental_sync(self, get):
+        get.side_effect = [
+            MockResponse(200, {'response': [{'result': [
+                {'identifier': '1', 'version': 1, 'program': 'rare_disease', 'lastModifiedDate': '2019-01-01'},
+                {'identifier': '2', 'version': 1, 'program': 'cancer', 'lastModifiedDate': '2019-01-03'}]}]}),
+            MockResponse(200, {'response': [{'result': [
+                {'identifier': '2', 'version': 1, 'program': 'cancer', 'lastModifiedDate': '2019-01-05'}]}]})
+        ]
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        with CaseStore() as store:
+            self.assertEqual(2, cases.sync_cases(store, program='rare_disease'))
+            self.assertEqual('2019-01-03', store.get_watermark(program='rare_disease'))
+            self.assertNotIn('filter', get.call_args[1]['params'])
+            self.assertEqual(1, cases.sync_cases(store, program='rare_disease'))
+            self.assertEqual("lastModifiedDate ge '2019-01-03'", get.call_args[1]['params']['filter'])
+            self.assertEqual('2019-01-05', store.get_watermark(program='rare_disease'))
+            self.assertEqual(2, store.count())
+            self.assertEqual('2019-01-05', store.get_case('2', 1)['lastModifiedDate'])
+            self.assertIsNone(store.get_case('3', 1))
+
+
+class TestCaseIndex(TestCase):
+
+    CASES = [
+        {'identifier': '1', 'version': 1, 'program': 'rare_disease', 'assembly': 'GRCh38',
+         'reportEventsAnalysisPanels': [{'panelName': 'Epilepsy'}],
+         'probandDisorders': [{'specificDisease': 'epilepsy', 'diseaseGroup': 'neurology'}]},
+        {'identifier': '2', 'version': 1, 'program': 'rare_disease', 'assembly': 'GRCh37',
+         'reportEventsAnalysisPanels': [{'panelName': 'Cardiomyopathy'}],
+         'probandDisorders': [{'specificDisease': 'cardiomyopathy'}]},
+        {'identifier': '3', 'version': 2, 'program': 'cancer', 'assembly': 'GRCh38'}
+    ]
+
+    def test_lookups_and_filters(self):
+        index = CaseIndex(self.CASES)
+        self.assertEqual(3, len(index))
+        self.assertEqual('cancer', index.get_case('3', 2)['program'])
+        self.assertIsNone(index.get_case('3', 1))
+        self.assertEqual(['1'], [c['identifier'] for c in index.find(program='rare_disease', assembly='GRCh38')])
+        self.assertEqual(['1'], [c['identifier'] for c in index.find(disorder='neurology')])
+        self.assertEqual(['1', '2'], [c['identifier'] for c in index.find(panel_name=['Epilepsy', 'Cardiomyopathy'])])
+        self.assertEqual([], index.find(program='cancer', panel_name='Epilepsy'))
+        self.assertEqual(2, index.find(program='rare_disease', as_data_frame=True).shape[0])
+
+    def test_replaces_cases(self):
+        index = CaseIndex(self.CASES)
+        index.add({'identifier': '1', 'version': 1, 'program': 'cancer', 'assembly': 'GRCh38'})
+        self.assertEqual(3, len(index))
+        self.assertEqual([], index.find(panel_name='Epilepsy'))
+        self.assertEqual(['1', '3'], [c['identifier'] for c in index.find(program='cancer')])
+
+
+class TestConcurrentSummaries(TestCase):
+
+    @staticmethod
+    def _summary(url, params=None, **kwargs):
+        if params['assembly'] == 'fail':
+            return MockResponse(500, {})
+        return MockResponse(200, {'response': [{'result': [{'countCases': len(params['assembly'])}]}]})
+
+    @patch('requests.sessions.Session.get')
+    def test_get_summary_params_list(self, get):
+        get.side_effect = self._summary
+        cases = CvaClient("https://nowhere.invalid", token="xyz", threads=3).cases()
+        queries = [{'assembly': a} for a in ['GRCh38', 'b', 'fail', 'GRCh38', 'cc']]
+        summaries = cases.get_summary(params_list=queries)
+        self.assertEqual(4, get.call_count)
+        self.assertEqual([6, 1, None, 6, 2], [s['countCases'] if s else None for s in summaries])
+
+        summaries = cases.get_summary(params_list=queries, as_data_frame=True)
+        self.assertEqual([6, 1, 6, 2], list(summaries.countCases))
+        self.assertRaises(CvaServerError, lambda: cases.get_summary(params_list=queries, fail_fast=True))
+
+
+class TestChunkedPosts(TestCase):
+
+    @patch('requests.sessions.Session.post')
+    def test_chunked_summaries(self, post):
+        failures = ['v4']
+
+        def summaries(url, json=None, **kwargs):
+            # the chunk starting at v4 fails once and is retried on its own
+            if json[0] in failures:
+                failures.remove(json[0])
+                raise ConnectionError("network blip")
+            return MockResponse(200, {'response': [{'result': [{'variantId': v} for v in json]}]})
+        post.side_effect = summaries
+        report_events = CvaClient("https://nowhere.invalid", token="xyz", threads=3).report_events()
+        variant_ids = ['v{}'.format(i) for i in range(10)]
+        summaries = report_events.get_variant_summary_by_ids(variant_ids, chunk_size=4)
+        self.assertEqual(variant_ids, [s['variantId'] for s in summaries])
+        self.assertEqual(4, post.call_count)
+        self.assertEqual([('v0', 'v1', 'v2', 'v3'), ('v4', 'v5', 'v6', 'v7'), ('v8', 'v9')],
+                         sorted(set(tuple(c[1]['json']) for c in post.call_args_list)))
+
+        post.reset_mock()
+        self.assertEqual(['v0'], [s['variantId'] for s in report_events.get_variant_summary_by_ids(['v0'])])
+        self.assertEqual(1, post.call_count)
+
+
+class TestCountFacets(TestCase):
+
+    @staticmethod
+    def _count(url, params=None, **kwargs):
+        return MockResponse(200, {'response': [{'result': [len(params['program']) * 10 + len(params['assembly'])]}]})
+
+    @patch('requests.sessions.Session.get')
+    def test_count_facets(self, get):
+        get.side_effect = self._count
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        facets = [('program', ['cancer', 'rare_disease']), ('assembly', ['GRCh37', 'b'])]
+        counts = cases.count_facets(facets, hasClinicalData=True)
+        self.assertEqual(['program', 'assembly', 'count'], list(counts.columns))
+        self.assertEqual([66, 61, 126, 121], list(counts['count']))
+        self.assertTrue(all(c[1]['params']['hasClinicalData'] for c in get.call_args_list))
+
+        array, axes = cases.count_facets(facets, as_array=True)
+        self.assertEqual((2, 2), array.shape)
+        self.assertEqual(121, array[1, 1])
+        self.assertEqual(['cancer', 'rare_disease'], axes[0])
+
+
+class TestJoinVariants(TestCase):
+
+    REPORT_EVENTS = [{'id': str(i), 'variantId': v} for i, v in enumerate(['v1', 'v2', 'v1', 'v3', 'v1', None])]
+
+    @patch('requests.sessions.Session.post')
+    def test_join_variant_summaries(self, post):
+        post.side_effect = lambda url, json=None, **kwargs: MockResponse(
+            200, {'response': [{'result': [{'variantId': v} for v in json]}]})
+        report_events = CvaClient("https://nowhere.invalid", token="xyz").report_events()
+        joined = list(report_events.join_variants(self.REPORT_EVENTS, window_size=4, cache_size=2, use_summaries=True))
+        self.assertEqual(self.REPORT_EVENTS, [r for r, _ in joined])
+        self.assertEqual(['v1', 'v2', 'v1', 'v3', 'v1', None], [v['variantId'] if v else None for _, v in joined])
+        # the first window fetches 3 distinct variants, the second finds v1 in the cache
+        self.assertEqual([['v1', 'v2', 'v3']], [c[1]['json'] for c in post.call_args_list])
+
+    @patch('requests.sessions.Session.get')
+    def test_join_variants(self, get):
+        get.side_effect = lambda url, **kwargs: MockResponse(
+            200, {'response': [{'result': [{'id': url.split("/")[-1], 'variants': []}]}]})
+        report_events = CvaClient("https://nowhere.invalid", token="xyz", threads=2).report_events()
+        joined = list(report_events.join_variants(self.REPORT_EVENTS, window_size=10))
+        self.assertEqual(3, get.call_count)
+        self.assertEqual(['v1', 'v2', 'v1', 'v3', 'v1'], [v.id for _, v in joined[:5]])
+        self.assertIsInstance(joined[0][1], VariantWrapper)
+
+
+class TestVariantTable(TestCase):
+
+    @staticmethod
+    def _variant(assembly, chromosome, position, reference, alternate, af=None):
+        coordinates = {'assembly': assembly, 'chromosome': chromosome, 'position': position,
+                       'reference': reference, 'alternate': alternate}
+        annotation = {'populationFrequencies': [{'altAlleleFreq': af}]} if af is not None else {}
+        return {'assembly': assembly, 'smallVariantCoordinates': coordinates, 'annotation': annotation}
+
+    @patch('requests.sessions.Session.get')
+    def test_get_variant_table(self, get):
+        variants = [
+            {'id': 'a', 'variants': [self._variant('GRCh37', '1', 100, 'A', 'C'),
+                                     self._variant('GRCh38', '1', 200, 'A', 'C', af=0.5)]},
+            {'id': 'b', 'variants': [self._variant('GRCh37', 'X', 300, 'G', 'T')]},
+            {'id': 'c', 'variants': [{'assembly': 'GRCh38', 'structuralVariantCoordinates': {}}]}
+        ]
+        get.return_value = MockResponse(200, {'response': [{'result': variants}]})
+        table = CvaClient("https://nowhere.invalid", token="xyz").variants().get_variant_table()
+        self.assertIsInstance(table, VariantTable)
+        self.assertEqual(2, len(table))
+        self.assertEqual(1, table.skipped)
+        self.assertEqual("GRCh38:1:200:A:C", table.get_variant_id(0))
+        self.assertEqual(300, table[1].position)
+        self.assertEqual(0.5, table.get_annotation('max_allele_frequency', 0))
+
+        df = table.to_data_frame()
+        self.assertEqual(['GRCh38', 'GRCh37'], list(df.assembly))
+        self.assertEqual('category', df.chromosome.dtype.name)
+        self.assertEqual(['C', 'T'], list(df.alternate))
+
+
+class TestDtypes(TestCase):
+
+    @patch('requests.sessions.Session.get')
+    def test_report_events_dtypes(self, get):
+        def report_event(i, tier):
+            return {'id': "re-{}".format(i), 'version': 1, 'program': 'rare_disease', 'date': '2019-01-0{}'.format(i),
+                    'reportEvent': {'tier': tier, 'genePanel': {'panelName': 'panel'}}, 'observedVariants': []}
+        get.side_effect = [
+            MockResponse(200, {'response': [{'result': [report_event(1, 'TIER1'), report_event(2, 'TIER1')]}]},
+                         headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '2'}),
+            MockResponse(200, {'response': [{'result': [report_event(3, 'TIER3')]}]})
+        ]
+        report_events = CvaClient("https://nowhere.invalid", token="xyz").report_events()
+        df = dtypes.concat(report_events.get_report_events(as_data_frame=True, dtypes=True))
+        self.assertEqual(['TIER1', 'TIER1', 'TIER3'], list(df['reportEvent.tier']))
+        for column in ['program', 'reportEvent.tier', 'reportEvent.genePanel.panelName']:
+            self.assertEqual('category', df[column].dtype.name)
+        self.assertEqual('int8', df.version.dtype.name)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df.date))
+        self.assertEqual('object', df.id.dtype.name)
+        self.assertEqual([0, 1, 2], list(df.index))
+
+    def test_schema(self):
+        df = pd.DataFrame({'a': ['x', 'x', 'x', 'y'], 'b': [[1], [2], [1], [2]], 'c': ['1', '2', '3', '4']})
+        DtypeSchema(categories=['b'], infer_categories=0.5).apply(df)
+        self.assertEqual(['category', 'object', 'object'], [df[c].dtype.name for c in 'abc'])
+
+
+class TestCollectDataFrame(TestCase):
+
+    @staticmethod
+    def _pages():
+        return [
+            MockResponse(200, {'response': [{'result': [
+                {'id': 'a', 'version': 1, 'reportEvent': {'tier': 'TIER1', 'genePanel': {}}, 'genes': ['g1']},
+                {'id': 'b', 'version': 2, 'reportEvent': {'tier': 'TIER1', 'genePanel': {}}, 'genes': []}]}]},
+                headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '2'}),
+            MockResponse(200, {'response': [{'result': [
+                {'id': 'c', 'version': 1, 'reportEvent': {'tier': 'TIER3', 'genePanel': {'panelName': 'p'}},
+                 'validated': True}]}]})
+        ]
+
+    @patch('requests.sessions.Session.get')
+    def test_collect_as_concat(self, get):
+        get.side_effect = self._pages() + self._pages()
+        report_events = CvaClient("https://nowhere.invalid", token="xyz").report_events()
+        expected = pd.concat(list(report_events.get_report_events(as_data_frame=True)))
+        df = report_events.get_report_events(as_data_frame=True).collect()
+        self.assertEqual(sorted(expected.columns), sorted(df.columns))
+        pd.testing.assert_frame_equal(expected, df[expected.columns])
+
+    @patch('requests.sessions.Session.get')
+    def test_collect_remaining_pages(self, get):
+        get.side_effect = self._pages()
+        pages = CvaClient("https://nowhere.invalid", token="xyz").report_events().get_report_events(
+            as_data_frame=True, dtypes=True)
+        self.assertEqual(['a', 'b'], list(next(pages).id))
+        df = pages.collect()
+        self.assertEqual(['c'], list(df.id))
+        self.assertEqual([2], list(df.index))
+        self.assertEqual('category', df['reportEvent.tier'].dtype.name)
+        self.assertTrue(pages.collect().empty)
+
+
+@skipIf(polars is None, "polars is not installed")
+class TestPolars(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _pages():
+        return [
+            MockResponse(200, {'response': [{'result': [
+                {'id': 'a', 'reportEvent': {'tier': 'TIER1', 'genePanel': None}},
+                {'id': 'b', 'reportEvent': {'tier': 'TIER1', 'genePanel': None}}]}]},
+                headers={'X-Pagination-Marker': 'm', 'X-Pagination-Limit': '2'}),
+            MockResponse(200, {'response': [{'result': [
+                {'id': 'c', 'reportEvent': {'tier': 'TIER3', 'genePanel': {'panelName': 'p'}}, 'validated': True}]}]})
+        ]
+
+    @patch('requests.sessions.Session.get')
+    def test_data_frame(self, get):
+        get.side_effect = self._pages()
+        report_events = CvaClient("https://nowhere.invalid", token="xyz").report_events()
+        df = report_events.get_report_events(as_polars=PolarsOutput(batch_size=3))
+        self.assertIsInstance(df, polars.DataFrame)
+        self.assertEqual(['a', 'b', 'c'], df['id'].to_list())
+        self.assertEqual([None, None, 'p'], df['reportEvent'].struct.field('genePanel').struct.field('panelName')
+                         .to_list())
+        self.assertEqual([None, None, True], df['validated'].to_list())
+
+    @patch('requests.sessions.Session.get')
+    def test_spilled_lazy_frame(self, get):
+        get.side_effect = self._pages()
+        report_events = CvaClient("https://nowhere.invalid", token="xyz").report_events()
+        lazy = report_events.get_report_events(as_polars=PolarsOutput(spill_directory=self.folder, batch_size=2))
+        self.assertIsInstance(lazy, polars.LazyFrame)
+        self.assertEqual(2, len(os.listdir(self.folder)))
+        tiers = lazy.group_by(polars.col('reportEvent').struct.field('tier')).len().sort('tier').collect()
+        self.assertEqual([('TIER1', 2), ('TIER3', 1)], tiers.rows())
+
+
+class TestGenomicIntervalIndex(TestCase):
+
+    def test_overlaps_and_nearest(self):
+        small = {'id': 'small', 'variants': [
+            {'assembly': 'GRCh38', 'smallVariantCoordinates': {
+                'assembly': 'GRCh38', 'chromosome': '1', 'position': 100, 'reference': 'ACG', 'alternate': 'A'}},
+            {'assembly': 'GRCh37', 'smallVariantCoordinates': {
+                'assembly': 'GRCh37', 'chromosome': '1', 'position': 90, 'reference': 'ACG', 'alternate': 'A'}}]}
+        structural = {'id': 'structural', 'variants': [
+            {'assembly': 'GRCh38', 'structuralVariantCoordinates': {
+                'assembly': 'GRCh38', 'chromosome': '1', 'start': 150, 'end': 1000}}]}
+        report_event = {'id': 're', 'observedVariants': [{'variant': {'id': 'other', 'variants': [
+            {'assembly': 'GRCh38', 'smallVariantCoordinates': {
+                'assembly': 'GRCh38', 'chromosome': '2', 'position': 50, 'reference': 'T', 'alternate': 'C'}}]}}]}
+        index = GenomicIntervalIndex([small, structural, report_event])
+        self.assertEqual(4, len(index))
+        self.assertEqual([small], index.overlaps('GRCh38', '1', 102))
+        self.assertEqual([], index.overlaps('GRCh38', '1', 103))
+        self.assertEqual([small, structural], index.find('GRCh38:1:101-500'))
+        self.assertEqual([small], index.find('GRCh37:1:92'))
+        self.assertEqual([report_event], index.find('GRCh38:2:50'))
+        self.assertEqual((structural, 0), index.nearest('GRCh38', '1', 999))
+        self.assertEqual((small, 5), index.nearest('GRCh38', '1', 95))
+        self.assertEqual((structural, 10), index.nearest('GRCh38', '1', 1010))
+        self.assertEqual((None, None), index.nearest('GRCh38', 'X', 1))
+        self.assertRaises(ValueError, lambda: index.find('chr1:100'))
+
+
+class TestTokenCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = TokenCache(os.path.join(self.folder, "tokens.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _jwt(expires):
+        claims = base64.urlsafe_b64encode(json.dumps({'exp': expires}).encode("utf-8")).decode("utf-8")
+        return "header.{}.signature".format(claims.rstrip("="))
+
+    @patch('requests.sessions.Session.post')
+    def test_clients_share_token(self, post):
+        post.side_effect = [MockResponse(200, {'response': [{'result': [{'token': self._jwt(time.time() + 600)}]}]}),
+                            MockResponse(200, {'response': [{'result': [{'token': "other"}]}]})]
+        first = CvaClient("https://nowhere.invalid", user='u', password='p', token_cache=self.cache)
+        second = CvaClient("https://nowhere.invalid", user='u', password='p', token_cache=self.cache)
+        self.assertEqual(1, post.call_count)
+        self.assertEqual(first._token, second._token)
+        # another user logs in
+        CvaClient("https://nowhere.invalid", user='v', password='p', token_cache=self.cache)
+        self.assertEqual(2, post.call_count)
+
+    def test_expired_and_rejected_tokens(self):
+        tokens = iter([self._jwt(time.time() + 30), "Bearer a", "Bearer b"])
+        def fetch(): return next(tokens)
+        self.cache.get_token("url", "u", fetch)
+        # expires within the margin
+        self.assertEqual("Bearer a", self.cache.get_token("url", "u", fetch))
+        self.assertEqual("Bearer a", self.cache.get_token("url", "u", fetch, rejected="Bearer other"))
+        self.assertEqual("Bearer b", self.cache.get_token("url", "u", fetch, rejected="Bearer a"))
+        self.assertEqual(0o600, os.stat(self.cache.path).st_mode & 0o777)
+
+
+class TestCheckpoints(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.fail_on_marker = None
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _page(self, url, params=None, **kwargs):
+        marker = int(params.get('marker', 0))
+        if marker == self.fail_on_marker:
+            raise ConnectionError("network blip")
+        headers = {'X-Pagination-Marker': str(marker + 2), 'X-Pagination-Limit': '2'} if marker < 4 else {}
+        results = [{'identifier': str(i)} for i in range(marker, marker + 2)]
+        return MockResponse(200, {'response': [{'result': results}]},
+                            headers=headers)
+
+    @patch('requests.sessions.Session.get')
+    def test_export_resumes_from_checkpoint(self, get):
+        get.side_effect = self._page
+        cases = CvaClient("https://nowhere.invalid", token="xyz", retries=0).cases()
+        output = os.path.join(self.folder, "cases.jsonl")
+        self.fail_on_marker = 4
+        self.assertRaises(ConnectionError, lambda: export_to_file(output, cases.get_cases, program='cancer'))
+        checkpoint = PaginationCheckpoint(output + ".checkpoint")
+        self.assertEqual({'limit': '2', 'marker': '4'}, checkpoint.state['params'])
+        self.assertEqual(4, checkpoint.state['emitted'])
+        self.assertRaises(CvaClientError, lambda: list(cases.get_cases(checkpoint=checkpoint, program='rare')))
+
+        # a partially written page is dropped and the scan continues from the failed page
+        with open(output, "ab") as f:
+            f.write(b'{"identifier": "partial"}\n')
+        self.fail_on_marker = None
+        get.reset_mock()
+        self.assertEqual(6, export_to_file(output, cases.get_cases, program='cancer'))
+        self.assertEqual(1, get.call_count)
+        with open(output) as f:
+            self.assertEqual([str(i) for i in range(6)], [json.loads(l)['identifier'] for l in f])
+        self.assertEqual(6, export_to_file(output, cases.get_cases, program='cancer'))
+        self.assertEqual(1, get.call_count)
+
+    @patch('requests.sessions.Session.get')
+    def test_completed_export_of_another_query(self, get):
+        get.side_effect = self._page
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        output = os.path.join(self.folder, "cases.jsonl")
+        self.assertEqual(6, export_to_file(output, cases.get_cases, program='cancer'))
+        with open(output, "rb") as f:
+            exported = f.read()
+        # the checkpoint of a completed export is checked against the query before the output is touched
+        self.assertRaises(CvaClientError, lambda: export_to_file(output, cases.get_cases, program='rare'))
+        self.assertRaises(CvaClientError,
+                          lambda: export_to_file(output, cases.get_cases, program='cancer', max_results=3))
+        with open(output, "rb") as f:
+            self.assertEqual(exported, f.read())
+
+    @patch('requests.sessions.Session.get')
+    def test_export_of_a_checkpoint_with_no_output(self, get):
+        get.side_effect = self._page
+        cases = CvaClient("https://nowhere.invalid", token="xyz", retries=0).cases()
+        output = os.path.join(self.folder, "cases.jsonl")
+        checkpoint = PaginationCheckpoint(output + ".checkpoint")
+        self.fail_on_marker = 4
+        self.assertRaises(ConnectionError, lambda: list(cases.get_cases(checkpoint=checkpoint, program='cancer')))
+        self.assertIsNone(checkpoint.output_offset)
+        with open(output, "wb") as f:
+            f.write(b'{"identifier": "0"}\n')
+        # resuming would overwrite the output from the start
+        self.fail_on_marker = None
+        self.assertRaises(CvaClientError, lambda: export_to_file(output, cases.get_cases, program='cancer'))
+        with open(output, "rb") as f:
+            self.assertEqual(b'{"identifier": "0"}\n', f.read())
+
+
+class TestTimeouts(TestCase):
+
+    @patch('requests.sessions.Session.get')
+    def test_timeouts(self, get):
+        get.return_value = MockResponse(200, {'response': [{'result': [3]}]})
+        cases = CvaClient("https://nowhere.invalid", token="xyz", timeout=(1, 20)).cases()
+        cases.count()
+        self.assertEqual((1, 20), get.call_args[1]['timeout'])
+        cases.count(timeout=5)
+        self.assertEqual(5, get.call_args[1]['timeout'])
+        cases.get_summary(deadline=10)
+        self.assertTrue(all(0 < t <= 10 for t in get.call_args[1]['timeout']))
+        self.assertNotIn('deadline', get.call_args[1]['params'])
+
+    @patch('requests.sessions.Session.get')
+    def test_deadline_exceeded(self, get):
+        def page(url, params=None, **kwargs):
+            time.sleep(0.05)
+            return MockResponse(200, {'response': [{'result': [{'identifier': '1'}]}]},
+                                headers={'X-Pagination-Marker': '1', 'X-Pagination-Limit': '1'})
+        get.side_effect = page
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        self.assertRaises(CvaTimeoutError, lambda: list(cases.get_cases(deadline=0.2)))
+        self.assertTrue(3 <= get.call_count <= 5)
+
+
+class TestShardedExport(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _cases(url, params=None, **kwargs):
+        return MockResponse(200, {'response': [{'result': [
+            {'identifier': "{}-{}-{}".format(params['program'], params['assembly'], i)} for i in range(3)]}]})
+
+    @patch('requests.sessions.Session.get')
+    def test_sharded_export(self, get):
+        get.side_effect = self._cases
+        cva = CvaClient("https://nowhere.invalid", token="xyz")
+        directory = os.path.join(self.folder, "export")
+        plan = ShardedExport(directory).plan(
+            "cases", [('program', ['cancer', 'rare_disease']), ('assembly', ['GRCh37', 'GRCh38'])],
+            hasClinicalData=True)
+        self.assertEqual(4, len(plan['shards']))
+        self.assertRaises(CvaClientError, lambda: ShardedExport(directory).plan("cases", [('program', ['cancer'])]))
+
+        first, second = ShardedExport(directory, node="first"), ShardedExport(directory, node="second")
+        self.assertTrue(first._claim('shard-00001'))
+        self.assertRaises(CvaClientError, lambda: first.merge(os.path.join(self.folder, "cases.jsonl")))
+        self.assertEqual(['shard-00000', 'shard-00002', 'shard-00003'], second.run(cva, threads=2))
+        self.assertEqual(['shard-00001'], second.status()['claimed'])
+        # an expired claim is taken over
+        self.assertEqual(['shard-00001'], ShardedExport(directory, claim_timeout=0).run(cva))
+
+        output = os.path.join(self.folder, "cases.jsonl")
+        self.assertEqual(12, ShardedExport(directory).merge(output))
+        with open(output) as f:
+            identifiers = [json.loads(l)['identifier'] for l in f]
+        self.assertEqual(["cancer-GRCh37-0", "cancer-GRCh37-1"], identifiers[:2])
+        self.assertEqual("rare_disease-GRCh38-2", identifiers[-1])
+        self.assertTrue(all(c[1]['params']['hasClinicalData'] for c in get.call_args_list))
+
+    @patch('requests.sessions.Session.get')
+    def test_failed_and_left_behind_claims(self, get):
+        get.side_effect = ConnectionError("no network")
+        cva = CvaClient("https://nowhere.invalid", token="xyz", retries=0)
+        directory = os.path.join(self.folder, "export")
+        export = ShardedExport(directory, node="node")
+        export.plan("cases", [('program', ['cancer', 'rare_disease'])])
+        self.assertRaises(ConnectionError, lambda: export.run(cva))
+        # the failed shard is released
+        self.assertEqual([], export.status()['claimed'])
+
+        # a claim left behind by a node that died is only claimed back by the same node
+        with open(os.path.join(directory, "shard-00000.claim"), "w") as f:
+            f.write("node 1234")
+        self.assertIsNone(ShardedExport(directory, node="other")._claim('shard-00000'))
+        self.assertIsNotNone(export._claim('shard-00000'))
+        # but not while one of its threads holds it
+        self.assertIsNone(export._claim('shard-00000'))
+
+    def test_refreshed_claim_is_not_taken_over(self):
+        directory = os.path.join(self.folder, "export")
+        owner = ShardedExport(directory, node="owner", claim_timeout=60)
+        owner.plan("cases", [('program', ['cancer'])])
+        token = owner._claim('shard-00000')
+        claim = os.path.join(directory, "shard-00000.claim")
+        other = ShardedExport(directory, node="other", claim_timeout=60)
+        # the claim would have expired but the owner refreshed it
+        os.utime(claim, (time.time() - 120, time.time() - 120))
+        self.assertTrue(owner._refresh('shard-00000', token))
+        self.assertIsNone(other._claim('shard-00000'))
+        # the claim expired and it is taken over, the owner finds out on its next refresh
+        os.utime(claim, (time.time() - 120, time.time() - 120))
+        self.assertIsNotNone(other._claim('shard-00000'))
+        self.assertFalse(owner._refresh('shard-00000', token))
+        heartbeat = sharded_export._Heartbeat(ShardedExport(directory, node="owner"), 'shard-00000', token)
+        heartbeat.lost = True
+        self.assertRaises(CvaClientError, lambda: list(heartbeat.guard([1])))
+
+
+class TestCli(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_parse_params(self):
+        self.assertEqual({'program': 'cancer', 'genes': ['BRCA1', 'BRCA2'], 'hasClinicalData': True},
+                         cli.parse_params(["program=cancer", "genes=BRCA1", "genes=BRCA2", "hasClinicalData=true"]))
+        self.assertRaises(ValueError, lambda: cli.parse_params(["program"]))
+
+    @patch('requests.sessions.Session.get')
+    def test_export(self, get):
+        get.return_value = MockResponse(200, {'response': [{'result': [{'id': "re-{}".format(i)} for i in range(3)]}]})
+        output = os.path.join(self.folder, "report_events.jsonl")
+        self.assertEqual(0, cli.main(["--url", "https://nowhere.invalid", "--token", "xyz", "--rate-limit", "100",
+                                      "export", "report_events", output, "--param", "program=cancer"]))
+        self.assertEqual('cancer', get.call_args[1]['params']['program'])
+        with open(output) as f:
+            self.assertEqual(["re-0", "re-1", "re-2"], [json.loads(l)['id'] for l in f])
+
+
+class TestEvidences(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def _page(url, params=None, **kwargs):
+        marker = int(params.get('marker', 0))
+        headers = {'X-Pagination-Marker': str(marker + 2), 'X-Pagination-Limit': '2'} if marker < 8 else {}
+        return MockResponse(200, {'response': [{'result': [{'id': i} for i in range(marker, marker + 2)]}]},
+                            headers=headers)
+
+    @patch('requests.sessions.Session.get')
+    def test_stream_evidences(self, get):
+        get.side_effect = self._page
+        evidences = CvaClient("https://nowhere.invalid", token="xyz").evidences()
+        self.assertEqual([0, 1, 2], [e['id'] for e in evidences.get_evidences(
+            "clinvar", max_results=3, include_models=False, prefetch=2)])
+        self.assertEqual(3, len(list(evidences.get_evidences("clinvar", max=3, include_models=False))))
+        get.reset_mock()
+        self.assertEqual(5, len(list(evidences.get_evidences("clinvar", max_results=5, max=3, include_models=False))))
+        self.assertTrue(all('max' not in c[1]['params'] for c in get.call_args_list))
+        output = os.path.join(self.folder, "clinvar.jsonl")
+        self.assertEqual(10, evidences.export_evidences("clinvar", output, prefetch=3))
+        with open(output) as f:
+            self.assertEqual(list(range(10)), [json.loads(l)['id'] for l in f])
+
+    @patch('requests.sessions.Session.post')
+    def test_load_evidences(self, post):
+        post.side_effect = lambda url, json=None, **kwargs: MockResponse(
+            500 if json['id'] == 3 else 200, {'response': [{'result': [{'id': json['id']}]}]})
+        path = os.path.join(self.folder, "evidences.jsonl")
+        with open(path, "w") as f:
+            f.write("\n".join(json.dumps({'id': i}) for i in range(5)) + "\n")
+        evidences = CvaClient("https://nowhere.invalid", token="xyz", threads=2).evidences()
+        self.assertEqual({'posted': 4, 'failed': 1}, evidences.load_evidences([path], batch_size=2))
+        self.assertEqual(5, post.call_count)
+        self.assertEqual({'posted': 0, 'failed': 5}, evidences.load_evidences(path, validate=True))
+        self.assertEqual(5, post.call_count)
+
+
+class TestPageSize(TestCase):
+
+    def setUp(self):
+        self.limits = []
+
+    def _page(self, url, params=None, **kwargs):
+        self.limits.append(params.get('limit'))
+        marker = int(params.get('marker', 0))
+        limit = int(params.get('limit', 50))
+        results = [{'identifier': str(i), 'version': 1} for i in range(marker, marker + limit)]
+        return MockResponse(200, {'response': [{'result': results}]},
+                            headers={'X-Pagination-Marker': str(marker + limit), 'X-Pagination-Limit': str(limit)})
+
+    @patch('requests.sessions.Session.get')
+    def test_max_results_sets_limit(self, get):
+        get.side_effect = self._page
+        cases = CvaClient("https://nowhere.invalid", token="xyz").cases()
+        self.assertEqual(10, len(list(cases.get_cases(max_results=10))))
+        self.assertEqual([10], self.limits)
+        self.limits = []
+        self.assertEqual(5, len(list(cases.get_cases(max_results=5, page_size=2))))
+        self.assertEqual([2, 2, 1], self.limits)
+        self.limits = []
+        self.assertEqual(120, len(list(cases.get_cases_ids(max_results=120))))
+        self.assertEqual([None, 50, 20], self.limits)
+
+    @patch('requests.sessions.Session.get')
+    def test_adaptive_page_size(self, get):
+        get.side_effect = self._page
+        registry = MetricsRegistry()
+        cases = CvaClient("https://nowhere.invalid", token="xyz", metrics_registry=registry).cases()
+        page_size = AdaptivePageSize(target_bytes=10 ** 6, initial_size=10, max_size=35)
+        self.assertEqual(100, len(list(cases.get_cases_ids(max_results=100, page_size=page_size))))
+        # small responses grow up to the maximum size
+        self.assertEqual([10, 20, 35, 35], self.limits)
+        self.assertEqual(4, registry.get("pyark_page_size", endpoint="cases"))
+
+    def test_adaptive_page_size_update(self):
+        page_size = AdaptivePageSize(target_seconds=1.0, min_size=10, max_size=1000, initial_size=100)
+        self.assertEqual(200, page_size.update(100, 0.1, 0))
+        self.assertEqual(150, page_size.update(200, 1.333333, 0))
+        self.assertEqual(75, page_size.update(150, 10.0, 0))
+        both = AdaptivePageSize(target_seconds=1.0, target_bytes=1000, initial_size=100)
+        self.assertEqual(50, both.update(100, 0.5, 2000))
+
+
 class MockResponse:
-    def __init__(self, status_code, json_dict):
+    def __init__(self, status_code, json_dict, headers=None):
         self.status_code = status_code
         self.json_dict = json_dict
-        self.content = str(json_dict)
-        self.text = str(json_dict)
-        self.headers = {}
+        self.content = json.dumps(json_dict)
+        self.text = json.dumps(json_dict)
+        self.headers = headers if headers is not None else {}
 
     @staticmethod
     def get(key, default):
@@ -0,0 +1,61 @@
+import time
+
+from pyark.errors import CvaTimeoutError
+
+
+# seconds to establish a connection and seconds between bytes received from the server
+DEFAULT_CONNECT_TIMEOUT = 30
+DEFAULT_READ_TIMEOUT = 600
+DEFAULT_TIMEOUT = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+
+
+class Deadline(object):
+    """
+    An overall time budget for an operation made of many requests (eg: a paginated query). Every request is sent
+    with its timeouts capped to the time left and no request is sent once the deadline has passed. The deadline
+    is an absolute wall clock time so it can be shared by threads and processes.
+
+    :param seconds: the time budget from now
+    :type seconds: float
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    @staticmethod
+    def of(deadline):
+        """
+        :param deadline: a number of seconds, a deadline or None
+        :rtype: Deadline
+        """
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return Deadline(float(deadline))
+
+    def remaining(self):
+        """
+        :return: the seconds left, never negative
+        :rtype: float
+        """
+        return max(0.0, self.expires - time.time())
+
+    def check(self, request=None):
+        """
+        :raises CvaTimeoutError: if the deadline has passed
+        """
+        if self.remaining() <= 0:
+            raise CvaTimeoutError("Deadline of {} seconds exceeded{}".format(
+                self.seconds, " before {}".format(request) if request else ""))
+
+    def cap(self, timeout):
+        """
+        :param timeout: a timeout in seconds or a pair of connect and read timeouts as accepted by requests
+        :return: the timeout with no value over the time left
+        """
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, (tuple, list)):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
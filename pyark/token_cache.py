@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, the cache works with no lock
+    fcntl = None
+
+
+class TokenCache(object):
+    """
+    Shares the authentication tokens of the clients logging in with user and password through a file, so that
+    many processes starting at once on a node log in once instead of flooding the authentication endpoint, eg:
+
+        cva = CvaClient(url, user=user, password=password, token_cache=True)
+
+    Tokens are keyed by the URL and the user, the password is never stored. The file is locked while a token is
+    read or fetched, so a process needing a token waits for the one logging in and then reuses its token.
+    A token is valid until the expiry in its JWT `exp` claim, or for `max_age` seconds when it has none, minus
+    the `margin`. A token rejected by the server is replaced by a new one unless another process replaced it.
+    NOTE: the file holds valid tokens, it is only readable by its owner.
+
+    :param path: the file holding the tokens, by default `~/.pyark/tokens.json`
+    :type path: str
+    :param max_age: seconds a token with no expiry is reused
+    :type max_age: float
+    :param margin: seconds before the expiry a token is no longer reused
+    :type margin: float
+    """
+
+    def __init__(self, path=None, max_age=3600, margin=60):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".pyark", "tokens.json")
+        self.max_age = max_age
+        self.margin = margin
+
+    def get_token(self, url_base, user, fetch, rejected=None):
+        """
+        :param url_base: the CVA URL
+        :type url_base: str
+        :type user: str
+        :param fetch: logs in and returns a new token
+        :type fetch: function
+        :param rejected: the token the server just rejected, it is not reused
+        :type rejected: str
+        :return: a valid token
+        :rtype: str
+        """
+        key = self._build_key(url_base, user)
+        with self._locked():
+            tokens = self._load()
+            cached = tokens.get(key)
+            if cached and cached['token'] != rejected and cached['expires'] - self.margin > time.time():
+                logging.debug("Reusing the cached token of user {}".format(user))
+                return cached['token']
+            token = fetch()
+            tokens[key] = {'token': token, 'expires': self._expiry(token)}
+            # drops the tokens of other users that expired
+            now = time.time()
+            self._save(dict((k, v) for k, v in tokens.items() if v['expires'] > now))
+            return token
+
+    def clear(self):
+        """
+        Deletes all cached tokens
+        """
+        with self._locked():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    @staticmethod
+    def _build_key(url_base, user):
+        return hashlib.sha1("{} {}".format(url_base, user).encode("utf-8")).hexdigest()
+
+    def _expiry(self, token):
+        """
+        :return: the expiry in the exp claim of a JWT or max_age seconds from now
+        :rtype: float
+        """
+        try:
+            payload = token.replace("Bearer ", "").split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(str(payload + "=" * (-len(payload) % 4))).decode("utf-8"))
+            return float(claims['exp'])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return time.time() + self.max_age
+
+    @contextmanager
+    def _locked(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            try:
+                os.makedirs(folder, 0o700)
+            except OSError:
+                # created by another process
+                if not os.path.isdir(folder):
+                    raise
+        with io.open("{}.lock".format(self.path), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with io.open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning("Ignoring the corrupt token cache {}".format(self.path))
+            return {}
+
+    def _save(self, tokens):
+        temporary = "{}.{}.tmp".format(self.path, os.getpid())
+        # only the owner can read the tokens
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with io.open(descriptor, "w", encoding="utf-8") as f:
+            f.write(type(u"")(json.dumps(tokens, sort_keys=True)))
+        # python 2 has no os.replace, the lock serialises the writers anyway
+        getattr(os, "replace", os.rename)(temporary, self.path)
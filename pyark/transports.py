@@ -0,0 +1,288 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import requests
+from pyark.errors import CvaClientError
+# httpx is imported on first use as it is only needed by the HTTP/2 transport
+from pyark.lazy_import import httpx
+
+
+class RequestsTransport(object):
+    """
+    Sends requests over HTTP/1.1 with the requests library, this is the default transport.
+    """
+
+    def __init__(self, session=None):
+        self._session = session if session is not None else requests.Session()
+
+    def send(self, method, url, session=True, **kwargs):
+        """
+        :param method: the HTTP verb
+        :type method: str
+        :param url: the full URL
+        :type url: str
+        :param session: use the persistent session or a new connection
+        :type session: bool
+        :param kwargs: any other parameter accepted by requests (ie: params, json, headers)
+        :return: a response with status_code, headers, content, text and json()
+        :rtype: requests.Response
+        """
+        sender = self._session if session else requests
+        return getattr(sender, method.lower())(url, **kwargs)
+
+
+class Http2Transport(object):
+    """
+    Sends requests over HTTP/2 with httpx, concurrent requests are multiplexed as streams over a few
+    connections instead of opening one connection per thread, eg:
+
+        cva = CvaClient(url, token=token, threads=32, transport=Http2Transport())
+
+    HTTP/2 is negotiated on https URLs and servers not supporting it are spoken to in HTTP/1.1. Cleartext
+    http URLs are only spoken to in HTTP/2 with `prior_knowledge`. Timeouts and connection errors are raised
+    as their requests counterparts so retries and deadlines work as with the default transport.
+    Requires `pip install clinical-variant-ark[http2]`.
+
+    :param max_connections: the maximum number of connections to every host
+    :type max_connections: int
+    :param prior_knowledge: speaks HTTP/2 with no negotiation, the server must support it
+    :type prior_knowledge: bool
+    :param verify: verifies the TLS certificates
+    :type verify: bool
+    """
+
+    def __init__(self, max_connections=4, prior_knowledge=False, verify=True):
+        self._client_params = {
+            'http1': not prior_knowledge,
+            'http2': True,
+            'verify': verify,
+            'limits': httpx.Limits(max_connections=max_connections)
+        }
+        self._client = httpx.Client(**self._client_params)
+
+    def send(self, method, url, session=True, params=None, timeout=None, **kwargs):
+        """
+        :param method: the HTTP verb
+        :type method: str
+        :param url: the full URL
+        :type url: str
+        :param session: use the persistent connections or a new connection
+        :type session: bool
+        :param params: the query parameters, lists are sent as repeated parameters
+        :type params: dict
+        :param timeout: seconds or a pair of connect and read timeouts in seconds, None waits forever
+        :param kwargs: any other parameter accepted by httpx (ie: json, headers)
+        :return: a response with status_code, headers, content, text and json()
+        :rtype: Http2Response
+        """
+        kwargs.update(params=self._encode_params(params), timeout=self._build_timeout(timeout))
+        try:
+            if session:
+                return Http2Response(self._client.request(method, url, **kwargs))
+            with httpx.Client(**self._client_params) as client:
+                return Http2Response(client.request(method, url, **kwargs))
+        except httpx.ConnectTimeout as ex:
+            raise requests.exceptions.ConnectTimeout(str(ex))
+        except httpx.TimeoutException as ex:
+            raise requests.exceptions.ReadTimeout(str(ex))
+        except httpx.TransportError as ex:
+            raise requests.exceptions.ConnectionError(str(ex))
+
+    def close(self):
+        self._client.close()
+
+    @staticmethod
+    def _encode_params(params):
+        # encodes values as requests does, eg: True is sent as True and not as true, None values are dropped
+        encoded = []
+        for k, v in (params or {}).items():
+            for e in (v if isinstance(v, (list, tuple)) else [v]):
+                if e is not None:
+                    encoded.append((k, e if isinstance(e, (str, type(u""))) else str(e)))
+        return encoded
+
+    @staticmethod
+    def _build_timeout(timeout):
+        if isinstance(timeout, (list, tuple)):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(timeout)
+
+
+class Http2Response(object):
+    """
+    An httpx response exposing the parts of requests.Response used by the clients
+    """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.content
+        self.http_version = response.http_version
+        self.request = _SentRequest(response.request.content)
+        self._response = response
+
+    @property
+    def text(self):
+        return self._response.text
+
+    def json(self):
+        return self._response.json()
+
+
+class _SentRequest(object):
+
+    def __init__(self, body):
+        self.body = body
+
+
+class ArchivedResponse(object):
+    """
+    A response replayed from an archive, it mimics the parts of requests.Response used by the clients.
+    """
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.request = None
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class RecordReplayTransport(object):
+    """
+    Records request and response pairs into a local gzipped archive and replays them with no network at all.
+    Requests are keyed by method, URL, query parameters and a hash of the payload, so credentials in a payload
+    are never stored in clear. NOTE: the archive stores the responses as they are, including the authentication
+    token if the client logs in with user and password.
+
+    :param path: the archive file, it is created if it does not exist
+    :param mode: `record` sends every request and stores the response, `replay` never touches the network and
+    fails on requests not in the archive, `auto` replays archived requests and records the rest
+    :param transport: the transport used to send requests not replayed
+    """
+
+    RECORD = "record"
+    REPLAY = "replay"
+    AUTO = "auto"
+
+    def __init__(self, path, mode=AUTO, transport=None):
+        if mode not in (self.RECORD, self.REPLAY, self.AUTO):
+            raise ValueError("Unknown record and replay mode '{}'".format(mode))
+        self._path = path
+        self._mode = mode
+        self._transport = transport if transport is not None else RequestsTransport()
+        self._lock = threading.Lock()
+        self._archive = self._load(path)
+
+    def __len__(self):
+        return len(self._archive)
+
+    def send(self, method, url, session=True, **kwargs):
+        key = self.build_key(method, url, kwargs.get('params'), kwargs.get('json'))
+        if self._mode != self.RECORD:
+            with self._lock:
+                archived = self._archive.get(key)
+            if archived is not None:
+                return ArchivedResponse(archived['status'], archived['headers'], archived['body'])
+            if self._mode == self.REPLAY:
+                raise CvaClientError("No archived response in {} for {}".format(self._path, key))
+        response = self._transport.send(method, url, session=session, **kwargs)
+        # only successful responses and the 404 of empty results are archived, errors such as the 401 of an expired
+        # token or a server error would be replayed forever instead of being retried
+        if 200 <= response.status_code < 300 or response.status_code == 404:
+            self._store(key, response)
+        return response
+
+    @staticmethod
+    def build_key(method, url, params=None, payload=None):
+        """
+        :rtype: str
+        """
+        flattened = []
+        for k, v in (params or {}).items():
+            for e in (v if isinstance(v, (list, tuple)) else [v]):
+                flattened.append("{}={}".format(k, e))
+        key = "{} {}?{}".format(method.upper(), url, "&".join(sorted(flattened)))
+        if payload is not None:
+            key += "#" + hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        return key
+
+    def _store(self, key, response):
+        record = {
+            'key': key,
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'body': response.text
+        }
+        with self._lock:
+            self._archive[key] = record
+            # gzip members can be appended and are read back as a single stream
+            with gzip.open(self._path, "ab") as f:
+                f.write((json.dumps(record) + "\n").encode("utf-8"))
+
+    def compact(self):
+        """
+        Rewrites the archive keeping only the latest recording of every request
+        """
+        with self._lock:
+            # an interrupted compaction leaves the archive as it was
+            temporary = "{}.tmp".format(self._path)
+            with gzip.open(temporary, "wb") as f:
+                for record in self._archive.values():
+                    f.write((json.dumps(record) + "\n").encode("utf-8"))
+            # python 2 only has an atomic rename on posix
+            getattr(os, "replace", os.rename)(temporary, self._path)
+
+    @staticmethod
+    def _load(path):
+        archive = {}
+        if os.path.exists(path):
+            with gzip.open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line.decode("utf-8"))
+                        # the latest recording of a request wins
+                        archive[record['key']] = record
+            logging.info("Loaded {} archived responses from {}".format(len(archive), path))
+        return archive
+
+
+class RateLimitedTransport(object):
+    """
+    Spaces out the requests sent through another transport to a maximum rate shared by all threads.
+
+    :param transport: the transport sending the requests
+    :param requests_per_second: the maximum rate of requests
+    :type requests_per_second: float
+    """
+
+    def __init__(self, transport, requests_per_second):
+        if requests_per_second <= 0:
+            raise ValueError("The rate of requests must be positive")
+        self._transport = transport
+        self._interval = 1.0 / requests_per_second
+        self._lock = threading.Lock()
+        self._next_slot = time.time()
+
+    def send(self, method, url, session=True, **kwargs):
+        self.acquire()
+        return self._transport.send(method, url, session=session, **kwargs)
+
+    def acquire(self):
+        """
+        Blocks until the next request can be sent
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
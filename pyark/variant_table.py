@@ -0,0 +1,179 @@
+from array import array
+
+from pyark.lazy_import import cva_models, pandas as pd, numpy as np
+
+
+def max_allele_frequency(annotation):
+    """
+    :param annotation: the annotation of a variant representation as a dictionary
+    :type annotation: dict
+    :return: the maximum alternate allele frequency across all studies and populations
+    :rtype: float
+    """
+    frequencies = [f.get('altAlleleFreq') for f in annotation.get('populationFrequencies') or []]
+    frequencies = [f for f in frequencies if f is not None]
+    return max(frequencies) if frequencies else 0.0
+
+
+class _StringPool(object):
+    """
+    Interns repeated strings storing a single copy of each distinct value
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class VariantTable(object):
+    """
+    A compact columnar representation of small variants for holding millions of variants in memory.
+    Chromosomes and assemblies are stored as categorical codes, positions in an integer array, reference and
+    alternate alleles as codes into interned string pools and the selected annotation fields as typed columns.
+    It is built incrementally from the output of `get_variants` or, faster, with `VariantsClient.get_variant_table`
+    that skips building a model per variant. Structural variants are skipped.
+
+    :param annotation_fields: typed columns extracted from the annotation as a dictionary of column name to a
+    pair of array type code (eg: 'f', 'i') and a function of the annotation dictionary, eg:
+    {'max_af': ('f', max_allele_frequency)}
+    :type annotation_fields: dict
+    :param assemblies: the assemblies in order of preference to choose a representation of every variant
+    :type assemblies: list
+    """
+
+    def __init__(self, annotation_fields=None, assemblies=("GRCh38", "GRCh37")):
+        self._assemblies = list(assemblies)
+        self._assembly_pool = _StringPool()
+        self._chromosome_pool = _StringPool()
+        self._allele_pool = _StringPool()
+        self._assembly_codes = array('B')
+        self._chromosome_codes = array('H')
+        self._positions = array('I')
+        self._references = array('I')
+        self._alternates = array('I')
+        self._annotation_fields = annotation_fields if annotation_fields is not None else {
+            'max_allele_frequency': ('f', max_allele_frequency)}
+        self._annotations = dict((name, array(type_code)) for name, (type_code, _) in self._annotation_fields.items())
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        return self.get_coordinates(index)
+
+    def extend(self, variants):
+        """
+        :param variants: variants as dictionaries or models (eg: VariantWrapper)
+        :type variants: iterable
+        """
+        for variant in variants:
+            self.add(variant)
+
+    def add(self, variant):
+        """
+        :param variant: a variant as a dictionary or a model (eg: VariantWrapper)
+        :return: whether the variant was added, structural variants are not
+        :rtype: bool
+        """
+        if not isinstance(variant, dict):
+            variant = variant.toJsonDict()
+        representation = self._choose_representation(variant.get('variants') or [])
+        coordinates = representation.get('smallVariantCoordinates') if representation else None
+        if not coordinates:
+            self.skipped += 1
+            return False
+        self._assembly_codes.append(self._assembly_pool.code(coordinates['assembly']))
+        self._chromosome_codes.append(self._chromosome_pool.code(coordinates['chromosome']))
+        self._positions.append(int(coordinates['position']))
+        self._references.append(self._allele_pool.code(coordinates['reference']))
+        self._alternates.append(self._allele_pool.code(coordinates['alternate']))
+        annotation = representation.get('annotation') or {}
+        for name, (type_code, extractor) in self._annotation_fields.items():
+            value = extractor(annotation)
+            self._annotations[name].append(value if value is not None else self._missing(type_code))
+        return True
+
+    def get_coordinates(self, index):
+        """
+        :type index: int
+        :rtype: VariantCoordinates
+        """
+        return cva_models.VariantCoordinates(
+            assembly=self._assembly_pool.values[self._assembly_codes[index]],
+            chromosome=self._chromosome_pool.values[self._chromosome_codes[index]],
+            position=self._positions[index],
+            reference=self._allele_pool.values[self._references[index]],
+            alternate=self._allele_pool.values[self._alternates[index]])
+
+    def get_variant_id(self, index):
+        """
+        :type index: int
+        :return: the variant identifier as in {assembly}:{chromosome}:{position}:{reference}:{alternate}
+        :rtype: str
+        """
+        return "{}:{}:{}:{}:{}".format(
+            self._assembly_pool.values[self._assembly_codes[index]],
+            self._chromosome_pool.values[self._chromosome_codes[index]],
+            self._positions[index],
+            self._allele_pool.values[self._references[index]],
+            self._allele_pool.values[self._alternates[index]])
+
+    def get_annotation(self, name, index):
+        """
+        :type name: str
+        :type index: int
+        """
+        return self._annotations[name][index]
+
+    @property
+    def nbytes(self):
+        """
+        :return: the size of the columns in bytes, not including the string pools
+        :rtype: int
+        """
+        columns = [self._assembly_codes, self._chromosome_codes, self._positions, self._references,
+                   self._alternates] + list(self._annotations.values())
+        return sum(c.itemsize * len(c) for c in columns)
+
+    def to_data_frame(self):
+        """
+        :return: a data frame with categorical assembly and chromosome columns
+        :rtype: pd.DataFrame
+        """
+        alleles = np.array(self._allele_pool.values, dtype=object)
+        columns = {
+            'assembly': pd.Categorical.from_codes(
+                np.array(self._assembly_codes, dtype=np.int16), self._assembly_pool.values),
+            'chromosome': pd.Categorical.from_codes(
+                np.array(self._chromosome_codes, dtype=np.int32), self._chromosome_pool.values),
+            'position': np.array(self._positions),
+            'reference': alleles[np.array(self._references, dtype=np.int64)],
+            'alternate': alleles[np.array(self._alternates, dtype=np.int64)]
+        }
+        for name, values in self._annotations.items():
+            columns[name] = np.array(values)
+        return pd.DataFrame(columns, columns=['assembly', 'chromosome', 'position', 'reference', 'alternate'] +
+                            list(self._annotations.keys()))
+
+    def _choose_representation(self, representations):
+        by_assembly = dict((r.get('assembly'), r) for r in representations)
+        for assembly in self._assemblies:
+            if assembly in by_assembly:
+                return by_assembly[assembly]
+        return None
+
+    @staticmethod
+    def _missing(type_code):
+        return float('nan') if type_code in ('f', 'd') else 0
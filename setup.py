@@ -1,6 +1,5 @@
 import os
-from distutils.core import setup
-from setuptools import find_packages
+from setuptools import setup, find_packages
 import pyark
 
 
@@ -15,6 +14,9 @@ setup(
     description='A Python client for the Clinical Variant Ark',
     packages=find_packages(),
     scripts=[],
+    entry_points={
+        'console_scripts': ['pyark=pyark.cli:main']
+    },
     url='https://github.com/genomicsengland/pyark',
     download_url="https://github.com/genomicsengland/pyark/archive/v{}.tar.gz".format(pyark.VERSION),
     license='Apache',
@@ -28,7 +30,8 @@ setup(
         'future==0.17.1'
     ],
     tests_require=test_deps,
-    extras_require={'test': test_deps, 'pandas': ['pandas==0.24.2']},
+    extras_require={'test': test_deps, 'pandas': ['pandas==0.24.2'], 'parquet': ['pandas==0.24.2', 'pyarrow'],
+                    'http2': ['httpx[http2]'], 'polars': ['polars', 'pyarrow']},
     keywords=['CVA', 'pyark', 'clinical variant ark', 'Genomics England'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',      # Chose either "3 - Alpha", "4 - Beta" or "5 - Production/Stable" as the current state of your package